@@ -0,0 +1,162 @@
+from typing import Optional, Union
+import numpy as np
+import pandas as pd
+from sqlalchemy import MetaData
+from etl_project.assets.assets import define_stock_bars_table, load
+from etl_project.connectors.postgresql import PostgreSqlClient
+from etl_project.connectors.response_cache import MARKET_TIMEZONE
+
+# Alpaca timeframe -> pandas frequency of the buckets bars are aggregated into
+TIMEFRAME_FREQUENCIES = {
+    "1Min": "1min",
+    "5Min": "5min",
+    "15Min": "15min",
+    "30Min": "30min",
+    "1Hour": "1H",
+    "4Hour": "4H",
+    "1Day": "1D",
+}
+
+
+def table_name_for_timeframe(source_table_name: str, timeframe: str, base_timeframe: Optional[str] = None) -> str:
+    """
+    Returns the table holding the bars of `timeframe`: the source table for the extracted
+    timeframe, `<source_table_name>_<timeframe>` e.g. stock_bars_5min for the derived ones.
+    """
+    if timeframe == base_timeframe:
+        return source_table_name
+    return f"{source_table_name}_{timeframe.lower()}"
+
+
+def validate_derived_timeframes(base_timeframe: str, derived_timeframes: list[str]) -> None:
+    for timeframe in [base_timeframe, *derived_timeframes]:
+        if timeframe not in TIMEFRAME_FREQUENCIES:
+            raise Exception(f"Unsupported timeframe {timeframe}, please use one of: {list(TIMEFRAME_FREQUENCIES)}")
+    base_frequency = pd.Timedelta(TIMEFRAME_FREQUENCIES[base_timeframe])
+    for timeframe in derived_timeframes:
+        if pd.Timedelta(TIMEFRAME_FREQUENCIES[timeframe]) <= base_frequency:
+            raise Exception(f"Derived timeframe {timeframe} must be coarser than the extracted timeframe {base_timeframe}")
+
+
+def bucket_start(timestamps: pd.Series, timeframe: str) -> pd.Series:
+    """
+    Floors UTC timestamps to the start of their bucket. Daily buckets are trading days in
+    America/New_York, like the 1Day bars of the API, intraday buckets are aligned on UTC.
+    """
+    if timeframe == "1Day":
+        return timestamps.dt.tz_convert(MARKET_TIMEZONE).dt.floor("D").dt.tz_convert("UTC")
+    return timestamps.dt.floor(TIMEFRAME_FREQUENCIES[timeframe])
+
+
+def aggregate_bars(df_stock: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    """
+    Resamples bars into a coarser timeframe: open of the first bar, high and low of all bars,
+    close of the last bar, summed volume and trades, and the VWAP weighted by the volume of each bar.
+
+    Args:
+        df_stock: bars in the layout `initial_transform` returns
+        timeframe: target timeframe, one of TIMEFRAME_FREQUENCIES
+
+    Returns:
+        The aggregated bars in the same layout, one row per stock and bucket
+    """
+    columns = list(df_stock.columns)
+    if df_stock.empty:
+        return df_stock.copy()
+
+    df = df_stock.sort_values(["stock", "timestamp"], kind="stable")
+    df = df.assign(
+        timestamp=bucket_start(df["timestamp"], timeframe),
+        price_volume=df["volume_weighted_avg_price"] * df["volume"],
+    )
+    df_aggregated = df.groupby(["stock", "timestamp"], sort=True).agg(
+        company=("company", "first"),
+        open=("open", "first"),
+        high=("high", "max"),
+        low=("low", "min"),
+        close=("close", "last"),
+        volume=("volume", "sum"),
+        price_volume=("price_volume", "sum"),
+        mean_vwap=("volume_weighted_avg_price", "mean"),
+        number_of_trades=("number_of_trades", "sum"),
+    ).reset_index()
+
+    # Buckets without volume have no weights, fall back to the plain mean
+    volume = df_aggregated["volume"].to_numpy(dtype="float64")
+    df_aggregated["volume_weighted_avg_price"] = np.where(
+        volume > 0,
+        df_aggregated["price_volume"].to_numpy() / np.where(volume > 0, volume, 1),
+        df_aggregated["mean_vwap"].to_numpy(),
+    )
+    return df_aggregated[columns]
+
+
+def read_bars(postgresql_client: PostgreSqlClient, source_table_name: str, since: Optional[str] = None) -> pd.DataFrame:
+    """
+    Reads the bars of the source table from `since` (included), the whole table when None.
+    """
+    sql = f"select * from {source_table_name}"
+    params = None
+    if since is not None:
+        sql += " where timestamp >= %s"
+        params = (since,)
+    df = pd.read_sql(sql + " order by stock, timestamp", postgresql_client.engine, params=params)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    return df
+
+
+def refresh_derived_timeframes(
+        postgresql_client: PostgreSqlClient,
+        source_table_name: str,
+        base_timeframe: str,
+        derived_timeframes: list[str],
+        since: Optional[Union[str, pd.Timestamp]] = None,
+        load_method: str = "bulk_upsert"
+    ) -> dict[str, int]:
+    """
+    Aggregates the bars of the source table into the table of every derived timeframe.
+
+    The buckets are recomputed from the start of the bucket holding `since`, so a bucket loaded
+    partially by an earlier run is completed rather than overwritten with the new bars only.
+
+    Args:
+        postgresql_client: postgresql client
+        source_table_name: table of the extracted `base_timeframe` bars
+        base_timeframe: timeframe of the source table e.g. 1Min
+        derived_timeframes: timeframes to derive e.g. [5Min, 1Hour, 1Day]
+        since: earliest bar loaded by the run, all the bars when None
+        load_method: upsert or bulk_upsert
+
+    Returns:
+        The number of aggregated rows loaded per derived table
+    """
+    validate_derived_timeframes(base_timeframe, derived_timeframes)
+    if not derived_timeframes:
+        return {}
+
+    bucket_starts = {}
+    if since is not None:
+        since = pd.Timestamp(since)
+        since = since.tz_localize("UTC") if since.tzinfo is None else since.tz_convert("UTC")
+        bucket_starts = {
+            timeframe: bucket_start(pd.Series([since]), timeframe).iloc[0] for timeframe in derived_timeframes
+        }
+    df_stock = read_bars(
+        postgresql_client,
+        source_table_name,
+        since=min(bucket_starts.values()).isoformat() if bucket_starts else None
+    )
+
+    rows_loaded = {}
+    for timeframe in derived_timeframes:
+        df_timeframe = df_stock
+        if timeframe in bucket_starts:
+            df_timeframe = df_stock[df_stock["timestamp"] >= bucket_starts[timeframe]]
+        df_aggregated = aggregate_bars(df_timeframe, timeframe)
+
+        metadata = MetaData()
+        table = define_stock_bars_table(metadata, table_name_for_timeframe(source_table_name, timeframe, base_timeframe))
+        if not df_aggregated.empty:
+            load(df=df_aggregated, postgresql_client=postgresql_client, table=table, metadata=metadata, load_method=load_method)
+        rows_loaded[table.name] = len(df_aggregated)
+    return rows_loaded
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+
+def round_half_away_from_zero(values: np.ndarray, decimals: int) -> np.ndarray:
+    """
+    Rounds like PostgreSQL ROUND(numeric): halves go away from zero instead of to the nearest even digit.
+
+    A tiny epsilon absorbs binary representation error, e.g. 2.675 is stored as 2.67499999... but
+    PostgreSQL sees the numeric 2.675 and rounds it to 2.68.
+    """
+    scale = 10.0 ** decimals
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5 + 1e-9) / scale
+
+
+def _lagged_windows(values: np.ndarray, position_in_group: np.ndarray, window: int) -> np.ndarray:
+    """
+    Returns a (window, n) array whose row k holds the value k rows earlier within the same group,
+    NaN where the group has fewer than k earlier rows.
+    """
+    lagged = np.full((window, len(values)), np.nan)
+    for k in range(window):
+        lagged[k, k:] = values[: len(values) - k]
+        lagged[k, position_in_group < k] = np.nan
+    return lagged
+
+
+def rolling_mean(values: np.ndarray, position_in_group: np.ndarray, window: int) -> np.ndarray:
+    """
+    Mean of the current and `window - 1` preceding values within the group, ignoring NaN
+    like AVG(...) OVER (ROWS BETWEEN window - 1 PRECEDING AND CURRENT ROW).
+    """
+    lagged = _lagged_windows(values, position_in_group, window)
+    counts = np.sum(~np.isnan(lagged), axis=0)
+    sums = np.nansum(lagged, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def rolling_std(values: np.ndarray, position_in_group: np.ndarray, window: int) -> np.ndarray:
+    """
+    Sample standard deviation over the same window as `rolling_mean`, NaN with fewer than
+    two values like STDDEV(...) OVER (...).
+    """
+    lagged = _lagged_windows(values, position_in_group, window)
+    counts = np.sum(~np.isnan(lagged), axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.nansum(lagged, axis=0) / counts
+        squared_deviations = np.nansum((lagged - means) ** 2, axis=0)
+        return np.where(counts > 1, np.sqrt(squared_deviations / (counts - 1)), np.nan)
+
+
+def compute_stock_bars_analysis(df_stock: pd.DataFrame, window: int = 5) -> pd.DataFrame:
+    """
+    Computes the metrics of `sql/transform/stock_bars_analysis.sql` in memory.
+
+    Args:
+        df_stock: output of `initial_transform` (stock, company, timestamp, close, ...)
+        window: number of rows of the moving average and standard deviation windows
+
+    Returns:
+        A dataframe with stock, company, date, close, prev_close, daily_return_pct,
+        moving_avg_<window>_day and stddev_<window>_day, sorted by stock and timestamp
+    """
+    timestamp = df_stock["timestamp"]
+    if timestamp.dt.tz is not None:
+        timestamp = timestamp.dt.tz_convert("UTC").dt.tz_localize(None)
+    timestamp = timestamp.to_numpy()
+
+    # Sort by stock then timestamp on integer codes, skipped when the input is already ordered
+    stock_codes = pd.factorize(df_stock["stock"], sort=True)[0]
+    same_stock = stock_codes[1:] == stock_codes[:-1]
+    if np.all(stock_codes[1:] >= stock_codes[:-1]) and np.all(timestamp[1:][same_stock] >= timestamp[:-1][same_stock]):
+        order = slice(None)
+    else:
+        order = np.lexsort((timestamp, stock_codes))
+    stock_codes = stock_codes[order]
+    timestamp = timestamp[order]
+
+    new_group = np.ones(len(stock_codes), dtype=bool)
+    new_group[1:] = stock_codes[1:] != stock_codes[:-1]
+    group_starts = np.flatnonzero(new_group)
+    position_in_group = np.arange(len(stock_codes)) - np.repeat(group_starts, np.diff(np.append(group_starts, len(stock_codes))))
+
+    close = df_stock["close"].to_numpy(dtype="float64")[order]
+    prev_close = np.full(len(close), np.nan)
+    prev_close[1:] = close[:-1]
+    prev_close[position_in_group == 0] = np.nan
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        daily_return = round_half_away_from_zero(
+            (close - prev_close) / np.where(prev_close == 0, np.nan, prev_close), 3
+        )
+
+    return pd.DataFrame(
+        {
+            "stock": df_stock["stock"].to_numpy()[order],
+            "company": df_stock["company"].to_numpy()[order],
+            "date": timestamp.astype("datetime64[D]").astype("datetime64[ns]"),
+            "close": close,
+            "prev_close": prev_close,
+            "daily_return_pct": round_half_away_from_zero(daily_return * 100, 1),
+            f"moving_avg_{window}_day": round_half_away_from_zero(rolling_mean(close, position_in_group, window), 2),
+            f"stddev_{window}_day": round_half_away_from_zero(rolling_std(daily_return, position_in_group, window), 2),
+        }
+    )
@@ -1,112 +1,215 @@
+import asyncio
+import itertools
+import numpy as np
 import pandas as pd
-from etl_project.connectors.alpaca_api import AlpacaApiClient
+import pyarrow as pa
+import pyarrow.compute as pc
+from etl_project.connectors.alpaca_api import BAR_SCHEMA, AlpacaApiClient, RequestStats, chunk_symbols, merge_bars
+from etl_project.connectors.alpaca_api_async import AsyncAlpacaApiClient, SharedAsyncAlpacaApiClient
+from etl_project.connectors.parquet_lake import ParquetLakeClient
+from etl_project.connectors.rate_limiter import TokenBucketRateLimiter
+from etl_project.connectors.response_cache import ResponseCache
 from etl_project.connectors.postgresql import PostgreSqlClient
-from typing import Optional
+from typing import Callable, Iterable, Iterator, Optional, Union
 from sqlalchemy import (
         Table, MetaData)
 from sqlalchemy.engine import Engine
 from sqlalchemy import (
         Table,
         Column,
+        DateTime,
         Integer,
         String,
         MetaData,
-        Float)
+        Float,
+        inspect)
 from jinja2 import Environment
 
-def get_stock_symbol(csv_file_path: str) -> str:
-    """
-    Returns a list of stock symbols to fetch data for.
+async def _extract_ranges(
+        alpacaApiClient: AsyncAlpacaApiClient,
+        extract_ranges: list,
+        timeframe: str,
+        symbols_per_request: int = 100,
+        date_window_days: Optional[int] = None
+    ) -> dict:
+    results = await asyncio.gather(*[
+        alpacaApiClient.get_alpaca_api_data_concurrent(
+            symbols=extract_range.symbols,
+            timeframe=timeframe,
+            start_time=extract_range.start_date,
+            end_time=extract_range.end_date,
+            symbols_per_request=symbols_per_request,
+            date_window_days=date_window_days)
+        for extract_range in extract_ranges
+    ])
+    return merge_bars(results)
 
-    Returns:
-        A string of stock symbols
+async def extract_alpaca_data_for_ranges_async(
+        extract_ranges: list,
+        timeframe: str,
+        api_key_id: str,
+        api_secret_key: str,
+        symbols_per_request: int = 100,
+        date_window_days: Optional[int] = None,
+        max_concurrency: int = 50,
+        rate_limiter: Optional[TokenBucketRateLimiter] = None,
+        request_stats: Optional[RequestStats] = None,
+        response_cache: Optional[ResponseCache] = None
+    ) -> dict:
     """
-    stock_list = pd.read_csv(csv_file_path)["Symbol"].tolist()
-
-    return ",".join(stock_list)
+    Extracts the planned (symbols, date range) extracts of `plan_extract_ranges` concurrently
+    on one event loop and merges them into a single dict of symbol -> list of bars.
+    """
+    async with AsyncAlpacaApiClient(
+        api_key_id=api_key_id,
+        api_secret_key=api_secret_key,
+        rate_limiter=rate_limiter,
+        request_stats=request_stats,
+        response_cache=response_cache,
+        max_concurrency=max_concurrency
+    ) as alpacaApiClient:
+        return await _extract_ranges(alpacaApiClient, extract_ranges, timeframe, symbols_per_request, date_window_days)
 
-def extract_alpaca_data(
-        stock_symbol_csv_path: str,
-        start_date: str,
+def extract_alpaca_data_for_ranges(
+        extract_ranges: list,
         timeframe: str,
         api_key_id: str,
         api_secret_key: str,
-        end_date: Optional[str] = None
+        symbols_per_request: int = 100,
+        date_window_days: Optional[int] = None,
+        max_concurrency: int = 50,
+        rate_limiter: Optional[TokenBucketRateLimiter] = None,
+        request_stats: Optional[RequestStats] = None,
+        response_cache: Optional[ResponseCache] = None,
+        shared_client: Optional[SharedAsyncAlpacaApiClient] = None
     ) -> dict:
     """
-    Extracts stock data from Alpaca Market API for a list of stock symbols.
-    
+    Synchronous wrapper running `extract_alpaca_data_for_ranges_async` to completion.
+
+    With `shared_client` the extract runs on the session, concurrency limit and rate limiter of
+    the shared client instead, the other client arguments but `request_stats` are ignored.
     """
+    if shared_client is not None:
+        client = shared_client.client if request_stats is None else shared_client.client_for(request_stats)
+        return shared_client.run(
+            _extract_ranges(client, extract_ranges, timeframe, symbols_per_request, date_window_days)
+        )
+    return asyncio.run(
+        extract_alpaca_data_for_ranges_async(
+            extract_ranges=extract_ranges,
+            timeframe=timeframe,
+            api_key_id=api_key_id,
+            api_secret_key=api_secret_key,
+            symbols_per_request=symbols_per_request,
+            date_window_days=date_window_days,
+            max_concurrency=max_concurrency,
+            rate_limiter=rate_limiter,
+            request_stats=request_stats,
+            response_cache=response_cache
+        )
+    )
 
-    alpacaApiClient = AlpacaApiClient(
-        api_key_id=api_key_id,
-        api_secret_key=api_secret_key
-    )   
+def extract_alpaca_data_pages_for_ranges(
+        extract_ranges: list,
+        timeframe: str,
+        alpaca_api_client: AlpacaApiClient,
+        symbols_per_request: int = 100
+    ) -> Iterator[dict]:
+    """
+    Extracts the planned extracts of `plan_extract_ranges` one page at a time.
+    """
+    for extract_range in extract_ranges:
+        for symbol_chunk in chunk_symbols(extract_range.symbols, symbols_per_request):
+            yield from alpaca_api_client.iter_alpaca_api_pages(
+                symbols=symbol_chunk,
+                timeframe=timeframe,
+                start_time=extract_range.start_date,
+                end_time=extract_range.end_date)
 
-    result = alpacaApiClient.get_alpaca_api_data(
-        symbols=get_stock_symbol(stock_symbol_csv_path),
-        timeframe=timeframe,
-        start_time=start_date,
-        end_time=end_date)
+def convert_to_arrow_table(data: dict) -> pa.Table:
+    """
+    Converts the extracted data to an Arrow table of typed columns plus a `symbol` column.
+
+    The records are read in a single pass by Arrow without being modified, `symbol` is
+    dictionary encoded so each row only stores the index of its symbol.
+    """
+    records = list(itertools.chain.from_iterable(data.values()))
+    table = pa.Table.from_pylist(records, schema=BAR_SCHEMA)
 
-    return result
+    symbol_indices = np.repeat(np.arange(len(data), dtype=np.int32), [len(bars) for bars in data.values()])
+    symbol = pa.DictionaryArray.from_arrays(pa.array(symbol_indices), pa.array(list(data), pa.string()))
+    return table.append_column("symbol", symbol)
 
 def convert_to_dataframe(data: dict) -> pd.DataFrame:
     """
     Converts the extracted data to a pandas DataFrame.
     """
-    # Flatten the data and add a 'symbol' column
-    all_rows = []
-    for symbol, records in data.items():
-        for record in records:
-            record['symbol'] = symbol
-            all_rows.append(record)
-
-    # Convert to DataFrame
-    df = pd.DataFrame(all_rows)
-
-    return df
+    table = convert_to_arrow_table(data)
+    symbol = table.column("symbol").combine_chunks()
+    table = table.set_column(table.schema.get_field_index("symbol"), "symbol", symbol.dictionary.take(symbol.indices))
+    return table.to_pandas()
 
 def extract_stock_symbol(csv_path):
     return pd.read_csv(csv_path)
 
-def initial_transform(df: pd.DataFrame, df_stock_symbol: pd.DataFrame) -> pd.DataFrame:
-    
-    # Convert timestamp column to datetime
-    df['t'] = pd.to_datetime(df['t'])
-    
-    # rename columns to more meaningful names
-    df_renamed = df.rename(
-        columns={
-            "c": "close",
-            "h": "high",
-            "l": "low",
-            "n": "number_of_trades",
-            "o": "open",
-            "t": "timestamp",
-            "v": "volume",
-            "vw": "volume_weighted_avg_price",
-            "symbol": "stock"
+def transform_to_arrow(data: Union[pd.DataFrame, pa.Table], df_stock_symbol: pd.DataFrame, keep_unknown_symbols: bool = False) -> pa.Table:
+    """
+    Arrow half of `initial_transform`: the transformed bars with `stock` still dictionary encoded,
+    the layout `validate_bars` checks before the rows are converted to pandas by `bars_to_pandas`.
+
+    Args:
+        keep_unknown_symbols: keep the rows of stocks missing from `df_stock_symbol` with a null company
+    """
+    table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+
+    # Look the company up once per distinct symbol, rows only carry the index into the symbols
+    symbol = table.column("symbol").combine_chunks()
+    if not pa.types.is_dictionary(symbol.type):
+        symbol = symbol.dictionary_encode()
+    company_by_symbol = dict(zip(df_stock_symbol["Symbol"], df_stock_symbol["Company"]))
+    companies = pa.array([company_by_symbol.get(stock) for stock in symbol.dictionary.to_pylist()], pa.string())
+    company = companies.take(symbol.indices)
+
+    df_stock = pa.table(
+        {
+            "stock": symbol,
+            "company": company,
+            "timestamp": pc.cast(table.column("t"), pa.timestamp("ns", tz="UTC")),
+            "open": table.column("o"),
+            "high": table.column("h"),
+            "low": table.column("l"),
+            "close": table.column("c"),
+            "volume": table.column("v"),
+            "volume_weighted_avg_price": table.column("vw"),
+            "number_of_trades": table.column("n"),
         }
     )
+    if company.null_count and not keep_unknown_symbols:
+        df_stock = df_stock.filter(company.is_valid())
+    return df_stock
 
-    df_merged = (
-        pd.merge(
-            left=df_renamed,
-            right=df_stock_symbol,
-            left_on="stock",
-            right_on="Symbol",
-        )
-        .drop(columns=["Exchange", "Symbol"])
-        .rename(columns={"Company": "company"})
-    )
+def bars_to_pandas(table: pa.Table) -> pd.DataFrame:
+    """
+    Converts a `transform_to_arrow` table to the DataFrame `initial_transform` returns.
+    The table is consumed by the conversion and must not be used afterwards.
+    """
+    stock = table.column("stock")
+    if pa.types.is_dictionary(stock.type):
+        table = table.set_column(0, "stock", stock.cast(pa.string()))
+    # The table is not used afterwards, let Arrow free each column as soon as it is converted
+    return table.to_pandas(split_blocks=True, self_destruct=True)
 
-    # Reorder columns
-    df_stock = df_merged[
-        ["stock", "company", "timestamp", "open", "high", "low", "close", "volume", "volume_weighted_avg_price", "number_of_trades"]
-    ]
+def initial_transform(data: Union[pd.DataFrame, pa.Table], df_stock_symbol: pd.DataFrame, keep_unknown_symbols: bool = False) -> pd.DataFrame:
+    """
+    Parses the timestamps, renames the columns and adds the company of each stock.
+    Rows of stocks missing from `df_stock_symbol` are dropped.
 
-    return df_stock
+    Args:
+        data: output of `convert_to_arrow_table`, or of `convert_to_dataframe`
+        df_stock_symbol: stock symbol csv with Company and Symbol columns
+        keep_unknown_symbols: keep the rows of missing stocks with a null company
+    """
+    return bars_to_pandas(transform_to_arrow(data, df_stock_symbol, keep_unknown_symbols))
 
 def load(
     df: pd.DataFrame,
@@ -114,7 +217,9 @@ def load(
     table: Table,
     metadata: MetaData,
     load_method: str = "overwrite",
-) -> None:
+    batch_size: Optional[int] = None,
+    commit_per: str = "run",
+) -> dict[str, int]:
     """
     Load dataframe to a database.
 
@@ -123,24 +228,187 @@ def load(
         postgresql_client: postgresql client
         table: sqlalchemy table
         metadata: sqlalchemy metadata
-        load_method: supports one of: [insert, upsert, overwrite]
+        load_method: supports one of: [insert, upsert, overwrite, bulk_insert, bulk_upsert, bulk_overwrite]
+            the bulk_ methods stream the rows with COPY FROM STDIN, the upserts skip the rows that did not change
+        batch_size: rows per INSERT statement for insert, upsert and overwrite
+        commit_per: commit after every `batch` or once per `run`
+
+    Returns:
+        The number of rows inserted, updated and left unchanged
     """
     if load_method == "insert":
         postgresql_client.insert(
-            data=df.to_dict(orient="records"), table=table, metadata=metadata
+            data=df.to_dict(orient="records"), table=table, metadata=metadata,
+            batch_size=batch_size, commit_per=commit_per
         )
     elif load_method == "upsert":
-        postgresql_client.upsert(
-            data=df.to_dict(orient="records"), table=table, metadata=metadata
+        batch_stats = postgresql_client.upsert(
+            data=df.to_dict(orient="records"), table=table, metadata=metadata,
+            batch_size=batch_size, commit_per=commit_per
         )
+        return add_write_counts(new_write_counts(), *batch_stats)
     elif load_method == "overwrite":
         postgresql_client.overwrite(
-            data=df.to_dict(orient="records"), table=table, metadata=metadata
+            data=df.to_dict(orient="records"), table=table, metadata=metadata,
+            batch_size=batch_size, commit_per=commit_per
         )
+    elif load_method == "bulk_insert":
+        postgresql_client.bulk_insert(data=df, table=table, metadata=metadata)
+    elif load_method == "bulk_upsert":
+        return postgresql_client.bulk_upsert(data=df, table=table, metadata=metadata)
+    elif load_method == "bulk_overwrite":
+        postgresql_client.bulk_overwrite(data=df, table=table, metadata=metadata)
     else:
         raise Exception(
-            "Please specify a correct load method: [insert, upsert, overwrite]"
+            "Please specify a correct load method: [insert, upsert, overwrite, bulk_insert, bulk_upsert, bulk_overwrite]"
         )
+    return dict(new_write_counts(), inserted=len(df))
+
+def new_write_counts() -> dict[str, int]:
+    return {"inserted": 0, "updated": 0, "unchanged": 0}
+
+def add_write_counts(write_counts: dict, *counts: dict) -> dict:
+    """
+    Adds the inserted, updated and unchanged rows of `counts` to `write_counts` in place.
+    """
+    for count in counts:
+        for key in ("inserted", "updated", "unchanged"):
+            write_counts[key] += count[key]
+    return write_counts
+
+def format_write_counts(write_counts: dict) -> str:
+    return (
+        f"{write_counts['inserted']} rows inserted, {write_counts['updated']} updated "
+        f"and {write_counts['unchanged']} unchanged rows skipped"
+    )
+
+def append_load_method(load_method: str) -> str:
+    """
+    Returns the load method to use for the chunks following the first one:
+    an overwrite only replaces the table once, the rest of the data is appended.
+    """
+    return {"overwrite": "insert", "bulk_overwrite": "bulk_insert"}.get(load_method, load_method)
+
+def load_in_chunks(
+    df: pd.DataFrame,
+    postgresql_client: PostgreSqlClient,
+    table: Table,
+    metadata: MetaData,
+    load_method: str = "overwrite",
+    chunk_size: int = 10000,
+    batch_size: Optional[int] = None,
+    commit_per: str = "run",
+) -> dict[str, int]:
+    """
+    Load dataframe to a database in chunks of at most `chunk_size` rows,
+    so only one chunk is converted to records at a time.
+
+    With `overwrite`/`bulk_overwrite` only the first chunk replaces the table, the following chunks are inserted.
+
+    Returns:
+        The number of rows inserted, updated and left unchanged
+    """
+    write_counts = new_write_counts()
+    for start in range(0, len(df), chunk_size):
+        chunk_write_counts = load(
+            df=df.iloc[start : start + chunk_size],
+            postgresql_client=postgresql_client,
+            table=table,
+            metadata=metadata,
+            load_method=load_method,
+            batch_size=batch_size,
+            commit_per=commit_per,
+        )
+        add_write_counts(write_counts, chunk_write_counts)
+        load_method = append_load_method(load_method)
+    return write_counts
+
+def update_watermarks(watermarks: dict, df_stock: pd.DataFrame) -> dict:
+    """
+    Widens the symbol -> (earliest, latest) timestamps in `watermarks` with the rows of `df_stock`.
+    """
+    if df_stock.empty:
+        return watermarks
+
+    ranges = df_stock.groupby("stock")["timestamp"].agg(["min", "max"])
+    for symbol, earliest, latest in ranges.itertuples():
+        if symbol in watermarks:
+            earliest = min(earliest, watermarks[symbol][0])
+            latest = max(latest, watermarks[symbol][1])
+        watermarks[symbol] = (earliest, latest)
+    return watermarks
+
+def stream_transform_and_load(
+    pages: Iterable[Union[dict, pa.Table]],
+    df_stock_symbol: pd.DataFrame,
+    postgresql_client: PostgreSqlClient,
+    table: Table,
+    metadata: MetaData,
+    load_method: str = "overwrite",
+    chunk_size: int = 10000,
+    batch_size: Optional[int] = None,
+    commit_per: str = "run",
+    parquet_lake: Optional[ParquetLakeClient] = None,
+    timeframe: str = "1Day",
+    watermarks: Optional[dict] = None,
+    validate: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    write_counts: Optional[dict] = None,
+) -> tuple[int, Optional[pd.Timestamp]]:
+    """
+    Transforms and loads each extracted page as it arrives, so memory is bounded by the
+    page size rather than the size of the date range.
+
+    Args:
+        pages: extracted pages, or Arrow tables in the `convert_to_arrow_table` layout
+        parquet_lake: when set, the raw bars of every page are landed in the lake before they are loaded
+        timeframe: timeframe of the bars, names the lake partition
+        watermarks: when set, updated in place with the earliest and latest timestamp loaded per symbol
+        validate: when set, called with the `transform_to_arrow` table of every page, unknown symbols
+            included, and returns the DataFrame to load, e.g. the rows passing `validate_bars`
+        write_counts: when set, `new_write_counts()` updated in place with the rows inserted, updated and left unchanged
+
+    Returns:
+        The number of rows loaded and the latest timestamp loaded (None when nothing was loaded)
+    """
+    rows_loaded = 0
+    latest_timestamp = None
+    for page in pages:
+        if not page:
+            continue
+
+        stock_bars = page if isinstance(page, pa.Table) else convert_to_arrow_table(page)
+        if parquet_lake is not None:
+            parquet_lake.write_bars(stock_bars, timeframe)
+
+        if validate is not None:
+            df_stock = validate(transform_to_arrow(stock_bars, df_stock_symbol, keep_unknown_symbols=True))
+        else:
+            df_stock = initial_transform(stock_bars, df_stock_symbol)
+        if df_stock.empty:
+            continue
+
+        page_write_counts = load_in_chunks(
+            df=df_stock,
+            postgresql_client=postgresql_client,
+            table=table,
+            metadata=metadata,
+            load_method=load_method,
+            chunk_size=chunk_size,
+            batch_size=batch_size,
+            commit_per=commit_per,
+        )
+        load_method = append_load_method(load_method)
+        if write_counts is not None:
+            add_write_counts(write_counts, page_write_counts)
+
+        rows_loaded += len(df_stock)
+        if watermarks is not None:
+            update_watermarks(watermarks, df_stock)
+        page_latest_timestamp = df_stock["timestamp"].max()
+        if latest_timestamp is None or page_latest_timestamp > latest_timestamp:
+            latest_timestamp = page_latest_timestamp
+
+    return rows_loaded, latest_timestamp
 
 # Extract data given a sql query and engine
 def extract_from_query(sql_query: str, engine: Engine) -> list[dict]: # Output format to store the data in memory. pandas might be heavy bc you need to import library
@@ -148,23 +416,80 @@ def extract_from_query(sql_query: str, engine: Engine) -> list[dict]: # Output f
 
 
 def define_stock_bars_table(metadata: MetaData, source_table_name: str) -> Table:
+    """
+    Bars table range partitioned by month of `timestamp`, the (stock, timestamp) primary key
+    indexes every partition. Partitions are created by the load as rows arrive.
+    """
     return Table(
         source_table_name,
         metadata,
         Column("stock", String, primary_key=True),
         Column("company", String),
-        Column("timestamp", String, primary_key=True),
+        Column("timestamp", DateTime(timezone=True), primary_key=True),
         Column("open", Float),
         Column("high", Float),
         Column("low", Float),
         Column("close", Float),
         Column("volume", Integer),
         Column("volume_weighted_avg_price", Float),
-        Column("number_of_trades", Integer)
+        Column("number_of_trades", Integer),
+        postgresql_partition_by="RANGE (timestamp)"
     )
 
-def transform_and_load_analysis_table(environment: Environment, engine: Engine) -> None:
-    for sql_path in environment.list_templates():
-        sql_template = environment.get_template(sql_path)
-        sql_query = sql_template.render()
-        engine.execute(sql_query)
\ No newline at end of file
+def migrate_stock_bars_table(postgresql_client: PostgreSqlClient, table_name: str) -> bool:
+    """
+    Migrates a bars table created with string timestamps to the partitioned timestamptz table,
+    in one transaction: the old table is renamed, the new one created and filled from it.
+
+    Returns:
+        True when the table was migrated, False when it did not need to
+    """
+    engine = postgresql_client.engine
+    if not inspect(engine).has_table(table_name):
+        return False
+    timestamp_column = next(column for column in inspect(engine).get_columns(table_name) if column["name"] == "timestamp")
+    if not isinstance(timestamp_column["type"], String):
+        return False
+
+    legacy_table_name = f"{table_name}_legacy"
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, table_name)
+    column_list = ", ".join(column.name for column in table.columns)
+    select_list = ", ".join(
+        "timestamp::timestamptz" if column.name == "timestamp" else column.name for column in table.columns
+    )
+    try:
+        with engine.begin() as connection:
+            connection.execute(f"ALTER TABLE {table_name} RENAME TO {legacy_table_name}")
+            connection.execute(f"ALTER INDEX IF EXISTS {table_name}_pkey RENAME TO {legacy_table_name}_pkey")
+            table.create(connection)
+
+            earliest, latest = connection.execute(
+                f"SELECT MIN(timestamp::timestamptz), MAX(timestamp::timestamptz) FROM {legacy_table_name}"
+            ).one()
+            if earliest is not None:
+                postgresql_client.ensure_monthly_partitions(connection, table_name, earliest, latest)
+            connection.execute(
+                f"INSERT INTO {table_name} ({column_list}) "
+                f"SELECT {select_list} FROM {legacy_table_name}"
+            )
+            connection.execute(f"DROP TABLE {legacy_table_name}")
+    finally:
+        postgresql_client.schema_registry.invalidate(table_name)
+    return True
+
+def transform_and_load_analysis_table(environment: Environment, engine: Engine, **template_params) -> None:
+    """
+    Runs every sql template of the environment in one transaction.
+
+    Args:
+        environment: jinja environment, `sql/transform` rebuilds the analysis table from the whole
+            history while `sql/incremental` only refreshes the rows from `since_date`
+        engine: sqlalchemy engine
+        template_params: values rendered into the templates, e.g. since_date="2025-09-29"
+    """
+    with engine.begin() as connection:
+        for sql_path in environment.list_templates():
+            sql_template = environment.get_template(sql_path)
+            sql_query = sql_template.render(**template_params)
+            connection.execute(sql_query)
\ No newline at end of file
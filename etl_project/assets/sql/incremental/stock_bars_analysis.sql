@@ -0,0 +1,79 @@
+{% set source_table_name = source_table_name | default('stock_bars') %}
+{% set analysis_table_name = analysis_table_name | default('stock_bars_analysis') %}
+{# Start of since_date in UTC, the analysis dates are UTC dates whatever the session TimeZone #}
+{% set since_timestamp = "('" ~ since_date ~ "'::timestamp at time zone 'UTC')" %}
+
+create table if not exists {{ analysis_table_name }} (
+	stock varchar,
+	company varchar,
+	date date,
+	close float8,
+	prev_close float8,
+	daily_return_pct numeric,
+	moving_avg_5_day numeric,
+	stddev_5_day numeric
+);
+create unique index if not exists {{ analysis_table_name }}_stock_date_idx on {{ analysis_table_name }} (stock, date);
+
+insert into {{ analysis_table_name }} (stock, company, date, close, prev_close, daily_return_pct, moving_avg_5_day, stddev_5_day)
+with lookback AS (
+-- rows from {{ since_date }} are recomputed, the 5 rows before feed LAG and the 5-row windows
+select
+	stocks.stock,
+	coalesce(
+		(select min(previous_rows.timestamp) from (
+			select timestamp
+			from {{ source_table_name }}
+			where stock = stocks.stock and timestamp < {{ since_timestamp }}
+			order by timestamp desc
+			limit 5
+		) previous_rows),
+		{{ since_timestamp }}
+	) AS from_timestamp
+from (select distinct stock from {{ source_table_name }} where timestamp >= {{ since_timestamp }}) stocks
+),
+
+prev_close AS (
+select 
+	bars.stock, 
+	bars.company,
+	bars.timestamp,
+	bars.close,
+	LAG(bars.close, 1) OVER (PARTITION BY bars.stock ORDER BY bars.timestamp) AS prev_close
+from {{ source_table_name }} bars
+join lookback on bars.stock = lookback.stock and bars.timestamp >= lookback.from_timestamp
+),
+
+daily_returns AS (
+select 
+	stock,
+	company,
+	(timestamp at time zone 'UTC')::date AS date,
+	close,
+	prev_close,
+	ROUND(((close - prev_close) / nullif(prev_close, 0))::numeric, 3) AS daily_return
+	
+from prev_close),
+
+analysis AS (
+select 
+	stock, 
+	company,
+	date,
+	close,
+	prev_close,
+	ROUND(daily_return * 100, 1) as daily_return_pct,
+	ROUND((AVG(close) OVER (PARTITION BY stock ORDER BY date ROWS BETWEEN 4 PRECEDING AND CURRENT ROW))::numeric, 2) AS moving_avg_5_day,
+	ROUND((STDDEV(daily_return) OVER (PARTITION BY stock ORDER BY date ROWS BETWEEN 4 PRECEDING AND CURRENT ROW))::numeric, 2) AS stddev_5_day
+
+from daily_returns)
+
+select * from analysis
+where date >= '{{ since_date }}'::date
+on conflict (stock, date) do update set
+	company = excluded.company,
+	close = excluded.close,
+	prev_close = excluded.prev_close,
+	daily_return_pct = excluded.daily_return_pct,
+	moving_avg_5_day = excluded.moving_avg_5_day,
+	stddev_5_day = excluded.stddev_5_day;
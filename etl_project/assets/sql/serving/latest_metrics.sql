@@ -0,0 +1,14 @@
+{% set analysis_table_name = analysis_table_name | default('stock_bars_analysis') %}
+
+-- Latest row of the analysis table per stock
+select distinct on (stock)
+	stock,
+	company,
+	date,
+	close,
+	prev_close,
+	daily_return_pct,
+	moving_avg_5_day,
+	stddev_5_day
+from {{ analysis_table_name }}
+order by stock, date desc
@@ -0,0 +1,17 @@
+{% set source_table_name = source_table_name | default('stock_bars') %}
+
+-- OHLCV bars of every calendar month (UTC), the first open and the last close of the month
+select
+	stock,
+	max(company) AS company,
+	date_trunc('month', timestamp at time zone 'UTC')::date AS period_start,
+	(array_agg(open order by timestamp))[1] AS open,
+	max(high) AS high,
+	min(low) AS low,
+	(array_agg(close order by timestamp desc))[1] AS close,
+	sum(volume) AS volume,
+	sum(volume_weighted_avg_price * volume) / nullif(sum(volume), 0) AS volume_weighted_avg_price,
+	sum(number_of_trades) AS number_of_trades,
+	count(*) AS bars
+from {{ source_table_name }}
+group by stock, period_start
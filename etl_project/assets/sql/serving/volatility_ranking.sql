@@ -0,0 +1,26 @@
+{% set analysis_table_name = analysis_table_name | default('stock_bars_analysis') %}
+{% set window_days = window_days | default(20) %}
+
+-- Standard deviation of the daily returns over the last {{ window_days }} trading days of every stock,
+-- ranked from the most volatile
+with rolling AS (
+select
+	stock,
+	company,
+	date,
+	STDDEV(daily_return_pct) OVER last_days AS volatility,
+	COUNT(daily_return_pct) OVER last_days AS returns_in_window,
+	ROW_NUMBER() OVER (PARTITION BY stock ORDER BY date DESC) AS recency
+from {{ analysis_table_name }}
+window last_days AS (PARTITION BY stock ORDER BY date ROWS BETWEEN {{ window_days - 1 }} PRECEDING AND CURRENT ROW)
+)
+
+select
+	stock,
+	company,
+	date,
+	ROUND(volatility, 3) AS volatility_pct,
+	returns_in_window,
+	RANK() OVER (ORDER BY volatility DESC NULLS LAST) AS volatility_rank
+from rolling
+where recency = 1
@@ -1,6 +1,23 @@
+{% set source_table_name = source_table_name | default('stock_bars') %}
+{% set analysis_table_name = analysis_table_name | default('stock_bars_analysis') %}
 
-drop table if exists stock_bars_analysis;
-create table stock_bars_analysis as
+create table if not exists {{ analysis_table_name }} (
+	stock varchar,
+	company varchar,
+	date date,
+	close float8,
+	prev_close float8,
+	daily_return_pct numeric,
+	moving_avg_5_day numeric,
+	stddev_5_day numeric
+);
+create unique index if not exists {{ analysis_table_name }}_stock_date_idx on {{ analysis_table_name }} (stock, date);
+
+-- The table is emptied and refilled in the transaction of the refresh: readers keep seeing the
+-- previous rows until it commits, the table never goes missing
+delete from {{ analysis_table_name }};
+
+insert into {{ analysis_table_name }} (stock, company, date, close, prev_close, daily_return_pct, moving_avg_5_day, stddev_5_day)
 with prev_close AS (
 select 
 	stock, 
@@ -8,14 +25,14 @@ select
 	timestamp,
 	close,
 	LAG(close, 1) OVER (PARTITION BY stock ORDER BY timestamp) AS prev_close
-from stock_bars
+from {{ source_table_name }}
 ),
 
 daily_returns AS (
 select 
 	stock,
 	company,
-	(timestamp::timestamp)::date AS date,
+	(timestamp at time zone 'UTC')::date AS date,
 	close,
 	prev_close,
 	ROUND(((close - prev_close) / nullif(prev_close, 0))::numeric, 3) AS daily_return
@@ -0,0 +1,212 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Union
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from loguru import logger
+from sqlalchemy import BigInteger, Column, DateTime, Float, MetaData, String, Table
+from etl_project.assets.assets import bars_to_pandas
+from etl_project.connectors.postgresql import PostgreSqlClient
+
+PRICE_COLUMNS = ["open", "high", "low", "close"]
+
+# Rules in the order they are reported, a row can fail several of them
+VALIDATION_RULES = [
+    "missing_value",        # a key or price is null
+    "unknown_symbol",       # the symbol has no company in the stock symbol csv
+    "high_below_low",
+    "price_outside_range",  # open or close outside [low, high]
+    "non_positive_price",
+    "negative_volume",      # negative volume or number of trades
+    "duplicate_key",        # (stock, timestamp) seen again later in the batch, the last one is kept
+]
+
+
+@dataclass
+class ValidationResult:
+    valid: pd.DataFrame
+    # Failing rows with a `failed_rules` column listing the rules they failed
+    quarantined: pd.DataFrame
+    rule_counts: dict[str, int] = field(default_factory=dict)
+
+
+def _array(column: pa.ChunkedArray) -> pa.Array:
+    # combine_chunks copies even a single chunk
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+def _float_column(data: Union[pa.Table, pd.DataFrame], name: str) -> np.ndarray:
+    # Nulls become NaN, without a copy when the Arrow column has none
+    column = data.column(name) if isinstance(data, pa.Table) else data[name]
+    return column.to_numpy().astype("float64", copy=False)
+
+
+def _is_null(data: Union[pa.Table, pd.DataFrame], name: str) -> np.ndarray:
+    if isinstance(data, pa.Table):
+        column = data.column(name)
+        if not column.null_count:
+            return np.zeros(len(column), dtype=bool)
+        return column.is_null().to_numpy()
+    return data[name].isna().to_numpy()
+
+
+def _stock_codes(data: Union[pa.Table, pd.DataFrame]) -> np.ndarray:
+    # The dictionary indices of a `transform_to_arrow` table, strings are only hashed for DataFrames
+    if isinstance(data, pa.Table):
+        stock = _array(data.column("stock"))
+        indices = stock.indices if pa.types.is_dictionary(stock.type) else pc.dictionary_encode(stock).indices
+        if indices.null_count:
+            indices = indices.fill_null(-1)
+        return indices.to_numpy()
+    return pd.factorize(data["stock"])[0]
+
+
+def _timestamps(data: Union[pa.Table, pd.DataFrame]) -> np.ndarray:
+    # Nanoseconds since the epoch, nulls are flagged by `missing_value` and read as 0 here
+    if isinstance(data, pa.Table):
+        timestamps = _array(data.column("timestamp")).view(pa.int64())
+        if timestamps.null_count:
+            timestamps = timestamps.fill_null(0)
+        return timestamps.to_numpy()
+    return np.where(data["timestamp"].isna().to_numpy(), 0, data["timestamp"].array.asi8)
+
+
+def duplicate_keys(codes: np.ndarray, timestamps: np.ndarray) -> np.ndarray:
+    """
+    Flags the (stock, timestamp) keys seen again later in the batch, all but the last occurrence.
+    """
+    if len(codes) < 2:
+        return np.zeros(len(codes), dtype=bool)
+    # Pages list the bars of every stock together in time order, a neighbour comparison proves there is no duplicate
+    new_stock = codes[1:] != codes[:-1]
+    run_codes = codes[np.flatnonzero(np.concatenate(([True], new_stock)))]
+    stocks_contiguous = len(np.unique(run_codes)) == len(run_codes)
+    if stocks_contiguous and np.all(new_stock | (timestamps[1:] > timestamps[:-1])):
+        return np.zeros(len(codes), dtype=bool)
+    return pd.DataFrame({"stock": codes, "timestamp": timestamps}).duplicated(keep="last").to_numpy()
+
+
+def validate_bars(data: Union[pa.Table, pd.DataFrame]) -> ValidationResult:
+    """
+    Checks every rule of VALIDATION_RULES over whole columns at once: the columns are read
+    into numpy arrays once, without copies for Arrow tables, and each rule is a vectorised
+    comparison producing a row mask.
+
+    Args:
+        data: bars in the layout of `transform_to_arrow` with `keep_unknown_symbols`, the cheapest
+            to check, or the DataFrame `initial_transform` returns
+
+    Returns:
+        The valid rows, the quarantined rows and the number of rows failing each rule
+    """
+    open_, high, low, close = (_float_column(data, name) for name in PRICE_COLUMNS)
+    codes = _stock_codes(data)
+    # Shared by several rules, every rule is then one or two passes over the rows
+    lowest_open_close = np.minimum(open_, close)
+    highest_open_close = np.maximum(open_, close)
+    with np.errstate(invalid="ignore"):
+        masks = {
+            # NaN propagates through the sum
+            "missing_value": (codes < 0) | _is_null(data, "timestamp") | np.isnan(open_ + high + low + close),
+            "unknown_symbol": _is_null(data, "company"),
+            "high_below_low": high < low,
+            "price_outside_range": (lowest_open_close < low) | (highest_open_close > high),
+            "non_positive_price": (np.minimum(lowest_open_close, low) <= 0) | (high <= 0),
+            "negative_volume": (_float_column(data, "volume") < 0) | (_float_column(data, "number_of_trades") < 0),
+            "duplicate_key": duplicate_keys(codes, _timestamps(data)),
+        }
+
+    failed = np.logical_or.reduce(list(masks.values()))
+    rule_counts = {rule: int(np.count_nonzero(mask)) for rule, mask in masks.items()}
+    if not failed.any():
+        valid = bars_to_pandas(data) if isinstance(data, pa.Table) else data
+        return ValidationResult(valid=valid, quarantined=valid.iloc[:0].assign(failed_rules=""), rule_counts=rule_counts)
+
+    # Label only the failing rows, usually a handful
+    failed_rules = np.full(int(np.count_nonzero(failed)), "", dtype=object)
+    for rule, mask in masks.items():
+        hits = mask[failed]
+        failed_rules[hits] = failed_rules[hits] + f"{rule},"
+
+    if isinstance(data, pa.Table):
+        valid = bars_to_pandas(data.filter(pa.array(~failed)))
+        quarantined = bars_to_pandas(data.filter(pa.array(failed)))
+    else:
+        valid = data[~failed]
+        quarantined = data[failed]
+    return ValidationResult(
+        valid=valid,
+        quarantined=quarantined.assign(failed_rules=pd.Series(failed_rules).str.rstrip(",").to_numpy()),
+        rule_counts=rule_counts,
+    )
+
+
+def define_quarantine_table(metadata: MetaData, quarantine_table_name: str) -> Table:
+    """
+    Append-only table of the rows that failed validation, every column is nullable since the
+    rows are quarantined precisely because they do not fit the bars table.
+    """
+    return Table(
+        quarantine_table_name,
+        metadata,
+        Column("id", BigInteger, primary_key=True, autoincrement=True),
+        Column("source_table_name", String, nullable=False),
+        Column("failed_rules", String, nullable=False),
+        Column("quarantined_at", DateTime(timezone=True), nullable=False),
+        Column("stock", String),
+        Column("company", String),
+        Column("timestamp", DateTime(timezone=True)),
+        Column("open", Float),
+        Column("high", Float),
+        Column("low", Float),
+        Column("close", Float),
+        Column("volume", BigInteger),
+        Column("volume_weighted_avg_price", Float),
+        Column("number_of_trades", BigInteger),
+    )
+
+
+def quarantine_bars(
+        postgresql_client: PostgreSqlClient,
+        df_quarantined: pd.DataFrame,
+        quarantine_table_name: str,
+        source_table_name: str
+    ) -> int:
+    """
+    Appends the quarantined rows to the quarantine table.
+
+    Returns:
+        The number of rows quarantined
+    """
+    if df_quarantined.empty:
+        return 0
+    metadata = MetaData()
+    table = define_quarantine_table(metadata, quarantine_table_name)
+    columns = [column.name for column in table.columns if column.name in df_quarantined.columns]
+    df = df_quarantined[columns].astype(object)
+    df = df.where(df.notna(), None).assign(
+        source_table_name=source_table_name,
+        quarantined_at=datetime.now(timezone.utc),
+    )
+    postgresql_client.insert(data=df.to_dict(orient="records"), table=table, metadata=metadata)
+    return len(df)
+
+
+def validate_and_quarantine(
+        data: Union[pa.Table, pd.DataFrame],
+        postgresql_client: PostgreSqlClient,
+        quarantine_table_name: str,
+        source_table_name: str
+    ) -> ValidationResult:
+    """
+    Validates the bars and moves the failing rows to the quarantine table.
+    """
+    rows = len(data)
+    result = validate_bars(data)
+    if not result.quarantined.empty:
+        quarantine_bars(postgresql_client, result.quarantined, quarantine_table_name, source_table_name)
+        failures = {rule: count for rule, count in result.rule_counts.items() if count}
+        logger.warning(f"Quarantined {len(result.quarantined)} of {rows} rows in '{quarantine_table_name}': {failures}")
+    return result
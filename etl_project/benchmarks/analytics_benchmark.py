@@ -0,0 +1,42 @@
+import argparse
+import time
+import pandas as pd
+from etl_project.assets.analytics import compute_stock_bars_analysis
+from etl_project.benchmarks.synthetic import generate_stock_bars_frame
+
+
+def pandas_groupby_rolling(df_stock: pd.DataFrame, window: int = 5) -> pd.DataFrame:
+    """
+    Straightforward groupby/rolling implementation, used as the reference point of the benchmark.
+    """
+    df = df_stock.sort_values(["stock", "timestamp"])
+    grouped = df.groupby("stock")["close"]
+    df["prev_close"] = grouped.shift(1)
+    df["daily_return"] = ((df["close"] - df["prev_close"]) / df["prev_close"]).round(3)
+    df["moving_avg"] = grouped.rolling(window, min_periods=1).mean().reset_index(level=0, drop=True)
+    df["stddev"] = df.groupby("stock")["daily_return"].rolling(window, min_periods=1).std().reset_index(level=0, drop=True)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the in-process stock bars analytics")
+    parser.add_argument("--symbols", type=int, default=1000)
+    parser.add_argument("--bars-per-symbol", type=int, default=2500)
+    parser.add_argument("--window", type=int, default=5)
+    args = parser.parse_args()
+
+    df_stock = generate_stock_bars_frame(args.symbols, args.bars_per_symbol)
+    rows = len(df_stock)
+
+    for name, function in [
+        ("compute_stock_bars_analysis", compute_stock_bars_analysis),
+        ("pandas groupby rolling", pandas_groupby_rolling),
+    ]:
+        start = time.perf_counter()
+        function(df_stock, window=args.window)
+        seconds = time.perf_counter() - start
+        print(f"{name:<30} {rows:>12,} rows {seconds:>8.3f}s {rows / seconds:>14,.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main()
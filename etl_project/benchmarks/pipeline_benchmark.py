@@ -0,0 +1,355 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Optional
+import numpy as np
+from dotenv import load_dotenv
+from jinja2 import Environment, FileSystemLoader
+from sqlalchemy import MetaData
+from etl_project.assets.assets import (
+    convert_to_arrow_table,
+    convert_to_dataframe,
+    define_stock_bars_table,
+    initial_transform,
+    load,
+    transform_and_load_analysis_table,
+    transform_to_arrow,
+)
+from etl_project.assets.validation import validate_bars
+from etl_project.benchmarks.stub_alpaca_server import StubAlpacaServer
+from etl_project.benchmarks.synthetic import generate_alpaca_bars, generate_stock_symbol_frame
+from etl_project.connectors.alpaca_api_async import AsyncAlpacaApiClient
+from etl_project.connectors.postgresql import PostgreSqlClient
+from etl_project.connectors.rate_limiter import TokenBucketRateLimiter
+from etl_project.metadata.instrumentation import peak_rss_bytes
+
+PROFILES = {
+    # 10 symbols, one year of daily bars
+    "small": {"symbols": 10, "bars_per_symbol": 252, "timeframe": "1Day"},
+    # 500 symbols, ten years of daily bars
+    "medium": {"symbols": 500, "bars_per_symbol": 2520, "timeframe": "1Day"},
+    # 3000 symbols, one month of minute bars
+    "large": {"symbols": 3000, "bars_per_symbol": 8190, "timeframe": "1Min"},
+    # 5000 symbols, two years of minute bars
+    "huge": {"symbols": 5000, "bars_per_symbol": 196560, "timeframe": "1Min"},
+}
+
+LOAD_METHODS = ["insert", "upsert", "overwrite", "bulk_insert", "bulk_upsert", "bulk_overwrite"]
+
+BENCHMARKS = ["extract", "convert_to_dataframe", "convert_to_arrow_table", "initial_transform", "transform_and_validate", "load", "analysis_sql"]
+
+DEFAULT_BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+BENCHMARK_TABLE_NAME = "benchmark_stock_bars"
+BENCHMARK_ANALYSIS_TABLE_NAME = "benchmark_stock_bars_analysis"
+
+
+def time_repeats(function: Callable, repeat: int, setup: Optional[Callable] = None) -> list[float]:
+    """
+    Calls `function` `repeat` times and returns the wall time of each call, `setup` runs
+    before every call and is not timed.
+    """
+    seconds = []
+    for _ in range(repeat):
+        argument = setup() if setup is not None else None
+        start = time.perf_counter()
+        function(argument) if setup is not None else function()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def summarise(name: str, rows: int, seconds: list[float]) -> dict:
+    """
+    Returns the latency percentiles and throughput of one benchmark. Throughput uses the fastest
+    call, which is the least affected by other load on the machine, like timeit does.
+    """
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+    return {
+        "name": name,
+        "rows": rows,
+        "repeat": len(seconds),
+        "p50_seconds": float(p50),
+        "p95_seconds": float(p95),
+        "p99_seconds": float(p99),
+        "max_seconds": float(max(seconds)),
+        "rows_per_second": rows / min(seconds) if min(seconds) else None,
+        # ru_maxrss is the high-water mark of the whole process so far
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def benchmark_extract(bars: dict, timeframe: str, repeat: int, symbols_per_request: int, max_concurrency: int) -> list[float]:
+    """
+    Times the async extractor against a local stub of the Alpaca bars endpoint.
+    """
+    symbols = list(bars)
+    start_time = bars[symbols[0]][0]["t"]
+    end_time = bars[symbols[0]][-1]["t"]
+
+    async def extract(url: str) -> dict:
+        async with AsyncAlpacaApiClient(
+            api_key_id="benchmark",
+            api_secret_key="benchmark",
+            base_url=url,
+            page_limit=10000,
+            rate_limiter=TokenBucketRateLimiter(requests_per_minute=1_000_000),
+            max_concurrency=max_concurrency,
+        ) as client:
+            return await client.get_alpaca_api_data_concurrent(
+                symbols, timeframe, start_time, end_time, symbols_per_request=symbols_per_request
+            )
+
+    with StubAlpacaServer(bars, rate_limit=1_000_000) as server:
+        return time_repeats(lambda: asyncio.run(extract(server.url)), repeat)
+
+
+def benchmark_load(postgresql_client: PostgreSqlClient, df_stock, load_method: str, repeat: int, batch_size: Optional[int]) -> list[float]:
+    """
+    Times one load method into an empty benchmark table, the table is recreated before every call.
+    """
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, BENCHMARK_TABLE_NAME)
+
+    def setup():
+        postgresql_client.drop_table(BENCHMARK_TABLE_NAME)
+        postgresql_client.create_table(metadata)
+
+    return time_repeats(
+        lambda _: load(
+            df=df_stock,
+            postgresql_client=postgresql_client,
+            table=table,
+            metadata=metadata,
+            load_method=load_method,
+            batch_size=batch_size,
+        ),
+        repeat,
+        setup=setup,
+    )
+
+
+def benchmark_analysis_sql(postgresql_client: PostgreSqlClient, df_stock, repeat: int) -> dict:
+    """
+    Times the full and the incremental analysis SQL on the benchmark table.
+    """
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, BENCHMARK_TABLE_NAME)
+    postgresql_client.drop_table(BENCHMARK_TABLE_NAME)
+    postgresql_client.drop_table(BENCHMARK_ANALYSIS_TABLE_NAME)
+    load(df=df_stock, postgresql_client=postgresql_client, table=table, metadata=metadata, load_method="bulk_insert")
+
+    template_params = {"source_table_name": BENCHMARK_TABLE_NAME, "analysis_table_name": BENCHMARK_ANALYSIS_TABLE_NAME}
+    sql_path = Path(__file__).parent.parent / "assets" / "sql"
+    full = Environment(loader=FileSystemLoader(sql_path / "transform"))
+    incremental = Environment(loader=FileSystemLoader(sql_path / "incremental"))
+    since_date = str(df_stock["timestamp"].max().date())
+
+    return {
+        "analysis_sql_full": time_repeats(
+            lambda: transform_and_load_analysis_table(full, postgresql_client.engine, **template_params), repeat
+        ),
+        "analysis_sql_incremental": time_repeats(
+            lambda: transform_and_load_analysis_table(
+                incremental, postgresql_client.engine, since_date=since_date, **template_params
+            ),
+            repeat,
+        ),
+    }
+
+
+def run_benchmarks(
+    symbol_count: int,
+    bars_per_symbol: int,
+    timeframe: str = "1Day",
+    repeat: int = 5,
+    benchmarks: Optional[list[str]] = None,
+    load_methods: Optional[list[str]] = None,
+    postgresql_client: Optional[PostgreSqlClient] = None,
+    batch_size: Optional[int] = 1000,
+    symbols_per_request: int = 100,
+    max_concurrency: int = 50,
+) -> dict:
+    """
+    Runs the benchmarks on a synthetic payload.
+
+    Args:
+        symbol_count: number of symbols of the payload
+        bars_per_symbol: number of bars per symbol
+        timeframe: 1Min, 1Hour or 1Day, spacing of the generated timestamps
+        repeat: number of timed calls of each benchmark
+        benchmarks: subset of BENCHMARKS to run, all when None
+        load_methods: subset of LOAD_METHODS to time, all when None
+        postgresql_client: database of the load and analysis_sql benchmarks, they are skipped when None
+        batch_size: rows per INSERT statement of the insert, upsert and overwrite load methods
+
+    Returns:
+        The benchmark parameters and one summary per benchmark
+    """
+    benchmarks = benchmarks or BENCHMARKS
+    load_methods = load_methods or LOAD_METHODS
+
+    bars = generate_alpaca_bars(symbol_count, bars_per_symbol, timeframe)
+    df_stock_symbol = generate_stock_symbol_frame(list(bars))
+    rows = symbol_count * bars_per_symbol
+    results = []
+
+    if "extract" in benchmarks:
+        seconds = benchmark_extract(bars, timeframe, repeat, symbols_per_request, max_concurrency)
+        results.append(summarise("extract", rows, seconds))
+
+    if "convert_to_dataframe" in benchmarks:
+        seconds = time_repeats(lambda: convert_to_dataframe(bars), repeat)
+        results.append(summarise("convert_to_dataframe", rows, seconds))
+
+    if "convert_to_arrow_table" in benchmarks:
+        seconds = time_repeats(lambda: convert_to_arrow_table(bars), repeat)
+        results.append(summarise("convert_to_arrow_table", rows, seconds))
+
+    stock_bars = convert_to_arrow_table(bars)
+    if "initial_transform" in benchmarks:
+        seconds = time_repeats(lambda: initial_transform(stock_bars, df_stock_symbol), repeat)
+        results.append(summarise("initial_transform", rows, seconds))
+
+    if "transform_and_validate" in benchmarks:
+        # Comparable with initial_transform, the difference is the cost of the validation
+        seconds = time_repeats(
+            lambda: validate_bars(transform_to_arrow(stock_bars, df_stock_symbol, keep_unknown_symbols=True)), repeat
+        )
+        results.append(summarise("transform_and_validate", rows, seconds))
+
+    df_stock = initial_transform(stock_bars, df_stock_symbol)
+    if postgresql_client is not None:
+        if "load" in benchmarks:
+            for load_method in load_methods:
+                seconds = benchmark_load(postgresql_client, df_stock, load_method, repeat, batch_size)
+                results.append(summarise(f"load_{load_method}", rows, seconds))
+
+        if "analysis_sql" in benchmarks:
+            for name, seconds in benchmark_analysis_sql(postgresql_client, df_stock, repeat).items():
+                results.append(summarise(name, rows, seconds))
+
+        postgresql_client.drop_table(BENCHMARK_ANALYSIS_TABLE_NAME)
+        postgresql_client.drop_table(BENCHMARK_TABLE_NAME)
+
+    return {
+        "parameters": {
+            "symbols": symbol_count,
+            "bars_per_symbol": bars_per_symbol,
+            "timeframe": timeframe,
+            "repeat": repeat,
+            "batch_size": batch_size,
+        },
+        "benchmarks": results,
+    }
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float = 0.2) -> list[dict]:
+    """
+    Compares the throughput of every benchmark with the baseline.
+
+    Returns:
+        name, rows_per_second, baseline_rows_per_second, change (fraction, positive is faster)
+        and regression (slower than the baseline by more than `tolerance`) of each benchmark in both
+    """
+    baseline_benchmarks = {benchmark["name"]: benchmark for benchmark in baseline["benchmarks"]}
+    comparison = []
+    for benchmark in results["benchmarks"]:
+        baseline_benchmark = baseline_benchmarks.get(benchmark["name"])
+        if baseline_benchmark is None or not baseline_benchmark["rows_per_second"]:
+            continue
+        change = benchmark["rows_per_second"] / baseline_benchmark["rows_per_second"] - 1
+        comparison.append(
+            {
+                "name": benchmark["name"],
+                "rows_per_second": benchmark["rows_per_second"],
+                "baseline_rows_per_second": baseline_benchmark["rows_per_second"],
+                "change": change,
+                "regression": change < -tolerance,
+            }
+        )
+    return comparison
+
+
+def print_report(results: dict, comparison: Optional[list[dict]] = None) -> None:
+    changes = {row["name"]: row for row in comparison or []}
+    print(
+        f"{'benchmark':<26} {'rows':>12} {'p50 s':>9} {'p95 s':>9} {'p99 s':>9} "
+        f"{'rows/sec':>14} {'peak RSS MB':>12} {'vs baseline':>12}"
+    )
+    for benchmark in results["benchmarks"]:
+        change = changes.get(benchmark["name"])
+        change_text = f"{change['change']:+.1%}{' !' if change['regression'] else ''}" if change else "-"
+        print(
+            f"{benchmark['name']:<26} {benchmark['rows']:>12,} {benchmark['p50_seconds']:>9.3f} "
+            f"{benchmark['p95_seconds']:>9.3f} {benchmark['p99_seconds']:>9.3f} "
+            f"{benchmark['rows_per_second']:>14,.0f} {benchmark['peak_rss_bytes'] / 2**20:>12,.0f} {change_text:>12}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stock bars ETL hot paths on synthetic data")
+    parser.add_argument("--profile", choices=PROFILES, default="small")
+    parser.add_argument("--symbols", type=int, help="overrides the symbols of the profile")
+    parser.add_argument("--bars-per-symbol", type=int, help="overrides the bars per symbol of the profile")
+    parser.add_argument("--timeframe", choices=["1Min", "1Hour", "1Day"], help="overrides the timeframe of the profile")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS)
+    parser.add_argument("--load-methods", nargs="+", choices=LOAD_METHODS)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--no-database", action="store_true", help="skip the load and analysis_sql benchmarks")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE_PATH), help="baseline json to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown counted as a regression")
+    parser.add_argument("--output", help="also write the results as json to this path")
+    args = parser.parse_args()
+
+    profile = PROFILES[args.profile]
+    postgresql_client = None
+    if not args.no_database:
+        load_dotenv()
+        postgresql_client = PostgreSqlClient(
+            username=os.getenv("DB_USERNAME"),
+            password=os.getenv("DB_PASSWORD"),
+            server_name=os.getenv("SERVER_NAME"),
+            database_name=os.getenv("DATABASE_NAME"),
+            port=int(os.getenv("PORT", "5432")),
+        )
+
+    results = run_benchmarks(
+        symbol_count=args.symbols or profile["symbols"],
+        bars_per_symbol=args.bars_per_symbol or profile["bars_per_symbol"],
+        timeframe=args.timeframe or profile["timeframe"],
+        repeat=args.repeat,
+        benchmarks=args.benchmarks,
+        load_methods=args.load_methods,
+        postgresql_client=postgresql_client,
+        batch_size=args.batch_size,
+    )
+    results["profile"] = args.profile
+
+    comparison = None
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2) + "\n")
+    elif baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text())
+        if baseline["parameters"] == results["parameters"]:
+            comparison = compare_to_baseline(results, baseline, args.tolerance)
+        else:
+            print(f"Baseline {baseline_path} was recorded with {baseline['parameters']}, not comparing")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+
+    print_report(results, comparison)
+
+    if comparison and any(row["regression"] for row in comparison):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import base64
+import bisect
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+
+def generate_bars(symbols: list[str], start_date: str, days: int) -> dict:
+    """
+    Generates Alpaca-shaped daily bars for each symbol, one bar per day.
+    """
+    start = datetime.fromisoformat(start_date).replace(hour=4, tzinfo=timezone.utc)
+    bars = {}
+    for symbol_index, symbol in enumerate(symbols):
+        bars[symbol] = []
+        for day in range(days):
+            price = 100.0 + symbol_index + day * 0.5
+            bars[symbol].append({
+                "c": price + 0.25,
+                "h": price + 1.0,
+                "l": price - 1.0,
+                "n": 1000 + day,
+                "o": price,
+                "t": (start + timedelta(days=day)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "v": 100000 + day,
+                "vw": price + 0.1,
+            })
+    return bars
+
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+class StubAlpacaServer:
+    """
+    A local HTTP server serving paginated bars the same way the Alpaca bars endpoint does:
+    bars are sorted by symbol then timestamp and `limit` applies across all symbols of a page.
+    """
+
+    def __init__(self, bars: dict, failures: Optional[list[int]] = None, rate_limit: int = 200, retry_after: str = "0.05"):
+        self.bars = bars
+        # Parsed timestamps per symbol so a request only bisects instead of scanning every bar
+        self._times = {symbol: [_parse_time(record["t"]) for record in records] for symbol, records in bars.items()}
+        self.failures = list(failures or [])
+        self.rate_limit = rate_limit
+        # Retry-After of the injected 429s, delay seconds or an HTTP-date
+        self.retry_after = retry_after
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v2/stocks/bars"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handle(self, query: dict) -> tuple[int, dict]:
+        symbols = query["symbols"][0].split(",")
+        start = _parse_time(query["start"][0])
+        end = _parse_time(query["end"][0]) if "end" in query else None
+        limit = int(query.get("limit", ["1000"])[0])
+        offset = int(base64.b64decode(query["page_token"][0])) if "page_token" in query else 0
+
+        # Index range of the matching bars of each symbol, bars are sorted by timestamp
+        ranges = []
+        for symbol in sorted(symbols):
+            times = self._times.get(symbol, [])
+            low = bisect.bisect_left(times, start)
+            high = bisect.bisect_right(times, end) if end is not None else len(times)
+            if high > low:
+                ranges.append((symbol, low, high))
+        total = sum(high - low for _, low, high in ranges)
+
+        # Take `limit` bars starting at `offset` across the symbols
+        page = []
+        skip = offset
+        for symbol, low, high in ranges:
+            if skip >= high - low:
+                skip -= high - low
+                continue
+            take = min(high, low + skip + limit - len(page))
+            page.extend((symbol, record) for record in self.bars[symbol][low + skip : take])
+            skip = 0
+            if len(page) == limit:
+                break
+
+        bars = {}
+        for symbol, record in page:
+            bars.setdefault(symbol, []).append(dict(record))
+
+        next_offset = offset + limit
+        next_page_token = (
+            base64.b64encode(str(next_offset).encode()).decode() if next_offset < total else None
+        )
+        return 200, {"bars": bars, "next_page_token": next_page_token}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.request_count += 1
+                    failure = stub.failures.pop(0) if stub.failures else None
+
+                if failure is not None:
+                    status, body = failure, {"message": "injected failure"}
+                else:
+                    status, body = stub._handle(parse_qs(urlparse(self.path).query))
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("X-RateLimit-Limit", str(stub.rate_limit))
+                self.send_header("X-RateLimit-Remaining", str(stub.rate_limit))
+                if status == 429:
+                    self.send_header("Retry-After", stub.retry_after)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+
+def generate_stock_bars_frame(symbol_count: int, bars_per_symbol: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Generates a random walk of daily bars shaped like the output of `initial_transform`.
+    """
+    rng = np.random.default_rng(seed)
+    rows = symbol_count * bars_per_symbol
+
+    symbols = np.array([f"SYM{i:05d}" for i in range(symbol_count)], dtype=object)
+    returns = rng.normal(0, 0.02, size=(symbol_count, bars_per_symbol))
+    close = 100 * np.exp(np.cumsum(returns, axis=1)).ravel()
+    spread = np.abs(rng.normal(0, 0.01, size=rows)) * close
+    timestamps = pd.date_range("2000-01-03 05:00", periods=bars_per_symbol, freq="D", tz="UTC")
+
+    return pd.DataFrame(
+        {
+            "stock": np.repeat(symbols, bars_per_symbol),
+            "company": np.repeat(np.array([f"Company {symbol}" for symbol in symbols], dtype=object), bars_per_symbol),
+            "timestamp": np.tile(timestamps, symbol_count),
+            "open": close - spread / 2,
+            "high": close + spread,
+            "low": close - spread,
+            "close": close,
+            "volume": rng.integers(1_000, 10_000_000, size=rows),
+            "volume_weighted_avg_price": close - spread / 4,
+            "number_of_trades": rng.integers(10, 100_000, size=rows),
+        }
+    )
+
+
+TIMEFRAME_FREQUENCIES = {"1Min": "min", "1Hour": "H", "1Day": "D"}
+
+
+def generate_alpaca_bars(symbol_count: int, bars_per_symbol: int, timeframe: str = "1Day", seed: int = 0) -> dict:
+    """
+    Generates a random walk of bars shaped like the payload `extract_alpaca_data_for_ranges` returns:
+    a dict of symbol -> list of {"t", "o", "h", "l", "c", "v", "vw", "n"} records.
+    """
+    df = generate_stock_bars_frame(symbol_count, bars_per_symbol, seed)
+    timestamps = pd.date_range(
+        "2000-01-03 14:30", periods=bars_per_symbol, freq=TIMEFRAME_FREQUENCIES[timeframe], tz="UTC"
+    ).strftime("%Y-%m-%dT%H:%M:%SZ").tolist()
+
+    columns = {
+        "o": df["open"].to_numpy().reshape(symbol_count, bars_per_symbol).tolist(),
+        "h": df["high"].to_numpy().reshape(symbol_count, bars_per_symbol).tolist(),
+        "l": df["low"].to_numpy().reshape(symbol_count, bars_per_symbol).tolist(),
+        "c": df["close"].to_numpy().reshape(symbol_count, bars_per_symbol).tolist(),
+        "v": df["volume"].to_numpy().reshape(symbol_count, bars_per_symbol).tolist(),
+        "vw": df["volume_weighted_avg_price"].to_numpy().reshape(symbol_count, bars_per_symbol).tolist(),
+        "n": df["number_of_trades"].to_numpy().reshape(symbol_count, bars_per_symbol).tolist(),
+    }
+    symbols = df["stock"].to_numpy()[::bars_per_symbol]
+
+    return {
+        symbol: [
+            {"c": c, "h": h, "l": l, "n": n, "o": o, "t": t, "v": v, "vw": vw}
+            for t, o, h, l, c, v, vw, n in zip(
+                timestamps, columns["o"][i], columns["h"][i], columns["l"][i], columns["c"][i],
+                columns["v"][i], columns["vw"][i], columns["n"][i]
+            )
+        ]
+        for i, symbol in enumerate(symbols)
+    }
+
+
+def generate_stock_symbol_frame(symbols: list[str]) -> pd.DataFrame:
+    """
+    Generates the stock symbol csv contents (Company, Symbol, Exchange) for the given symbols.
+    """
+    return pd.DataFrame(
+        {
+            "Company": [f"Company {symbol}" for symbol in symbols],
+            "Symbol": list(symbols),
+            "Exchange": "NASDAQ",
+        }
+    )
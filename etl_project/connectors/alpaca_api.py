@@ -1,12 +1,82 @@
+import copy
+import json
+import math
+import random
+import threading
+import time
+import pyarrow as pa
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Iterator, Optional, Union
+from etl_project.connectors.rate_limiter import TokenBucketRateLimiter
+from etl_project.connectors.response_cache import ResponseCache
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Columns of an Alpaca bar, in the order the API returns them
+BAR_SCHEMA = pa.schema(
+    [
+        ("c", pa.float64()),
+        ("h", pa.float64()),
+        ("l", pa.float64()),
+        ("n", pa.int64()),
+        ("o", pa.float64()),
+        ("t", pa.string()),
+        ("v", pa.int64()),
+        ("vw", pa.float64()),
+    ]
+)
+
+
+class RequestStats:
+    """
+    Thread safe counters of the requests sent and bytes received, shared by clients to measure a run.
+    Every request recorded is also recorded by `parent`, e.g. the total of the process when each
+    pipeline counts its own requests.
+    """
+
+    def __init__(self, parent: Optional["RequestStats"] = None):
+        self.request_count = 0
+        self.bytes_received = 0
+        self.parent = parent
+        self._lock = threading.Lock()
+
+    def record(self, bytes_received: int) -> None:
+        with self._lock:
+            self.request_count += 1
+            self.bytes_received += bytes_received
+        if self.parent is not None:
+            self.parent.record(bytes_received)
 
 # Naming an object of class that talks to a server
 class AlpacaApiClient: # Talks to server
 
-    def __init__(self, api_key_id, api_secret_key):
-        self.base_url = "https://data.alpaca.markets/v2/stocks/bars"
-        
+    def __init__(self,
+            api_key_id,
+            api_secret_key,
+            base_url: str = "https://data.alpaca.markets/v2/stocks/bars",
+            page_limit: int = 1000,
+            rate_limiter: Optional[TokenBucketRateLimiter] = None,
+            request_stats: Optional[RequestStats] = None,
+            response_cache: Optional[ResponseCache] = None,
+            session: Optional[requests.Session] = None,
+            pool_size: int = 10,
+            max_retries: int = 5,
+            backoff_base_seconds: float = 0.5,
+            backoff_max_seconds: float = 30.0
+            ):
+        self.base_url = base_url
+        self.page_limit = page_limit
+        self.rate_limiter = rate_limiter or TokenBucketRateLimiter()
+        self.request_stats = request_stats or RequestStats()
+        self.response_cache = response_cache
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+
         if api_key_id is None:
             raise Exception("API key cannot be set to None.")
         self.api_key_id = api_key_id
@@ -15,26 +85,267 @@ class AlpacaApiClient: # Talks to server
             raise Exception("API secret key cannot be set to None.")
         self.api_secret_key = api_secret_key
 
+        # Keep-alive connections are reused across requests and threads
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+
+    def _get_page(self, params: dict) -> dict:
+        """
+        Sends a single request to the bars endpoint and returns the decoded json body,
+        served from the response cache when it holds the request.
+        """
+        if self.response_cache is not None:
+            cached = self.response_cache.get(self.base_url, params)
+            if cached is not None:
+                return json.loads(cached)
+
+        headers = {"APCA-API-KEY-ID": self.api_key_id, "APCA-API-SECRET-KEY": self.api_secret_key}
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                response = self.session.get(self.base_url, params=params, headers=headers)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff_seconds(attempt))
+                continue
+
+            self.rate_limiter.update_from_headers(response.headers)
+            self.request_stats.record(len(response.content))
+
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                retry_after_seconds = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after_seconds is not None:
+                    self.rate_limiter.block_for(retry_after_seconds)
+                else:
+                    time.sleep(self.backoff_seconds(attempt))
+                continue
+
+            body = response.json() if response.status_code == 200 else {}
+            if body.get("bars") is not None:
+                if self.response_cache is not None:
+                    self.response_cache.put(self.base_url, params, response.content)
+                return body
+            raise Exception(
+                f"Failed to extract data from Alpaca Market API. Status Code: {response.status_code}. Response: {response.text}"
+            )
+
+    def with_request_stats(self, request_stats: RequestStats) -> "AlpacaApiClient":
+        """
+        Returns a client recording its requests in `request_stats`, it shares the session,
+        rate limiter and response cache of this one.
+        """
+        client = copy.copy(self)
+        client.request_stats = request_stats
+        return client
+
+    def backoff_seconds(self, attempt: int) -> float:
+        """
+        Exponential backoff with full jitter for the given retry attempt.
+        """
+        return jittered_backoff(attempt, self.backoff_base_seconds, self.backoff_max_seconds)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def get_alpaca_api_data(self,
-            symbols: str, 
-            timeframe: str, 
+            symbols: Union[str, list[str]],
+            timeframe: str,
             start_time: str,
             end_time: Optional[str] = None
             ) -> dict:
-        
-        base_url = f"{self.base_url}?limit=1000&adjustment=raw&feed=sip&sort=asc"
-        params = {"symbols": symbols, "timeframe": timeframe, "start": start_time}
+        """
+        Extracts bars for the given symbols, following `next_page_token` until every page is read.
 
-        if end_time:
-            params["end"] = end_time
+        Returns:
+            A dict of symbol -> list of bars
+        """
+        bars = {}
+        for page in self.iter_alpaca_api_pages(symbols, timeframe, start_time, end_time):
+            for symbol, records in page.items():
+                bars.setdefault(symbol, []).extend(records)
+        return bars
 
-        headers = {"APCA-API-KEY-ID": self.api_key_id, "APCA-API-SECRET-KEY": self.api_secret_key}
-        response = requests.get(base_url, params=params, headers=headers)
-        
-        if response.status_code == 200 and response.json().get("bars") is not None:
-            return response.json().get("bars")
-        else: 
-            raise Exception(
-                f"Failed to extract data from Alpaca Market API. Status Code: {response.status_code}. Response: {response.text}"
-        )
+    def iter_alpaca_api_pages(self,
+            symbols: Union[str, list[str]],
+            timeframe: str,
+            start_time: str,
+            end_time: Optional[str] = None
+            ) -> Iterator[dict]:
+        """
+        Yields the bars of each page (symbol -> list of bars) as soon as it is received,
+        so callers can process a large range without holding every page in memory.
+        """
+        params = build_bars_params(symbols, timeframe, start_time, end_time, self.page_limit)
+
+        while True:
+            page = self._get_page(params)
+            yield page["bars"]
+
+            next_page_token = page.get("next_page_token")
+            if not next_page_token:
+                return
+            params["page_token"] = next_page_token
+
+    def get_alpaca_api_data_concurrent(self,
+            symbols: Union[str, list[str]],
+            timeframe: str,
+            start_time: str,
+            end_time: Optional[str] = None,
+            symbols_per_request: int = 100,
+            date_window_days: Optional[int] = None,
+            max_workers: int = 4
+            ) -> dict:
+        """
+        Splits the request into symbol chunks and date windows, runs them on a thread pool
+        and merges the pages back into the same shape `get_alpaca_api_data` returns.
+
+        Args:
+            symbols: comma separated string or list of stock symbols
+            timeframe: bar timeframe e.g. 1Day
+            start_time: start date or RFC-3339 timestamp
+            end_time: end date or RFC-3339 timestamp, defaults to now
+            symbols_per_request: maximum number of symbols sent in a single request
+            date_window_days: size of each date window, the range is not split when None
+            max_workers: maximum number of requests in flight
+        """
+        if isinstance(symbols, str):
+            symbols = symbols.split(",")
+        symbol_chunks = chunk_symbols(symbols, symbols_per_request)
+        windows = split_date_range(start_time, end_time, date_window_days)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(self.get_alpaca_api_data, symbol_chunk, timeframe, window_start, window_end)
+                for symbol_chunk in symbol_chunks
+                for window_start, window_end in windows
+            ]
+            return merge_bars([future.result() for future in futures])
+
+
+def jittered_backoff(attempt: int, base_seconds: float, max_seconds: float) -> float:
+    """
+    Exponential backoff with full jitter: a random wait between 0 and base * 2^attempt, capped at max.
+    """
+    return random.uniform(0, min(max_seconds, base_seconds * 2 ** attempt))
+
+
+def parse_retry_after(value: Optional[str], now: Optional[datetime] = None) -> Optional[float]:
+    """
+    Returns the seconds to wait of a Retry-After header, given either as delay seconds or as an
+    HTTP-date, e.g. "Wed, 21 Oct 2015 07:28:00 GMT". None when the header is missing or invalid.
+    """
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        return max(seconds, 0.0) if math.isfinite(seconds) else None
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - (now or datetime.now(timezone.utc))).total_seconds(), 0.0)
+
+
+def build_bars_params(symbols: Union[str, list[str]], timeframe: str, start_time: str, end_time: Optional[str], page_limit: int) -> dict:
+    """
+    Builds the query parameters of a bars request.
+    """
+    if not isinstance(symbols, str):
+        symbols = ",".join(symbols)
+
+    params = {
+        "symbols": symbols,
+        "timeframe": timeframe,
+        "start": start_time,
+        "limit": page_limit,
+        "adjustment": "raw",
+        "feed": "sip",
+        "sort": "asc",
+    }
+    if end_time:
+        params["end"] = end_time
+    return params
+
+
+def chunk_symbols(symbols: list[str], symbols_per_request: int) -> list[list[str]]:
+    """
+    Splits a list of symbols into chunks of at most `symbols_per_request` symbols.
+    """
+    symbols = [symbol.strip() for symbol in symbols if symbol.strip()]
+    return [
+        symbols[i : i + symbols_per_request]
+        for i in range(0, len(symbols), symbols_per_request)
+    ]
+
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _format_time(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def split_date_range(
+        start_time: str,
+        end_time: Optional[str] = None,
+        date_window_days: Optional[int] = None
+    ) -> list[tuple[str, Optional[str]]]:
+    """
+    Splits [start_time, end_time] into consecutive windows of `date_window_days` days.
+
+    Neighbouring windows share their boundary timestamp so no bar falls between two windows,
+    bars returned twice are removed by `merge_bars`.
+    """
+    if not date_window_days:
+        return [(start_time, end_time)]
+
+    start = _parse_time(start_time)
+    end = _parse_time(end_time) if end_time else datetime.now(timezone.utc)
+    step = timedelta(days=date_window_days)
+
+    windows = []
+    window_start = start
+    while window_start < end:
+        window_end = min(window_start + step, end)
+        windows.append((_format_time(window_start), _format_time(window_end)))
+        window_start = window_end
+
+    return windows or [(start_time, end_time)]
+
+
+def merge_bars(results: list[dict]) -> dict:
+    """
+    Merges several symbol -> bars dicts into one, sorted by timestamp and without duplicate bars.
+    """
+    merged = {}
+    for result in results:
+        for symbol, records in result.items():
+            merged.setdefault(symbol, {}).update({record["t"]: record for record in records})
 
+    return {
+        symbol: [records[t] for t in sorted(records)]
+        for symbol, records in merged.items()
+    }
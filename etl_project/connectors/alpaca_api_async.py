@@ -0,0 +1,255 @@
+import asyncio
+import copy
+import json
+import threading
+import aiohttp
+from typing import Awaitable, Optional, TypeVar, Union
+from etl_project.connectors.alpaca_api import (
+    RETRYABLE_STATUS_CODES,
+    RequestStats,
+    build_bars_params,
+    chunk_symbols,
+    jittered_backoff,
+    merge_bars,
+    parse_retry_after,
+    split_date_range,
+)
+from etl_project.connectors.rate_limiter import TokenBucketRateLimiter
+from etl_project.connectors.response_cache import ResponseCache
+
+T = TypeVar("T")
+
+
+class AsyncAlpacaApiClient:
+    """
+    asyncio counterpart of `AlpacaApiClient`.
+
+    All requests share one aiohttp session and run on the same event loop, a semaphore
+    bounds how many requests are in flight at once. Use it as an async context manager.
+    """
+
+    def __init__(self,
+            api_key_id,
+            api_secret_key,
+            base_url: str = "https://data.alpaca.markets/v2/stocks/bars",
+            page_limit: int = 1000,
+            rate_limiter: Optional[TokenBucketRateLimiter] = None,
+            request_stats: Optional[RequestStats] = None,
+            response_cache: Optional[ResponseCache] = None,
+            max_concurrency: int = 50,
+            max_retries: int = 5,
+            backoff_base_seconds: float = 0.5,
+            backoff_max_seconds: float = 30.0
+            ):
+        self.base_url = base_url
+        self.page_limit = page_limit
+        self.rate_limiter = rate_limiter or TokenBucketRateLimiter()
+        self.request_stats = request_stats or RequestStats()
+        self.response_cache = response_cache
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+
+        if api_key_id is None:
+            raise Exception("API key cannot be set to None.")
+        self.api_key_id = api_key_id
+
+        if api_secret_key is None:
+            raise Exception("API secret key cannot be set to None.")
+        self.api_secret_key = api_secret_key
+
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+            headers={"APCA-API-KEY-ID": self.api_key_id, "APCA-API-SECRET-KEY": self.api_secret_key},
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def _acquire_rate_limit(self) -> None:
+        wait_seconds = self.rate_limiter.wait_time()
+        while wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
+            wait_seconds = self.rate_limiter.wait_time()
+
+    async def _get_page(self, params: dict) -> dict:
+        """
+        Sends a single request to the bars endpoint and returns the decoded json body.
+        """
+        # aiohttp only accepts str, int and float query values
+        params = {key: str(value) for key, value in params.items()}
+
+        if self.response_cache is not None:
+            cached = self.response_cache.get(self.base_url, params)
+            if cached is not None:
+                return json.loads(cached)
+
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                await self._acquire_rate_limit()
+                try:
+                    async with self.session.get(self.base_url, params=params) as response:
+                        self.rate_limiter.update_from_headers(response.headers)
+                        status_code = response.status
+                        retry_after_seconds = parse_retry_after(response.headers.get("Retry-After"))
+                        content = await response.read()
+                        self.request_stats.record(len(content))
+                        text = content.decode(response.get_encoding())
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(jittered_backoff(attempt, self.backoff_base_seconds, self.backoff_max_seconds))
+                    continue
+
+            if status_code in RETRYABLE_STATUS_CODES and attempt < self.max_retries:
+                if retry_after_seconds is not None:
+                    self.rate_limiter.block_for(retry_after_seconds)
+                else:
+                    await asyncio.sleep(jittered_backoff(attempt, self.backoff_base_seconds, self.backoff_max_seconds))
+                continue
+
+            # Decoding happens outside the semaphore so the next request can already be sent
+            body = json.loads(text) if status_code == 200 else {}
+            if body.get("bars") is not None:
+                if self.response_cache is not None:
+                    self.response_cache.put(self.base_url, params, content)
+                return body
+            raise Exception(
+                f"Failed to extract data from Alpaca Market API. Status Code: {status_code}. Response: {text}"
+            )
+
+    def with_request_stats(self, request_stats: RequestStats) -> "AsyncAlpacaApiClient":
+        """
+        Returns a client recording its requests in `request_stats`, it shares the session,
+        concurrency limit, rate limiter and response cache of this one once entered.
+        """
+        client = copy.copy(self)
+        client.request_stats = request_stats
+        return client
+
+    async def get_alpaca_api_data(self,
+            symbols: Union[str, list[str]],
+            timeframe: str,
+            start_time: str,
+            end_time: Optional[str] = None
+            ) -> dict:
+        """
+        Extracts bars for the given symbols, following `next_page_token` until every page is read.
+
+        Returns:
+            A dict of symbol -> list of bars
+        """
+        params = build_bars_params(symbols, timeframe, start_time, end_time, self.page_limit)
+
+        bars = {}
+        while True:
+            page = await self._get_page(params)
+            for symbol, records in page["bars"].items():
+                bars.setdefault(symbol, []).extend(records)
+
+            next_page_token = page.get("next_page_token")
+            if not next_page_token:
+                return bars
+            params["page_token"] = next_page_token
+
+    async def get_alpaca_api_data_concurrent(self,
+            symbols: Union[str, list[str]],
+            timeframe: str,
+            start_time: str,
+            end_time: Optional[str] = None,
+            symbols_per_request: int = 100,
+            date_window_days: Optional[int] = None
+            ) -> dict:
+        """
+        Splits the request into symbol chunks and date windows, runs every piece as a task on
+        the event loop and merges the results into the shape `get_alpaca_api_data` returns.
+
+        Args:
+            symbols: comma separated string or list of stock symbols
+            timeframe: bar timeframe e.g. 1Day
+            start_time: start date or RFC-3339 timestamp
+            end_time: end date or RFC-3339 timestamp, defaults to now
+            symbols_per_request: maximum number of symbols sent in a single request
+            date_window_days: size of each date window, the range is not split when None
+        """
+        if isinstance(symbols, str):
+            symbols = symbols.split(",")
+        windows = split_date_range(start_time, end_time, date_window_days)
+
+        tasks = [
+            asyncio.create_task(self.get_alpaca_api_data(symbol_chunk, timeframe, window_start, window_end))
+            for symbol_chunk in chunk_symbols(symbols, symbols_per_request)
+            for window_start, window_end in windows
+        ]
+        try:
+            return merge_bars(await asyncio.gather(*tasks))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class SharedAsyncAlpacaApiClient:
+    """
+    Keeps one `AsyncAlpacaApiClient` open on an event loop in a background thread, so pipelines
+    running in several threads share its aiohttp connection pool, its limit on requests in flight
+    and its rate limiter instead of each opening their own.
+
+    Usage:
+        with SharedAsyncAlpacaApiClient(api_key_id, api_secret_key, rate_limiter=rate_limiter) as shared_client:
+            bars = shared_client.run(shared_client.client.get_alpaca_api_data_concurrent(["AAPL"], "1Day", "2025-09-01"))
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.client = AsyncAlpacaApiClient(*args, **kwargs)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        # Pipelines start the client from their own threads, only the first one opens the loop and session
+        self._lock = threading.Lock()
+
+    def start(self) -> "SharedAsyncAlpacaApiClient":
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="alpaca-api-loop", daemon=True)
+                thread.start()
+                asyncio.run_coroutine_threadsafe(self.client.__aenter__(), loop).result()
+                self._loop, self._thread = loop, thread
+        return self
+
+    def client_for(self, request_stats: RequestStats) -> AsyncAlpacaApiClient:
+        """
+        Returns the shared client recording its requests in `request_stats`, e.g. those of one pipeline.
+        """
+        # The session only exists once started, the returned client shares it
+        self.start()
+        return self.client.with_request_stats(request_stats)
+
+    def run(self, coroutine: Awaitable[T]) -> T:
+        """
+        Runs the coroutine on the shared event loop and blocks the calling thread until it is done.
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self.client.__aexit__(None, None, None), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
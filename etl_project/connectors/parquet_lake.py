@@ -0,0 +1,191 @@
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from etl_project.connectors.alpaca_api import BAR_SCHEMA
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, partitions are then only locked within the process
+    fcntl = None
+
+# Partition writes of the process are serialised by one of these locks, picked by the partition path,
+# so every client of the process writing to the same lake takes the same lock for a partition
+_PARTITION_LOCKS = [threading.Lock() for _ in range(64)]
+
+
+class ParquetLakeClient:
+    """
+    A local raw-data lake of Alpaca bars stored as Parquet.
+
+    Bars are partitioned hive style by timeframe, symbol and UTC date:
+        <root_path>/timeframe=1Day/symbol=AAPL/date=2025-09-02/bars.parquet
+    Each file holds the raw API columns (c, h, l, n, o, t, v, vw) of one symbol and day,
+    the symbol is only stored in the path.
+    """
+
+    file_name = "bars.parquet"
+
+    def __init__(self, root_path: str, compression: str = "zstd", max_workers: int = 8):
+        self.root_path = Path(root_path)
+        self.compression = compression
+        self.max_workers = max_workers
+
+    def _partition_path(self, timeframe: str, symbol: str, date: str) -> Path:
+        return self.root_path / f"timeframe={timeframe}" / f"symbol={symbol}" / f"date={date}"
+
+    @contextmanager
+    def _lock_partition(self, path: Path) -> Iterator[None]:
+        """
+        Holds the partition for a read-merge-replace: a thread lock against the other threads of the
+        process, and an exclusive lock on the `.lock` file of the partition against other processes.
+        """
+        with _PARTITION_LOCKS[hash(str(path.resolve())) % len(_PARTITION_LOCKS)]:
+            if fcntl is None:
+                yield
+                return
+            with open(path / f".{self.file_name}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_partition(self, path: Path, table: pa.Table) -> None:
+        """
+        Merges the bars with the ones already in the partition and replaces the file atomically:
+        the new file is written next to the old one and renamed over it, so readers never see a partial file.
+        The partition is locked from the read to the rename, concurrent writers of the same partition
+        (pipelines, backfill workers or processes) merge one after the other instead of losing bars.
+        """
+        path.mkdir(parents=True, exist_ok=True)
+        file_path = path / self.file_name
+        with self._lock_partition(path):
+            if file_path.exists():
+                table = pa.concat_tables([pq.read_table(file_path).cast(BAR_SCHEMA), table.cast(BAR_SCHEMA)])
+
+                # A bar extracted again replaces the stored one, a partition holds at most a day of bars
+                timestamps = table.column("t").to_pylist()
+                last_index = {timestamp: index for index, timestamp in enumerate(timestamps)}
+                table = table.take(sorted(last_index.values(), key=timestamps.__getitem__))
+
+            tmp_path = path / f".{self.file_name}.{uuid.uuid4().hex}.tmp"
+            try:
+                pq.write_table(table, tmp_path, compression=self.compression)
+                os.replace(tmp_path, file_path)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+
+    def write_bars(self, table: pa.Table, timeframe: str) -> int:
+        """
+        Writes bars to their symbol and date partitions, several partitions at a time.
+
+        Args:
+            table: output of `convert_to_arrow_table`
+            timeframe: bar timeframe e.g. 1Day
+
+        Returns:
+            The number of partitions written
+        """
+        if table.num_rows == 0:
+            return 0
+
+        # Sort once so every partition is a contiguous, zero-copy slice of the table
+        symbol = table.column("symbol").cast(pa.string())
+        table = table.drop(["symbol"]).append_column("symbol", symbol)
+        table = table.take(pc.sort_indices(table, sort_keys=[("symbol", "ascending"), ("t", "ascending")]))
+
+        symbols = table.column("symbol").to_numpy(zero_copy_only=False)
+        dates = pc.utf8_slice_codeunits(table.column("t"), 0, 10).to_numpy(zero_copy_only=False)
+        starts = np.flatnonzero(np.concatenate([[True], (symbols[1:] != symbols[:-1]) | (dates[1:] != dates[:-1])]))
+        ends = np.append(starts[1:], table.num_rows)
+
+        bars = table.drop(["symbol"])
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(
+                    self._write_partition,
+                    self._partition_path(timeframe, symbols[start], dates[start]),
+                    bars.slice(start, end - start),
+                )
+                for start, end in zip(starts, ends)
+            ]
+            for future in futures:
+                future.result()
+        return len(starts)
+
+    def list_partitions(self,
+            timeframe: str,
+            symbols: Optional[list[str]] = None,
+            start_date: Optional[str] = None,
+            end_date: Optional[str] = None
+            ) -> list[tuple[str, str]]:
+        """
+        Lists the (symbol, date) partitions of the timeframe, pruned by symbol and date range
+        from the directory names alone.
+
+        Args:
+            timeframe: bar timeframe e.g. 1Day
+            symbols: only these symbols, all when None
+            start_date: first date (YYYY-MM-DD or RFC-3339 timestamp) included, no lower bound when None
+            end_date: last date included, no upper bound when None
+        """
+        timeframe_path = self.root_path / f"timeframe={timeframe}"
+        if not timeframe_path.exists():
+            return []
+
+        start_date = start_date[:10] if start_date else None
+        end_date = end_date[:10] if end_date else None
+        partitions = []
+        for symbol_path in sorted(timeframe_path.glob("symbol=*")):
+            symbol = symbol_path.name.split("=", 1)[1]
+            if symbols is not None and symbol not in symbols:
+                continue
+            for date_path in sorted(symbol_path.glob("date=*")):
+                date = date_path.name.split("=", 1)[1]
+                if (start_date is None or date >= start_date) and (end_date is None or date <= end_date):
+                    partitions.append((symbol, date))
+        return partitions
+
+    def iter_bars(self,
+            timeframe: str,
+            symbols: Optional[list[str]] = None,
+            start_date: Optional[str] = None,
+            end_date: Optional[str] = None
+            ) -> Iterator[pa.Table]:
+        """
+        Reads the partitions of the range one symbol at a time.
+
+        Yields:
+            A table per symbol in the layout `convert_to_arrow_table` returns
+        """
+        partitions = {}
+        for symbol, date in self.list_partitions(timeframe, symbols, start_date, end_date):
+            partitions.setdefault(symbol, []).append(date)
+
+        for symbol, dates in partitions.items():
+            table = pa.concat_tables(
+                pq.read_table(self._partition_path(timeframe, symbol, date) / self.file_name) for date in dates
+            )
+            yield table.append_column("symbol", pa.array([symbol] * table.num_rows, pa.string()))
+
+    def read_bars(self,
+            timeframe: str,
+            symbols: Optional[list[str]] = None,
+            start_date: Optional[str] = None,
+            end_date: Optional[str] = None
+            ) -> Optional[pa.Table]:
+        """
+        Reads the partitions of the range into a single table, None when no partition matches.
+        """
+        tables = list(self.iter_bars(timeframe, symbols, start_date, end_date))
+        return pa.concat_tables(tables) if tables else None
@@ -1,7 +1,12 @@
+import re
+import time
 import pandas as pd
+from loguru import logger
+from typing import Callable, Iterator, Optional, Union
 from sqlalchemy.engine import URL
-from sqlalchemy import create_engine, Table, MetaData
+from sqlalchemy import and_, create_engine, func, or_, select, Table, MetaData
 from sqlalchemy.dialects import postgresql
+from etl_project.connectors.schema_registry import SchemaRegistry, get_schema_registry
 
 class PostgreSqlClient:
     """
@@ -13,7 +18,9 @@ class PostgreSqlClient:
                  password: str, 
                  server_name: str, 
                  database_name: str, 
-                 port: int =5432):
+                 port: int =5432,
+                 pool_size: int = 5,
+                 max_overflow: int = 10):
         self.username = username
         self.password = password
         self.server_name = server_name
@@ -30,30 +37,109 @@ class PostgreSqlClient:
             database=self.database_name,
         )
 
-        self.engine = create_engine(connection_url)
+        # Every pipeline and node of the process borrows its connections from this pool
+        self.engine = create_engine(connection_url, pool_size=pool_size, max_overflow=max_overflow)
 
-    def write_to_database(self, table: Table, metadata: MetaData, data = pd.DataFrame) -> None:
+    @property
+    def schema_registry(self) -> SchemaRegistry:
+        return get_schema_registry(self.engine)
 
-        key_columns = [
-            pk_column.name for pk_column in table.primary_key.columns.values()
-        ]
+    def write_to_database(self, table: Table, metadata: MetaData, data = pd.DataFrame, batch_size: Optional[int] = None, commit_per: str = "run") -> list[dict]:
 
-        metadata.create_all(self.engine)  # creates table if it does not exist
+        self.schema_registry.ensure(metadata)  # creates table if it does not exist
+        self.ensure_partitions_for(table, data)
 
-        # Insert values from df_exchange into table stock_price_tesla_table
-        insert_statement = postgresql.insert(table).values(
-            data.to_dict(orient="records")
+        # Upsert values from the dataframe into the table
+        return self._execute_in_batches(
+            data=data.to_dict(orient="records"),
+            build_statement=lambda batch: self._upsert_statement(table, batch),
+            batch_size=batch_size,
+            commit_per=commit_per,
         )
+
+    def _upsert_statement(self, table: Table, data: list[dict]):
+        """
+        INSERT ... ON CONFLICT DO UPDATE that only rewrites the rows whose values changed, a row
+        equal to the stored one gets no new row version, WAL record or dead tuple to vacuum.
+        The statement returns the number of rows inserted and updated.
+        """
+        key_columns = [
+            pk_column.name for pk_column in table.primary_key.columns.values()
+        ]
+        insert_statement = postgresql.insert(table).values(data)
         upsert_statement = insert_statement.on_conflict_do_update(
             index_elements=key_columns,
             set_={
-                c.key: c
-                for c in insert_statement.excluded
-                if c.key not in key_columns
+                c.key: c for c in insert_statement.excluded if c.key not in key_columns
             },
+            where=or_(*(
+                column.is_distinct_from(insert_statement.excluded[column.name])
+                for column in table.columns if column.name not in key_columns
+            )),
         )
-        self.engine.execute(upsert_statement)
 
+        # Every part of the statement sees the table as it was before it ran, so a written row
+        # found in the table was updated, any other was inserted. The join looks the written keys
+        # up on the primary key, the statement only binds the values of the rows once
+        key_table_columns = [table.c[column] for column in key_columns]
+        written = upsert_statement.returning(*key_table_columns).cte("written")
+        is_new = table.c[key_columns[0]].is_(None)
+        return select(
+            func.count().filter(is_new).label("inserted"),
+            func.count().filter(~is_new).label("updated"),
+        ).select_from(
+            written.outerjoin(table, and_(*(written.c[column] == table.c[column] for column in key_columns)))
+        )
+
+    def _execute_in_batches(self, data: list[dict], build_statement: Callable, batch_size: Optional[int] = None, commit_per: str = "run") -> list[dict]:
+        """
+        Executes one multi-row statement per batch of `batch_size` rows.
+
+        Args:
+            data: rows to write
+            build_statement: builds the statement for a batch of rows
+            batch_size: rows per statement, all rows are sent in one statement when None
+            commit_per: `batch` commits every batch on its own so a failing batch only rolls back itself,
+                `run` commits all batches in one transaction
+
+        Returns:
+            rows, seconds and rows_per_second of each batch
+        """
+        if commit_per not in ("batch", "run"):
+            raise Exception("Please specify a correct commit_per: [batch, run]")
+
+        batch_size = batch_size or max(len(data), 1)
+        batches = [data[i : i + batch_size] for i in range(0, len(data), batch_size)]
+
+        if commit_per == "run":
+            with self.engine.begin() as connection:
+                return [
+                    self._execute_batch(connection, build_statement(batch), batch_number, len(batches), len(batch))
+                    for batch_number, batch in enumerate(batches, start=1)
+                ]
+
+        batch_stats = []
+        for batch_number, batch in enumerate(batches, start=1):
+            with self.engine.begin() as connection:
+                batch_stats.append(self._execute_batch(connection, build_statement(batch), batch_number, len(batches), len(batch)))
+        return batch_stats
+
+    def _execute_batch(self, connection, statement, batch_number: int, batch_count: int, batch_rows: int) -> dict:
+        start = time.perf_counter()
+        result = connection.execute(statement)
+        seconds = time.perf_counter() - start
+
+        if result.returns_rows:
+            # An upsert, see `_upsert_statement`
+            inserted, updated = result.one()
+            rows = inserted + updated
+            write_counts = {"inserted": inserted, "updated": updated, "unchanged": batch_rows - rows}
+        else:
+            rows = result.rowcount
+            write_counts = {"inserted": rows, "updated": 0, "unchanged": 0}
+        batch_stats = {"rows": rows, "seconds": seconds, "rows_per_second": rows / seconds if seconds else None, **write_counts}
+        logger.info(f"Batch {batch_number}/{batch_count}: wrote {rows} rows in {seconds:.3f}s ({rows / max(seconds, 1e-9):,.0f} rows/sec)")
+        return batch_stats
 
     def select_all(self, table: Table) -> list[dict]:
         return [dict(row) for row in self.engine.execute(table.select()).all()]
@@ -62,34 +148,248 @@ class PostgreSqlClient:
         """
         Creates table provided in the metadata object
         """
-        metadata.create_all(self.engine)
+        self.schema_registry.ensure(metadata)
 
     def drop_table(self, table_name: str) -> None:
         self.engine.execute(f"drop table if exists {table_name};")
+        self.schema_registry.invalidate(table_name)
 
-    def insert(self, data: list[dict], table: Table, metadata: MetaData) -> None:
-        metadata.create_all(self.engine)
-        insert_statement = postgresql.insert(table).values(data)
-        self.engine.execute(insert_statement)
+    def insert(self, data: list[dict], table: Table, metadata: MetaData, batch_size: Optional[int] = None, commit_per: str = "run") -> list[dict]:
+        self.schema_registry.ensure(metadata)
+        self.ensure_partitions_for(table, data)
+        return self._execute_in_batches(
+            data=data,
+            build_statement=lambda batch: postgresql.insert(table).values(batch),
+            batch_size=batch_size,
+            commit_per=commit_per,
+        )
+
+    def _check_keeps_partitioning(self, connection, table: Table) -> None:
+        """
+        Refuses to replace a partitioned table with a definition that is not partitioned, e.g. a
+        reflected table: SQLAlchemy does not reflect `postgresql_partition_by`.
+        """
+        if table.dialect_options["postgresql"]["partition_by"] is None and self.get_partition_column(connection, table.name):
+            raise Exception(
+                f"Table '{table.name}' is partitioned, overwriting it needs a definition with postgresql_partition_by"
+            )
 
-    def overwrite(self, data: list[dict], table: Table, metadata: MetaData) -> None:
+    def overwrite(self, data: list[dict], table: Table, metadata: MetaData, batch_size: Optional[int] = None, commit_per: str = "run") -> list[dict]:
+        with self.engine.connect() as connection:
+            self._check_keeps_partitioning(connection, table)
         self.drop_table(table.name)
-        self.insert(data=data, table=table, metadata=metadata)
+        return self.insert(data=data, table=table, metadata=metadata, batch_size=batch_size, commit_per=commit_per)
+
+    def upsert(self, data: list[dict], table: Table, metadata: MetaData, batch_size: Optional[int] = None, commit_per: str = "run") -> list[dict]:
+        self.schema_registry.ensure(metadata)
+        self.ensure_partitions_for(table, data)
+        return self._execute_in_batches(
+            data=data,
+            build_statement=lambda batch: self._upsert_statement(table, batch),
+            batch_size=batch_size,
+            commit_per=commit_per,
+        )
+
+    def get_partition_column(self, connection, table_name: str) -> Optional[str]:
+        """
+        Returns the column a range partitioned table is partitioned by, None when the table is not partitioned.
+        """
+        def query() -> Optional[str]:
+            partition_key = connection.execute("SELECT pg_get_partkeydef(to_regclass(%s))", (table_name,)).scalar()
+            match = re.fullmatch(r'RANGE \("?(\w+)"?\)', partition_key or "")
+            return match.group(1) if match else None
+
+        return self.schema_registry.partition_column(table_name, query)
+
+    def _partition_names(self, connection, table_name: str) -> list[str]:
+        return [
+            row[0] for row in connection.execute(
+                "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent = to_regclass(%s)",
+                (table_name,),
+            ).all()
+        ]
 
-    def upsert(self, data: list[dict], table: Table, metadata: MetaData) -> None:
-        metadata.create_all(self.engine)
+    def ensure_monthly_partitions(self, connection, table_name: str, start, end) -> list[str]:
+        """
+        Creates the missing monthly partitions of a table range partitioned on a timestamp column,
+        from the month of `start` to the month of `end`. Partitions are named <table_name>_pYYYY_MM
+        and bounded on UTC months.
+
+        Returns:
+            The names of the partitions created
+        """
+        months = pd.period_range(_utc_timestamp(start).tz_localize(None), _utc_timestamp(end).tz_localize(None), freq="M")
+        partitions = {f"{table_name}_p{month.year}_{month.month:02d}": month for month in months}
+        if set(partitions) <= self.schema_registry.partitions(table_name):
+            return []
+        existing = set(self._partition_names(connection, table_name))
+        self.schema_registry.add_partitions(table_name, existing)
+        if set(partitions) <= existing:
+            return []
+
+        # Concurrent loads of the same months wait for each other instead of racing to create the partition
+        connection.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (table_name,))
+        existing = set(self._partition_names(connection, table_name))
+        created = []
+        for partition_name, month in partitions.items():
+            if partition_name in existing:
+                continue
+            connection.execute(
+                f"CREATE TABLE {self._quote(partition_name)} PARTITION OF {self._quote(table_name)} "
+                f"FOR VALUES FROM ('{month.start_time.date()} 00:00:00+00') TO ('{(month + 1).start_time.date()} 00:00:00+00')"
+            )
+            created.append(partition_name)
+        self.schema_registry.add_partitions(table_name, created)
+        if created:
+            logger.info(f"Created partitions {', '.join(created)} of table '{table_name}'")
+        return created
+
+    def _ensure_partitions_for(self, connection, table_name: str, data: Union[pd.DataFrame, list[dict]]) -> None:
+        partition_column = self.get_partition_column(connection, table_name)
+        if partition_column is None or len(data) == 0:
+            return
+        if isinstance(data, pd.DataFrame):
+            values = data[partition_column]
+        else:
+            values = pd.Series([row[partition_column] for row in data])
+        timestamps = pd.to_datetime(values, utc=True)
+        self.ensure_monthly_partitions(connection, table_name, timestamps.min(), timestamps.max())
+
+    def ensure_partitions_for(self, table: Table, data: Union[pd.DataFrame, list[dict]]) -> None:
+        """
+        Creates the partitions the rows of `data` fall in when the table is partitioned, a partitioned
+        table rejects rows without a partition.
+        """
+        with self.engine.begin() as connection:
+            self._ensure_partitions_for(connection, table.name, data)
+
+    def _quote(self, name: str) -> str:
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def _copy_from_dataframe(self, connection, data: pd.DataFrame, table_name: str, columns: list[str], rows_per_chunk: int = 50000) -> None:
+        """
+        Streams the dataframe into `table_name` with COPY FROM STDIN, one CSV chunk at a time.
+        """
+        column_list = ", ".join(self._quote(column) for column in columns)
+        copy_statement = f"COPY {self._quote(table_name)} ({column_list}) FROM STDIN WITH (FORMAT csv)"
+        cursor = connection.connection.cursor()
+        cursor.execute(copy_statement, stream=_csv_chunks(data[columns], rows_per_chunk))
+
+    def bulk_insert(self, data: pd.DataFrame, table: Table, metadata: MetaData) -> None:
+        """
+        Inserts the dataframe with COPY FROM STDIN instead of an INSERT ... VALUES statement.
+        """
+        self.schema_registry.ensure(metadata)
+        self.ensure_partitions_for(table, data)
+        with self.engine.begin() as connection:
+            self._copy_from_dataframe(connection, data, table.name, [column.name for column in table.columns])
+
+    def bulk_upsert(self, data: pd.DataFrame, table: Table, metadata: MetaData) -> dict:
+        """
+        Copies the dataframe into a temporary staging table, then upserts the new and changed rows
+        into the table with a single INSERT ... SELECT ... ON CONFLICT statement. Rows equal to the
+        stored ones are not written at all, not even locked.
+
+        Returns:
+            The number of rows inserted, updated and left unchanged
+        """
+        self.schema_registry.ensure(metadata)
+        self.ensure_partitions_for(table, data)
+        columns = [column.name for column in table.columns]
         key_columns = [
             pk_column.name for pk_column in table.primary_key.columns.values()
         ]
-        insert_statement = postgresql.insert(table).values(data)
-        upsert_statement = insert_statement.on_conflict_do_update(
-            index_elements=key_columns,
-            set_={
-                c.key: c for c in insert_statement.excluded if c.key not in key_columns
-            },
+        value_columns = [column for column in columns if column not in key_columns]
+        staging_table_name = f"{table.name}_staging"
+        table_name = self._quote(table.name)
+        column_list = ", ".join(self._quote(column) for column in columns)
+        update_list = ", ".join(
+            f"{self._quote(column)} = EXCLUDED.{self._quote(column)}" for column in value_columns
         )
-        self.engine.execute(upsert_statement)
 
+        def column_list_of(alias: str, names: list[str]) -> str:
+            return ", ".join(f"{alias}.{self._quote(name)}" for name in names)
 
+        def keys_match(left: str, right: str) -> str:
+            return " AND ".join(f"{left}.{self._quote(column)} = {right}.{self._quote(column)}" for column in key_columns)
 
+        with self.engine.begin() as connection:
+            connection.execute(
+                f"CREATE TEMPORARY TABLE {self._quote(staging_table_name)} "
+                f"(LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            self._copy_from_dataframe(connection, data, staging_table_name, columns)
+            # `stored` and `written` both see the table as it was before the statement ran
+            inserted, updated = connection.execute(
+                f"WITH stored AS ("
+                f"SELECT {column_list_of('s', key_columns)}, "
+                f"({column_list_of('t', value_columns)}) IS NOT DISTINCT FROM ({column_list_of('s', value_columns)}) AS unchanged "
+                f"FROM {self._quote(staging_table_name)} s JOIN {table_name} t ON {keys_match('t', 's')}"
+                f"), written AS ("
+                f"INSERT INTO {table_name} ({column_list}) "
+                f"SELECT {column_list_of('s', columns)} FROM {self._quote(staging_table_name)} s "
+                f"LEFT JOIN stored ON {keys_match('stored', 's')} WHERE stored.unchanged IS NOT TRUE "
+                f"ON CONFLICT ({', '.join(self._quote(column) for column in key_columns)}) "
+                f"DO UPDATE SET {update_list} "
+                # Guards against a concurrent writer having stored the same values meanwhile
+                f"WHERE ({column_list_of(table_name, value_columns)}) IS DISTINCT FROM ({column_list_of('EXCLUDED', value_columns)}) "
+                f"RETURNING {column_list_of(table_name, key_columns)}"
+                f") "
+                f"SELECT count(*) FILTER (WHERE stored.unchanged IS NULL), count(*) FILTER (WHERE stored.unchanged IS NOT NULL) "
+                f"FROM written LEFT JOIN stored ON {keys_match('stored', 'written')}"
+            ).one()
 
+        write_counts = {"inserted": inserted, "updated": updated, "unchanged": len(data) - inserted - updated}
+        logger.info(f"Upserted {len(data)} rows into '{table.name}': {write_counts}")
+        return write_counts
+
+    def bulk_overwrite(self, data: pd.DataFrame, table: Table, metadata: MetaData) -> None:
+        """
+        Copies the dataframe into a new table and swaps it with the existing table in the same
+        transaction, so readers see either the old or the new data and never a missing table.
+        """
+        new_table = table.to_metadata(MetaData(), name=f"{table.name}_new")
+        try:
+            with self.engine.begin() as connection:
+                self._check_keeps_partitioning(connection, table)
+                connection.execute(f"DROP TABLE IF EXISTS {self._quote(new_table.name)}")
+                new_table.create(connection)
+                self._ensure_partitions_for(connection, new_table.name, data)
+                self._copy_from_dataframe(connection, data, new_table.name, [column.name for column in new_table.columns])
+                connection.execute(f"DROP TABLE IF EXISTS {self._quote(table.name)}")
+                connection.execute(f"ALTER TABLE {self._quote(new_table.name)} RENAME TO {self._quote(table.name)}")
+                if table.primary_key.columns:
+                    connection.execute(
+                        f"ALTER INDEX {self._quote(new_table.name + '_pkey')} RENAME TO {self._quote(table.name + '_pkey')}"
+                    )
+                # Partitions are named after their table, <table>_new_p2025_09 becomes <table>_p2025_09
+                for partition_name in self._partition_names(connection, table.name):
+                    connection.execute(
+                        f"ALTER TABLE {self._quote(partition_name)} "
+                        f"RENAME TO {self._quote(table.name + partition_name[len(new_table.name):])}"
+                    )
+        finally:
+            # Both tables changed, or the transaction rolled back what was cached about them
+            self.schema_registry.invalidate(new_table.name)
+            self.schema_registry.invalidate(table.name)
+
+
+def _utc_timestamp(value) -> pd.Timestamp:
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_localize("UTC") if timestamp.tzinfo is None else timestamp.tz_convert("UTC")
+
+
+def _csv_chunks(data: pd.DataFrame, rows_per_chunk: int) -> Iterator[str]:
+    """
+    Yields the dataframe as CSV text, `rows_per_chunk` rows at a time.
+
+    Timezone aware timestamps are written in ISO 8601 (2025-09-02T04:00:00+00:00),
+    the same text the INSERT path stores.
+    """
+    for start in range(0, len(data), rows_per_chunk):
+        chunk = data.iloc[start : start + rows_per_chunk].copy()
+        for column in chunk.select_dtypes(include=["datetimetz"]).columns:
+            formatted = chunk[column].dt.strftime("%Y-%m-%dT%H:%M:%S%z")
+            chunk[column] = formatted.str[:-2] + ":" + formatted.str[-2:]
+        yield chunk.to_csv(index=False, header=False)
@@ -0,0 +1,88 @@
+import threading
+import time
+from typing import Mapping, Optional
+
+
+class TokenBucketRateLimiter:
+    """
+    A thread safe token bucket limiting how many requests are sent per minute.
+
+    The bucket starts from `requests_per_minute` and is corrected from the rate-limit
+    headers the API returns, so several clients sharing one limiter stay under one quota.
+    """
+
+    def __init__(self, requests_per_minute: int = 200, capacity: Optional[int] = None):
+        self.requests_per_minute = requests_per_minute
+        self.capacity = capacity or requests_per_minute
+        self.tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.RLock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.requests_per_minute / 60)
+        self._updated_at = now
+
+    def _reserve(self) -> float:
+        """
+        Takes a token if one is available and returns 0, otherwise returns the seconds to wait.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) * 60 / self.requests_per_minute
+
+    def acquire(self) -> None:
+        """
+        Blocks until a request may be sent.
+        """
+        wait_seconds = self._reserve()
+        while wait_seconds > 0:
+            time.sleep(wait_seconds)
+            wait_seconds = self._reserve()
+
+    def wait_time(self) -> float:
+        """
+        Takes a token without blocking and returns how long the caller has to wait, used by async callers.
+        """
+        return self._reserve()
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """
+        Adjusts the bucket from the `X-RateLimit-Limit`, `X-RateLimit-Remaining` and
+        `X-RateLimit-Reset` (unix seconds) response headers.
+        """
+        limit = headers.get("X-RateLimit-Limit")
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            if limit is not None and int(limit) > 0:
+                self.requests_per_minute = int(limit)
+                self.capacity = int(limit)
+
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+
+            if remaining is not None and int(remaining) <= 0 and reset is not None:
+                self.block_for(float(reset) - time.time(), now=now)
+
+    def block_for(self, seconds: float, now: Optional[float] = None) -> None:
+        """
+        Stops handing out tokens for the next `seconds`, e.g. after a 429 with Retry-After.
+        """
+        if seconds <= 0:
+            return
+        with self._lock:
+            now = time.monotonic() if now is None else now
+            self._blocked_until = max(self._blocked_until, now + seconds)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+from zoneinfo import ZoneInfo
+
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+class ResponseCache:
+    """
+    Content addressed on-disk cache of Alpaca responses, stored in SQLite.
+
+    A response is keyed by the hash of its url and query parameters. Responses of ranges ending
+    before the current trading day (America/New_York) never change and are kept for good,
+    responses of ranges reaching into the current day expire after `ttl_seconds`.
+    Once the compressed bodies exceed `max_size_bytes` the least recently used ones are evicted.
+    """
+
+    def __init__(self,
+                 path: str,
+                 ttl_seconds: float = 900,
+                 max_size_bytes: int = 512 * 2**20,
+                 clock: Callable[[], float] = time.time):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = max_size_bytes
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("pragma journal_mode = wal")
+        self._connection.execute(
+            """
+            create table if not exists responses (
+                key text primary key,
+                url text not null,
+                params text not null,
+                body blob not null,
+                size integer not null,
+                created_at real not null,
+                expires_at real,
+                last_accessed_at real not null
+            )
+            """
+        )
+        self._connection.execute("create index if not exists responses_last_accessed_idx on responses (last_accessed_at)")
+
+    @staticmethod
+    def _params_text(params: dict) -> str:
+        # aiohttp sends every value as a string, requests sends them as given: both hash the same
+        return json.dumps({key: str(value) for key, value in params.items()}, sort_keys=True)
+
+    def key(self, url: str, params: dict) -> str:
+        return hashlib.sha256(f"{url}?{self._params_text(params)}".encode()).hexdigest()
+
+    def expires_at(self, params: dict) -> Optional[float]:
+        """
+        Returns when a response for these parameters expires, None when it is final.
+        A range without an end runs up to now and is never final.
+        """
+        now = self.clock()
+        if not params.get("end"):
+            return now + self.ttl_seconds
+
+        trading_day_start = (
+            datetime.fromtimestamp(now, MARKET_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+        )
+        if _parse_time(str(params["end"])) < trading_day_start:
+            return None
+        return now + self.ttl_seconds
+
+    def get(self, url: str, params: dict) -> Optional[bytes]:
+        """
+        Returns the cached body, None when it is missing or expired.
+        """
+        key = self.key(url, params)
+        now = self.clock()
+        with self._lock:
+            row = self._connection.execute(
+                "select body, expires_at from responses where key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                if row is not None:
+                    self._connection.execute("delete from responses where key = ?", (key,))
+                self.misses += 1
+                return None
+
+            self._connection.execute("update responses set last_accessed_at = ? where key = ?", (now, key))
+            self.hits += 1
+        return zlib.decompress(row[0])
+
+    def put(self, url: str, params: dict, body: bytes) -> None:
+        """
+        Stores a response body, then evicts the least recently used responses over the size limit.
+        """
+        compressed = zlib.compress(body)
+        now = self.clock()
+        with self._lock:
+            self._connection.execute(
+                "insert or replace into responses values (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.key(url, params), url, self._params_text(params), compressed, len(compressed),
+                 now, self.expires_at(params), now),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        total_size = self._connection.execute("select coalesce(sum(size), 0) from responses").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+
+        evicted = []
+        for key, size in self._connection.execute("select key, size from responses order by last_accessed_at"):
+            if total_size <= self.max_size_bytes:
+                break
+            evicted.append((key,))
+            total_size -= size
+        self._connection.executemany("delete from responses where key = ?", evicted)
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._connection.execute("select coalesce(sum(size), 0) from responses").fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
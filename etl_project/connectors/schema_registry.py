@@ -0,0 +1,175 @@
+import threading
+import weakref
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Optional
+from loguru import logger
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect
+from sqlalchemy.engine import Engine
+
+# Bump when the definition of a table changes, processes then migrate once and drop their caches
+SCHEMA_VERSION = 4
+
+
+class SchemaRegistry:
+    """
+    Caches what a process knows about the database schema so the load path issues no DDL or
+    introspection queries once warm: the tables known to exist, the reflected tables and the
+    partitions of partitioned tables.
+
+    Only positive answers are cached, a table missing now may be created by another process.
+    The version recorded in the `schema_versions` table invalidates every cache when another
+    process migrates the schema, see `ensure_schema` and `check_version`.
+    One registry is shared per engine, use `get_schema_registry(engine)`.
+    """
+
+    version_table_name = "schema_versions"
+
+    def __init__(self, engine: Engine, name: str = "etl_project"):
+        self.engine = engine
+        self.name = name
+        self.version: Optional[int] = None
+        self._lock = threading.RLock()
+        self._existing_tables: set[str] = set()
+        self._reflected_tables: dict[str, Table] = {}
+        self._partition_columns: dict[str, Optional[str]] = {}
+        self._partitions: dict[str, set[str]] = {}
+
+    def ensure(self, metadata: MetaData, tables: Optional[Iterable[Table]] = None) -> None:
+        """
+        Creates the tables of the metadata that are not known to exist yet, like `metadata.create_all`.
+        """
+        tables = list(tables if tables is not None else metadata.sorted_tables)
+        if all(table.name in self._existing_tables for table in tables):
+            return
+        with self._lock:
+            missing = [table for table in tables if table.name not in self._existing_tables]
+            if missing:
+                metadata.create_all(self.engine, tables=missing)
+                for table in missing:
+                    self.invalidate(table.name)
+                self._existing_tables.update(table.name for table in missing)
+
+    def has_table(self, table_name: str) -> bool:
+        if table_name in self._existing_tables:
+            return True
+        if inspect(self.engine).has_table(table_name):
+            self._existing_tables.add(table_name)
+            return True
+        return False
+
+    def reflect(self, table_name: str) -> Table:
+        """
+        Returns the reflected table, reflected once per process and version.
+        """
+        table = self._reflected_tables.get(table_name)
+        if table is None:
+            with self._lock:
+                metadata = MetaData()
+                metadata.reflect(bind=self.engine, only=[table_name])
+                table = self._reflected_tables[table_name] = metadata.tables[table_name]
+                self._existing_tables.add(table_name)
+        return table
+
+    def partition_column(self, table_name: str, query: Callable[[], Optional[str]]) -> Optional[str]:
+        """
+        Returns the cached partition column of the table, looked up with `query` on a miss.
+        """
+        if table_name not in self._partition_columns:
+            self._partition_columns[table_name] = query()
+        return self._partition_columns[table_name]
+
+    def partitions(self, table_name: str) -> set[str]:
+        return self._partitions.get(table_name, set())
+
+    def add_partitions(self, table_name: str, partition_names: Iterable[str]) -> None:
+        with self._lock:
+            self._partitions.setdefault(table_name, set()).update(partition_names)
+
+    def invalidate(self, table_name: Optional[str] = None) -> None:
+        """
+        Forgets what is cached about the table (e.g. after dropping it), about every table when None.
+        """
+        with self._lock:
+            if table_name is None:
+                self._existing_tables.clear()
+                self._reflected_tables.clear()
+                self._partition_columns.clear()
+                self._partitions.clear()
+                return
+            self._existing_tables.discard(table_name)
+            self._reflected_tables.pop(table_name, None)
+            self._partition_columns.pop(table_name, None)
+            self._partitions.pop(table_name, None)
+
+    def _version_table(self) -> Table:
+        return Table(
+            self.version_table_name,
+            MetaData(),
+            Column("name", String, primary_key=True),
+            Column("version", Integer, nullable=False),
+            Column("updated_at", DateTime(timezone=True), nullable=False),
+        )
+
+    def stored_version(self) -> Optional[int]:
+        return self.engine.execute(
+            f"SELECT version FROM {self.version_table_name} WHERE name = %s", (self.name,)
+        ).scalar()
+
+    def ensure_schema(self, migrate: Callable[[], None], version: int = SCHEMA_VERSION) -> bool:
+        """
+        One-time schema step: runs `migrate` when the database is at an older version than `version`,
+        then records the version. Processes starting on an up-to-date database only read the version.
+
+        Returns:
+            True when `migrate` ran
+        """
+        version_table = self._version_table()
+        self.ensure(version_table.metadata)
+        if self.stored_version() == version:
+            self.version = version
+            return False
+
+        with self._lock:
+            migrate()
+            self.engine.execute(
+                f"""
+                INSERT INTO {self.version_table_name} (name, version, updated_at) VALUES (%s, %s, %s)
+                ON CONFLICT (name) DO UPDATE SET version = EXCLUDED.version, updated_at = EXCLUDED.updated_at
+                """,
+                (self.name, version, datetime.now(timezone.utc)),
+            )
+            self.invalidate()
+            self.version = version
+        logger.info(f"Schema '{self.name}' migrated to version {version}")
+        return True
+
+    def check_version(self) -> bool:
+        """
+        Drops every cache when another process changed the schema version since the last check,
+        one query, meant to run once at the start of every run of a long-running process.
+
+        Returns:
+            True when the caches were invalidated
+        """
+        stored_version = self.stored_version()
+        if stored_version == self.version:
+            return False
+        logger.info(f"Schema '{self.name}' version changed from {self.version} to {stored_version}, invalidating cached schema")
+        self.invalidate()
+        self.version = stored_version
+        return True
+
+
+_registries: "weakref.WeakKeyDictionary[Engine, SchemaRegistry]" = weakref.WeakKeyDictionary()
+_registries_lock = threading.Lock()
+
+
+def get_schema_registry(engine: Engine) -> SchemaRegistry:
+    """
+    Returns the registry of the engine, every client and helper sharing an engine shares its cache.
+    """
+    with _registries_lock:
+        registry = _registries.get(engine)
+        if registry is None:
+            registry = _registries[engine] = SchemaRegistry(engine)
+        return registry
@@ -0,0 +1,141 @@
+import functools
+import json
+import resource
+import sys
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+from etl_project.connectors.alpaca_api import RequestStats
+
+
+@dataclass
+class StageMetrics:
+    name: str
+    wall_seconds: float = 0.0
+    rows: Optional[int] = None
+    bytes_fetched: int = 0
+    api_calls: int = 0
+    # Process-wide: the pipelines and nodes running at the same time share the same peaks
+    process_peak_traced_bytes: Optional[int] = None
+    peak_rss_bytes: Optional[int] = None
+    status: str = "success"
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if self.rows is None or not self.wall_seconds:
+            return None
+        return self.rows / self.wall_seconds
+
+
+@dataclass
+class RunMetrics:
+    pipeline_name: str
+    run_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    started_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    finished_at: Optional[str] = None
+    wall_seconds: float = 0.0
+    stages: list[StageMetrics] = field(default_factory=list)
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+class PipelineInstrumentation:
+    """
+    Records wall time, rows, bytes fetched, API calls and peak memory of each pipeline stage.
+
+    Usage:
+        instrumentation = PipelineInstrumentation("stock_bars", request_stats=request_stats)
+        with instrumentation.stage("initial_transform") as stage:
+            df_stock = initial_transform(df_stock_bars, df_stock_symbol)
+            stage.rows = len(df_stock)
+        instrumentation.emit(metadata_logger=metadata_logger, json_path="logs/run_metrics.jsonl")
+
+    API calls and bytes are the difference of `request_stats` before and after the stage.
+    With `trace_memory` tracemalloc is started once for the process and left running, which slows
+    allocation heavy code down, and each stage records the peak Python heap of the process so far.
+    tracemalloc and RSS are process-wide, stages running at the same time are not told apart.
+    """
+
+    def __init__(self, pipeline_name: str, request_stats: Optional[RequestStats] = None, trace_memory: bool = False):
+        self.request_stats = request_stats or RequestStats()
+        self.trace_memory = trace_memory
+        self.run = RunMetrics(pipeline_name=pipeline_name)
+        self._started = time.perf_counter()
+        # Never stopped or reset by a stage, other pipelines of the process may be tracing too
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageMetrics]:
+        metrics = StageMetrics(name=name)
+        request_count = self.request_stats.request_count
+        bytes_received = self.request_stats.bytes_received
+
+        start = time.perf_counter()
+        try:
+            yield metrics
+        except BaseException:
+            metrics.status = "failed"
+            raise
+        finally:
+            metrics.wall_seconds = time.perf_counter() - start
+            metrics.api_calls = self.request_stats.request_count - request_count
+            metrics.bytes_fetched = self.request_stats.bytes_received - bytes_received
+            metrics.peak_rss_bytes = peak_rss_bytes()
+            if self.trace_memory and tracemalloc.is_tracing():
+                metrics.process_peak_traced_bytes = tracemalloc.get_traced_memory()[1]
+            self.run.stages.append(metrics)
+
+    def instrument(self, name: Optional[str] = None, rows: Optional[Callable] = None) -> Callable:
+        """
+        Decorator recording every call of the function as a stage.
+
+        Args:
+            name: stage name, defaults to the function name
+            rows: computes the number of rows from the function result, e.g. len
+        """
+        def decorator(function: Callable) -> Callable:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or function.__name__) as metrics:
+                    result = function(*args, **kwargs)
+                    if rows is not None:
+                        metrics.rows = rows(result)
+                    return result
+            return wrapper
+        return decorator
+
+    def to_record(self) -> dict:
+        """
+        Returns the run as a json serialisable dict.
+        """
+        self.run.finished_at = datetime.now(timezone.utc).isoformat()
+        self.run.wall_seconds = time.perf_counter() - self._started
+        record = asdict(self.run)
+        for stage_record, stage in zip(record["stages"], self.run.stages):
+            stage_record["rows_per_second"] = stage.rows_per_second
+        return record
+
+    def emit(self, metadata_logger=None, json_path: Optional[str] = None) -> dict:
+        """
+        Writes the run record to the metadata table (as a json log message) and/or appends it
+        as one line to the `json_path` file.
+        """
+        record = self.to_record()
+        line = json.dumps(record)
+        if metadata_logger is not None:
+            metadata_logger.insert_log(f"run_metrics {line}")
+        if json_path:
+            Path(json_path).parent.mkdir(parents=True, exist_ok=True)
+            with open(json_path, "a") as json_file:
+                json_file.write(line + "\n")
+        return record
@@ -1,21 +1,53 @@
+import atexit
+import queue
+import threading
+import time
 from sqlalchemy import create_engine, Table, Column, MetaData, DateTime, Text
-from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
 from sqlalchemy.sql import insert
 from datetime import datetime
+from typing import Optional
+from loguru import logger
+from etl_project.connectors.schema_registry import get_schema_registry
 
 
 class DatabaseLogger:
-    def __init__(self, username, password, host, port, dbname):
-        self.engine = create_engine(
+    """
+    Writes pipeline log messages to the "metadata" table.
+
+    `insert_log` only puts the message on a queue, a background thread writes the queued
+    messages in batches once `batch_size` messages are waiting or `flush_interval_seconds`
+    have passed. Remaining messages are written on `close`, which also runs at interpreter exit.
+    Pass the pipeline's `engine` to share its connection pool instead of opening a new one.
+    """
+
+    def __init__(self,
+                 username: Optional[str] = None,
+                 password: Optional[str] = None,
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 dbname: Optional[str] = None,
+                 engine: Optional[Engine] = None,
+                 batch_size: int = 100,
+                 flush_interval_seconds: float = 1.0):
+        self._owns_engine = engine is None
+        self.engine = engine or create_engine(
             f"postgresql+psycopg2://{username}:{password}@{host}:{port}/{dbname}",
             echo=False  # Set to True for SQL logging
         )
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
 
-        self.connection = self.engine.connect()
         self.metadata = MetaData()
         self._define_metadata_table()
         self._create_metadata_table_if_not_exists()
 
+        self._queue = queue.Queue()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="DatabaseLogger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
     def _define_metadata_table(self):
         self.metadata_table = Table(
             'metadata', self.metadata,
@@ -24,19 +56,79 @@ class DatabaseLogger:
         )
 
     def _create_metadata_table_if_not_exists(self):
-        inspector = inspect(self.engine)
-        if 'metadata' not in inspector.get_table_names():
-            self.metadata.create_all(self.engine)
-            print("Table 'metadata' created.")
-        else:
-            print("Table 'metadata' already exists.")
+        # Known to exist once created or seen by the process, e.g. by an earlier logger on the same engine
+        get_schema_registry(self.engine).ensure(self.metadata)
 
     def insert_log(self, message: str):
-        now = datetime.now()
-        stmt = insert(self.metadata_table).values(timestamp=now, log_message=message)
-        self.connection.execute(stmt)
-        print(f"Inserted log: {now} - {message}")
+        """
+        Queues the message, it is written to the database by the background thread.
+        """
+        self._queue.put({"timestamp": datetime.now(), "log_message": message})
+
+    def _next_batch(self) -> list[dict]:
+        """
+        Waits for the first message, then collects more until the batch is full or the flush interval is over.
+        """
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = self.flush_interval_seconds if deadline is None else deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                record = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            # None is put by close() to wake the thread up
+            if record is None:
+                self._queue.task_done()
+                break
+            batch.append(record)
+            deadline = deadline or time.monotonic() + self.flush_interval_seconds
+        return batch
+
+    def _write(self, batch: list[dict]):
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(insert(self.metadata_table), batch)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} log messages to the metadata table: {e}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _run(self):
+        while not self._closed.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """
+        Blocks until every queued message has been written.
+        """
+        self._queue.join()
 
     def close(self):
-        self.connection.close()
-        print("Database connection closed.")
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._queue.put(None)
+        self._thread.join()
+
+        # Write what was queued after the background thread stopped
+        batch = []
+        while not self._queue.empty():
+            record = self._queue.get()
+            if record is None:
+                self._queue.task_done()
+            else:
+                batch.append(record)
+        if batch:
+            self._write(batch)
+
+        if self._owns_engine:
+            self.engine.dispose()
+        atexit.unregister(self.close)
+        logger.info("Database connection closed.")
@@ -0,0 +1,438 @@
+import argparse
+import calendar
+import hashlib
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Optional
+import pandas as pd
+from dotenv import load_dotenv
+from jinja2 import Environment, FileSystemLoader
+from loguru import logger
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Text
+from sqlalchemy.engine import Engine
+from etl_project.assets.aggregation import refresh_derived_timeframes, table_name_for_timeframe
+from etl_project.assets.assets import (
+    convert_to_arrow_table,
+    define_stock_bars_table,
+    extract_stock_symbol,
+    format_write_counts,
+    initial_transform,
+    load,
+    transform_and_load_analysis_table,
+    transform_to_arrow,
+    update_watermarks,
+)
+from etl_project.assets.validation import validate_and_quarantine
+from etl_project.connectors.alpaca_api import AlpacaApiClient, chunk_symbols
+from etl_project.connectors.parquet_lake import ParquetLakeClient
+from etl_project.connectors.postgresql import PostgreSqlClient
+from etl_project.connectors.rate_limiter import TokenBucketRateLimiter
+from etl_project.connectors.response_cache import ResponseCache
+from etl_project.connectors.schema_registry import get_schema_registry
+from etl_project.metadata.log_metadata import DatabaseLogger
+from etl_project.pipelines.stock_bars import get_pipeline_configs, get_yaml_config, migrate_tables
+from etl_project.utilities.utilities import save_symbol_checkpoints
+
+# Load methods that can load the same unit twice, a unit interrupted after loading is loaded again on resume
+IDEMPOTENT_LOAD_METHODS = ["upsert", "bulk_upsert"]
+
+
+@dataclass
+class BackfillUnit:
+    """
+    One resumable piece of a backfill: the bars of `symbols` from `start_time` to `end_time`.
+    """
+    unit_id: str
+    symbols: list[str]
+    start_time: str
+    end_time: str
+
+
+def month_windows(start_date: str, end_date: str, months_per_unit: int = 1) -> list[tuple[str, str]]:
+    """
+    Splits [start_date, end_date] into calendar month windows of `months_per_unit` months,
+    each running from its first second to its last second so neighbouring windows do not overlap.
+    """
+    start = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
+
+    windows = []
+    window_start = start
+    while window_start <= end:
+        month_index = window_start.year * 12 + window_start.month - 1 + months_per_unit - 1
+        year, month = divmod(month_index, 12)
+        window_end = min(date(year, month + 1, calendar.monthrange(year, month + 1)[1]), end)
+        windows.append((f"{window_start.isoformat()}T00:00:00Z", f"{window_end.isoformat()}T23:59:59Z"))
+        next_month_index = month_index + 1
+        window_start = date(next_month_index // 12, next_month_index % 12 + 1, 1)
+    return windows
+
+
+def plan_backfill_units(
+        symbols: list[str],
+        start_date: str,
+        end_date: str,
+        timeframe: str,
+        symbols_per_unit: int = 100,
+        months_per_unit: int = 1
+    ) -> list[BackfillUnit]:
+    """
+    Splits the symbol universe and date range into units of `symbols_per_unit` symbols by
+    `months_per_unit` months. The id of a unit only depends on what it covers, so planning the
+    same backfill again finds the units already recorded.
+    """
+    units = []
+    for symbol_chunk in chunk_symbols(symbols, symbols_per_unit):
+        symbols_hash = hashlib.sha1(",".join(symbol_chunk).encode()).hexdigest()[:12]
+        for start_time, end_time in month_windows(start_date, end_date, months_per_unit):
+            units.append(BackfillUnit(
+                unit_id=f"{timeframe}/{start_time[:10]}/{end_time[:10]}/{symbols_hash}",
+                symbols=symbol_chunk,
+                start_time=start_time,
+                end_time=end_time,
+            ))
+    return units
+
+
+def define_backfill_unit_table(metadata: MetaData, backfill_unit_table_name: str) -> Table:
+    return Table(
+        backfill_unit_table_name,
+        metadata,
+        Column("unit_id", String, primary_key=True),
+        Column("table_name", String, primary_key=True),
+        Column("symbols", Text, nullable=False),
+        Column("start_time", String, nullable=False),
+        Column("end_time", String, nullable=False),
+        Column("status", String, nullable=False),
+        Column("rows_loaded", Integer),
+        Column("attempts", Integer, nullable=False),
+        Column("error", Text),
+        Column("updated_at", DateTime(timezone=True), nullable=False),
+    )
+
+
+def register_units(engine: Engine, backfill_unit_table_name: str, table_name: str, units: list[BackfillUnit]) -> list[BackfillUnit]:
+    """
+    Records the units that are not recorded yet as pending.
+
+    Returns:
+        The units still to run: pending, failed, or left running by an interrupted backfill
+    """
+    metadata = MetaData()
+    define_backfill_unit_table(metadata, backfill_unit_table_name)
+    get_schema_registry(engine).ensure(metadata)
+
+    now = datetime.now(timezone.utc)
+    engine.execute(
+        f"""
+        INSERT INTO {backfill_unit_table_name} (unit_id, table_name, symbols, start_time, end_time, status, attempts, updated_at)
+        VALUES (%s, %s, %s, %s, %s, 'pending', 0, %s)
+        ON CONFLICT (unit_id, table_name) DO NOTHING;
+        """,
+        [(unit.unit_id, table_name, ",".join(unit.symbols), unit.start_time, unit.end_time, now) for unit in units],
+    )
+    done = {
+        row["unit_id"]
+        for row in engine.execute(
+            f"SELECT unit_id FROM {backfill_unit_table_name} WHERE table_name = %s AND status = 'done';",
+            (table_name,),
+        ).all()
+    }
+    return [unit for unit in units if unit.unit_id not in done]
+
+
+def update_unit_status(
+        engine: Engine,
+        backfill_unit_table_name: str,
+        table_name: str,
+        unit: BackfillUnit,
+        status: str,
+        rows_loaded: Optional[int] = None,
+        error: Optional[str] = None
+    ) -> None:
+    attempts = "attempts + 1" if status == "running" else "attempts"
+    engine.execute(
+        f"""
+        UPDATE {backfill_unit_table_name}
+        SET status = %s, rows_loaded = %s, error = %s, attempts = {attempts}, updated_at = %s
+        WHERE unit_id = %s AND table_name = %s;
+        """,
+        (status, rows_loaded, error, datetime.now(timezone.utc), unit.unit_id, table_name),
+    )
+
+
+def run_unit(
+        unit: BackfillUnit,
+        alpaca_api_client: AlpacaApiClient,
+        postgresql_client: PostgreSqlClient,
+        table: Table,
+        metadata: MetaData,
+        df_stock_symbol: pd.DataFrame,
+        timeframe: str,
+        load_method: str,
+        backfill_unit_table_name: str,
+        symbol_checkpoint_table_name: Optional[str] = None,
+        parquet_lake: Optional[ParquetLakeClient] = None,
+        quarantine_table_name: Optional[str] = None
+    ) -> int:
+    """
+    Extracts, transforms and loads one unit, then marks it done.
+
+    Returns:
+        The number of rows loaded
+    """
+    engine = postgresql_client.engine
+    update_unit_status(engine, backfill_unit_table_name, table.name, unit, "running")
+    try:
+        extracted_stock_bars = alpaca_api_client.get_alpaca_api_data(unit.symbols, timeframe, unit.start_time, unit.end_time)
+        stock_bars = convert_to_arrow_table(extracted_stock_bars)
+        if parquet_lake is not None:
+            parquet_lake.write_bars(stock_bars, timeframe)
+
+        if quarantine_table_name is not None:
+            df_stock = validate_and_quarantine(
+                transform_to_arrow(stock_bars, df_stock_symbol, keep_unknown_symbols=True),
+                postgresql_client, quarantine_table_name, table.name
+            ).valid
+        else:
+            df_stock = initial_transform(stock_bars, df_stock_symbol)
+        watermarks = {}
+        if not df_stock.empty:
+            write_counts = load(df=df_stock, postgresql_client=postgresql_client, table=table, metadata=metadata, load_method=load_method)
+            logger.info(f"Unit {unit.unit_id} loaded {len(df_stock)} rows: {format_write_counts(write_counts)}")
+            watermarks = update_watermarks({}, df_stock)
+        if symbol_checkpoint_table_name is not None:
+            # The unit covers its window even where it held no bars, e.g. a holiday at its start or a symbol not listed yet
+            coverage = {symbol: (pd.Timestamp(unit.start_time), pd.Timestamp(unit.end_time)) for symbol in unit.symbols}
+            save_symbol_checkpoints(engine, symbol_checkpoint_table_name, table.name, timeframe, watermarks, coverage)
+    except Exception as e:
+        update_unit_status(engine, backfill_unit_table_name, table.name, unit, "failed", error=str(e))
+        raise
+
+    update_unit_status(engine, backfill_unit_table_name, table.name, unit, "done", rows_loaded=len(df_stock))
+    return len(df_stock)
+
+
+def run_backfill(
+        units: list[BackfillUnit],
+        alpaca_api_client: AlpacaApiClient,
+        postgresql_client: PostgreSqlClient,
+        table: Table,
+        metadata: MetaData,
+        df_stock_symbol: pd.DataFrame,
+        timeframe: str = "1Day",
+        load_method: str = "bulk_upsert",
+        max_workers: int = 8,
+        backfill_unit_table_name: str = "backfill_units",
+        symbol_checkpoint_table_name: Optional[str] = None,
+        parquet_lake: Optional[ParquetLakeClient] = None,
+        quarantine_table_name: Optional[str] = None
+    ) -> dict:
+    """
+    Runs the units that are not done yet on a thread pool, every unit is loaded as soon as it is extracted.
+
+    The status of every unit is recorded in `backfill_unit_table_name`, running the same units
+    again after a crash or failure only runs the units that did not complete.
+
+    Returns:
+        units, skipped (already done), done and failed counts and rows_loaded
+    """
+    if load_method not in IDEMPOTENT_LOAD_METHODS:
+        raise Exception(f"Backfill load method must be one of: {IDEMPOTENT_LOAD_METHODS}")
+
+    postgresql_client.schema_registry.ensure(metadata)
+    pending_units = register_units(postgresql_client.engine, backfill_unit_table_name, table.name, units)
+    summary = {"units": len(units), "skipped": len(units) - len(pending_units), "done": 0, "failed": 0, "rows_loaded": 0}
+    logger.info(f"Backfill of {len(units)} units, {summary['skipped']} already done, running {len(pending_units)}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                run_unit, unit, alpaca_api_client, postgresql_client, table, metadata, df_stock_symbol,
+                timeframe, load_method, backfill_unit_table_name, symbol_checkpoint_table_name, parquet_lake,
+                quarantine_table_name
+            ): unit
+            for unit in pending_units
+        }
+        for future in as_completed(futures):
+            unit = futures[future]
+            try:
+                rows_loaded = future.result()
+            except Exception as e:
+                summary["failed"] += 1
+                logger.error(f"Backfill unit {unit.unit_id} failed: {e}")
+                continue
+            summary["done"] += 1
+            summary["rows_loaded"] += rows_loaded
+            logger.info(
+                f"Backfill unit {unit.unit_id} loaded {rows_loaded} rows "
+                f"({summary['done'] + summary['failed']}/{len(pending_units)})"
+            )
+    return summary
+
+
+def backfill_pipeline(
+        pipeline_config: dict,
+        args: argparse.Namespace,
+        alpaca_api_client: AlpacaApiClient,
+        postgres_sql_client: PostgreSqlClient,
+        metadata_logger: DatabaseLogger,
+        parquet_lake: Optional[ParquetLakeClient] = None
+    ) -> dict:
+    """
+    Backfills the tables of one pipeline definition of the config, then refreshes its derived
+    timeframes and analysis table.
+
+    Returns:
+        The summary of `run_backfill`
+    """
+    name = pipeline_config['name']
+    settings = pipeline_config['config']
+    source_table_name = settings['source_table_name']
+    timeframe = settings.get('timeframe', '1Day')
+    derived_timeframes = settings.get('derived_timeframes') or []
+
+    df_stock_symbol = extract_stock_symbol(settings['stock_symbol_relative_path'])
+    units = plan_backfill_units(
+        symbols=df_stock_symbol["Symbol"].tolist(),
+        start_date=args.start_date,
+        end_date=args.end_date,
+        timeframe=timeframe,
+        symbols_per_unit=args.symbols_per_unit,
+        months_per_unit=args.months_per_unit
+    )
+
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, source_table_name)
+    metadata_logger.insert_log(f"{name}: Backfill of '{source_table_name}' from {args.start_date} to {args.end_date} started")
+    summary = run_backfill(
+        units=units,
+        alpaca_api_client=alpaca_api_client,
+        postgresql_client=postgres_sql_client,
+        table=table,
+        metadata=metadata,
+        df_stock_symbol=df_stock_symbol,
+        timeframe=timeframe,
+        load_method=args.load_method,
+        max_workers=args.max_workers,
+        backfill_unit_table_name=settings.get('backfill_unit_table_name', 'backfill_units'),
+        symbol_checkpoint_table_name=settings.get('symbol_checkpoint_table_name', 'symbol_checkpoints'),
+        parquet_lake=parquet_lake,
+        quarantine_table_name=settings.get('quarantine_table_name')
+    )
+    logger.info(f"{name}: Backfill completed: {summary}")
+    metadata_logger.insert_log(f"{name}: Backfill of '{source_table_name}' completed: {summary}")
+
+    if derived_timeframes and summary["done"]:
+        rows_aggregated = refresh_derived_timeframes(
+            postgres_sql_client,
+            source_table_name=source_table_name,
+            base_timeframe=timeframe,
+            derived_timeframes=derived_timeframes,
+            since=args.start_date,
+            load_method=args.load_method
+        )
+        logger.info(f"{name}: Aggregated bars into {rows_aggregated}")
+
+    if not args.skip_analysis and summary["done"]:
+        environment = Environment(loader=FileSystemLoader("etl_project/assets/sql/transform"))
+        transform_and_load_analysis_table(
+            environment,
+            postgres_sql_client.engine,
+            source_table_name=(
+                table_name_for_timeframe(source_table_name, "1Day", timeframe)
+                if "1Day" in derived_timeframes else source_table_name
+            ),
+            analysis_table_name=settings.get('analysis_table_name', 'stock_bars_analysis')
+        )
+        logger.info(f"{name}: Analysis table rebuilt")
+    return summary
+
+
+def select_pipeline_configs(config: dict, names: Optional[list[str]] = None) -> list[dict]:
+    """
+    Returns the pipeline definitions of the config named in `names`, all of them when None.
+    """
+    pipeline_configs = get_pipeline_configs(config)
+    if not names:
+        return pipeline_configs
+    unknown = sorted(set(names) - {pipeline_config['name'] for pipeline_config in pipeline_configs})
+    if unknown:
+        raise Exception(f"Unknown pipelines {unknown}, defined: {[pipeline_config['name'] for pipeline_config in pipeline_configs]}")
+    return [pipeline_config for pipeline_config in pipeline_configs if pipeline_config['name'] in names]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the stock bars table over a date range, resumable")
+    parser.add_argument("--start-date", required=True, help="first date, YYYY-MM-DD")
+    parser.add_argument("--end-date", default=date.today().isoformat(), help="last date, YYYY-MM-DD, defaults to today")
+    parser.add_argument("--symbols-per-unit", type=int, default=100)
+    parser.add_argument("--months-per-unit", type=int, default=1)
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--load-method", choices=IDEMPOTENT_LOAD_METHODS, default="bulk_upsert")
+    parser.add_argument("--skip-analysis", action="store_true", help="do not rebuild the analysis table afterwards")
+    parser.add_argument(
+        "--pipeline", action="append", dest="pipelines",
+        help="name of a pipeline of the config to backfill, can be repeated, defaults to every pipeline"
+    )
+    args = parser.parse_args()
+
+    config = get_yaml_config()
+    pipeline_configs = select_pipeline_configs(config, args.pipelines)
+    load_dotenv(override=True)
+
+    postgres_sql_client = PostgreSqlClient(
+        os.environ.get("DB_USERNAME"),
+        os.environ.get("DB_PASSWORD"),
+        os.environ.get("SERVER_NAME"),
+        os.environ.get("DATABASE_NAME")
+    )
+    metadata_logger = DatabaseLogger(engine=postgres_sql_client.engine)
+
+    response_cache = (
+        ResponseCache(
+            config['config']['response_cache_path'],
+            ttl_seconds=config['config'].get('response_cache_ttl_seconds', 900),
+            max_size_bytes=config['config'].get('response_cache_max_mb', 512) * 2**20
+        )
+        if config['config'].get('response_cache_path') else None
+    )
+    parquet_lake = (
+        ParquetLakeClient(config['config']['lake_path'], compression=config['config'].get('lake_compression', 'zstd'))
+        if config['config'].get('lake_path') else None
+    )
+
+    # Every worker of every pipeline shares one connection pool and one rate limiter, pages are as large as the API allows
+    alpaca_api_client = AlpacaApiClient(
+        api_key_id=os.getenv("APCA-API-KEY-ID"),
+        api_secret_key=os.getenv("APCA-API-SECRET-KEY"),
+        page_limit=10000,
+        rate_limiter=TokenBucketRateLimiter(config['config'].get('rate_limit_per_minute', 200)),
+        response_cache=response_cache,
+        pool_size=args.max_workers
+    )
+
+    # Same one-time migration as the pipeline, skipped once the database is at the current schema version
+    def migrate():
+        for pipeline_config in get_pipeline_configs(config):
+            migrated = migrate_tables(postgres_sql_client, pipeline_config['config'])
+            if migrated:
+                logger.info(f"{pipeline_config['name']}: Migrated {', '.join(migrated)}")
+    postgres_sql_client.schema_registry.ensure_schema(migrate)
+
+    # The pipelines run one after the other, each already runs its units on the whole worker pool
+    failed = False
+    for pipeline_config in pipeline_configs:
+        summary = backfill_pipeline(pipeline_config, args, alpaca_api_client, postgres_sql_client, metadata_logger, parquet_lake)
+        failed = failed or bool(summary["failed"])
+
+    metadata_logger.close()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
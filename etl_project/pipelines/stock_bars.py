@@ -1,14 +1,30 @@
 from dotenv import load_dotenv
 import os
-from etl_project.connectors.alpaca_api import AlpacaApiClient
-from etl_project.assets.assets import extract_alpaca_data, convert_to_dataframe, extract_stock_symbol, initial_transform, load, transform_and_load_analysis_table
+import pandas as pd
+from etl_project.connectors.rate_limiter import TokenBucketRateLimiter
+from etl_project.assets.assets import extract_alpaca_data_for_ranges, extract_alpaca_data_pages_for_ranges, convert_to_arrow_table, extract_stock_symbol, format_write_counts, initial_transform, load, new_write_counts, stream_transform_and_load, transform_to_arrow, transform_and_load_analysis_table, update_watermarks
+from etl_project.connectors.alpaca_api import AlpacaApiClient, RequestStats
+from etl_project.connectors.alpaca_api_async import SharedAsyncAlpacaApiClient
 from etl_project.connectors.postgresql import PostgreSqlClient
-from sqlalchemy import (
-        MetaData, inspect)
-from etl_project.utilities.utilities import get_checkpoint, save_checkpoint
+from etl_project.connectors.parquet_lake import ParquetLakeClient
+from etl_project.connectors.response_cache import ResponseCache
+from sqlalchemy import MetaData
+from etl_project.utilities.utilities import (
+        migrate_schema,
+        save_checkpoint,
+        extract_coverage,
+        get_symbol_checkpoints,
+        get_symbol_watermarks_from_table,
+        plan_extract_ranges,
+        save_symbol_checkpoints)
 from etl_project.assets.assets import define_stock_bars_table
+from etl_project.assets.aggregation import refresh_derived_timeframes, table_name_for_timeframe
+from etl_project.assets.validation import validate_and_quarantine
+from etl_project.serving.serving_tables import refresh_serving_tables, validate_serving_tables
 from jinja2 import Environment, FileSystemLoader
 from etl_project.metadata.log_metadata import DatabaseLogger
+from etl_project.metadata.instrumentation import PipelineInstrumentation
+from etl_project.utilities.dag import Dag, DagRun, Node
 
 # Logging
 from loguru import logger
@@ -17,7 +33,13 @@ from loguru import logger
 import yaml
 from pathlib import Path
 
-import schedule, time
+import argparse
+import functools
+import signal
+from dataclasses import dataclass
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from etl_project.utilities.scheduler import DailySchedule, ScheduledRunner
 
 def get_yaml_config():
     yaml_file_path = __file__.replace(".py", ".yaml") # file rename to get .yaml file
@@ -30,152 +52,638 @@ def get_yaml_config():
             f"Missing {yaml_file_path} file! Please create the yaml file."
         )
 
-def pipeline():
-    try:
-        # If table exists, perform incremental extract and load
-        if inspect(postgres_sql_client.engine).has_table(source_table_name):
-            logger.info(f"Table '{source_table_name}' exists in the database")
-            #Logs data to the "metadata" table
-            metadata_logger.insert_log(f"Table '{source_table_name}' exists in the database")
-
-            # Get last checkpoint
-            last_checkpoint = get_checkpoint(postgres_sql_client.engine, checkpoint_table_name, table_name=source_table_name)
-            last_checkpoint_date = last_checkpoint[:10]
-            # next_day_date = (datetime.strptime(last_checkpoint_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
-
-            # Incremental extract from last checkpoint date to today (including last checkpoint date in case there are missing data for that date)
-            logger.info(f"Last checkpoint is {last_checkpoint_date}. Performing incremental extract from {last_checkpoint_date} to today")
-            #Logs data to the "metadata" table
-            metadata_logger.insert_log(f"Last checkpoint is {last_checkpoint_date}. Performing incremental extract from {last_checkpoint_date} to today")
-
-            extracted_stock_bars = extract_alpaca_data(
-                stock_symbol_csv_path=config['config']['stock_symbol_relative_path'],
-                start_date=last_checkpoint_date,
-                timeframe="1Day",
-                api_key_id=ALPACA_API_KEY_ID,
-                api_secret_key=ALPACA_API_SECRET_KEY
-            )
-            if not extracted_stock_bars:
-                logger.warning("No data returned from Alpaca API. Possibly start_date is too recent. Check start date and try again / later.")
-                #Logs data to the "metadata" table
-                metadata_logger.insert_log("No data returned from Alpaca API. Possibly start_date is too recent. Check start date and try again / later.")
-
-            # Reflect existing table
-            metadata = MetaData()
-            metadata.reflect(bind=postgres_sql_client.engine, only=[source_table_name])
-            table = metadata.tables[source_table_name]
-
-        # else, perform full extract and load
-        else:
-            logger.info(f"Table '{source_table_name}' does not exist")
-            logger.info("Performing initial full extract of data to create the table")
-            #Logs data to the "metadata" table
-            metadata_logger.insert_log(f"Table '{source_table_name}' does not exist")
-            metadata_logger.insert_log("Performing initial full extract of data to create the table")
-
-
-            # Full initial extract data for September 2025
-            extracted_stock_bars = extract_alpaca_data(
-                stock_symbol_csv_path=config['config']['stock_symbol_relative_path'],
-                start_date="2025-09-01",
-                end_date="2025-09-30",
-                timeframe="1Day",
-                api_key_id=ALPACA_API_KEY_ID,
-                api_secret_key=ALPACA_API_SECRET_KEY
-            )
+@dataclass
+class PipelineContext:
+    """
+    Clients and configuration of a pipeline, created once per process by `create_pipeline_contexts`
+    and shared by every run and every node of a run.
+    """
+    config: dict
+    postgres_sql_client: PostgreSqlClient
+    metadata_logger: DatabaseLogger
+    alpaca_api_client: AlpacaApiClient
+    rate_limiter: TokenBucketRateLimiter
+    request_stats: RequestStats
+    api_key_id: Optional[str] = None
+    api_secret_key: Optional[str] = None
+    parquet_lake: Optional[ParquetLakeClient] = None
+    response_cache: Optional[ResponseCache] = None
+    shared_alpaca_api_client: Optional[SharedAsyncAlpacaApiClient] = None
+    name: str = "stock_bars"
+
+    @property
+    def settings(self) -> dict:
+        return self.config['config']
+
+    @property
+    def source_table_name(self) -> str:
+        return self.settings['source_table_name']
+
+    @property
+    def checkpoint_table_name(self) -> str:
+        return self.settings['checkpoint_table_name']
+
+    @property
+    def symbol_checkpoint_table_name(self) -> str:
+        return self.settings.get('symbol_checkpoint_table_name', 'symbol_checkpoints')
+
+    @property
+    def timeframe(self) -> str:
+        return self.settings.get('timeframe', '1Day')
+
+    @property
+    def load_method(self) -> str:
+        return self.settings['load_method']
+
+    @property
+    def pipeline_mode(self) -> str:
+        return self.settings.get('pipeline_mode', 'batch')
+
+    @property
+    def analysis_table_name(self) -> str:
+        return self.settings.get('analysis_table_name', 'stock_bars_analysis')
+
+    @property
+    def analysis_refresh(self) -> str:
+        return self.settings.get('analysis_refresh', 'full')
+
+    @property
+    def derived_timeframes(self) -> list[str]:
+        return self.settings.get('derived_timeframes') or []
+
+    @property
+    def quarantine_table_name(self) -> Optional[str]:
+        # Rows failing validation are moved there, no validation when not configured
+        return self.settings.get('quarantine_table_name')
+
+    @property
+    def serving_tables(self) -> list[str]:
+        # Rollups of the analysis served to dashboards, none when not configured
+        return self.settings.get('serving_tables') or []
+
+    @property
+    def analysis_source_table_name(self) -> str:
+        # The analysis computes daily returns, from the 1Day bars wherever they are
+        if "1Day" in self.derived_timeframes:
+            return table_name_for_timeframe(self.source_table_name, "1Day", self.timeframe)
+        return self.source_table_name
+
+    @property
+    def schema_registry(self):
+        # Tables known to exist and reflected tables, kept for the next runs of the daemon
+        return self.postgres_sql_client.schema_registry
+
+    def log(self, message: str, level: str = "INFO") -> None:
+        logger.log(level, f"{self.name}: {message}")
+        #Logs data to the "metadata" table, shared by the pipelines of the process
+        self.metadata_logger.insert_log(f"{self.name}: {message}")
+
+def get_pipeline_configs(config: dict) -> list[dict]:
+    """
+    Returns the definition of every pipeline of the config: the `config` section with the overrides
+    of each entry of `pipelines`, e.g. one per symbol universe, or the `config` section alone.
+    """
+    definitions = config.get('pipelines') or [{'name': 'stock_bars'}]
+    pipeline_configs = [
+        {'name': definition['name'], 'config': {**config['config'], **(definition.get('config') or {})}}
+        for definition in definitions
+    ]
+    names = [pipeline_config['name'] for pipeline_config in pipeline_configs]
+    if len(set(names)) != len(names):
+        raise Exception(f"Pipeline names must be unique, got: {names}")
+    for key in ['source_table_name', 'analysis_table_name']:
+        table_names = [pipeline_config['config'].get(key) for pipeline_config in pipeline_configs]
+        if len(set(table_names)) != len(table_names):
+            raise Exception(f"Every pipeline needs its own {key}, got: {table_names}")
+    for pipeline_config in pipeline_configs:
+        validate_serving_tables(pipeline_config['config'].get('serving_tables') or [])
+    return pipeline_configs
+
+def create_pipeline_contexts(config: dict) -> list[PipelineContext]:
+    """
+    Creates the context of every pipeline of the config. The pipelines share the clients of the process:
+    one database connection pool, one HTTP session per API client and one rate limiter, so running
+    more pipelines never sends more requests than the API quota. Each pipeline counts its own requests,
+    which are added to the total of the process.
+    """
+    # Fetching environment variables
+    load_dotenv(override=True)
+    api_key_id = os.getenv("APCA-API-KEY-ID")
+    api_secret_key = os.getenv("APCA-API-SECRET-KEY")
+
+    pipeline_configs = get_pipeline_configs(config)
+
+    postgres_sql_client = PostgreSqlClient(
+            os.environ.get("DB_USERNAME"),
+            os.environ.get("DB_PASSWORD"),
+            os.environ.get("SERVER_NAME"),
+            os.environ.get("DATABASE_NAME"),
+            pool_size=config['config'].get('db_pool_size', 5),
+            max_overflow=config['config'].get('db_max_overflow', 10)
+        )
+
+    # Buffered logger writing from a background thread through the pipeline's connection pool
+    metadata_logger = DatabaseLogger(engine=postgres_sql_client.engine)
+
+    # One rate limiter for the whole process so every request shares the API quota
+    rate_limiter = TokenBucketRateLimiter(config['config'].get('rate_limit_per_minute', 200))
+    # Requests of every pipeline of the process
+    request_stats = RequestStats()
+
+    # Raw-data lake the extracted bars are landed in, and replayed from in replay mode
+    parquet_lake = (
+        ParquetLakeClient(config['config']['lake_path'], compression=config['config'].get('lake_compression', 'zstd'))
+        if config['config'].get('lake_path') else None
+    )
+
+    # On-disk cache of API responses, closed historical ranges are never requested twice
+    response_cache = (
+        ResponseCache(
+            config['config']['response_cache_path'],
+            ttl_seconds=config['config'].get('response_cache_ttl_seconds', 900),
+            max_size_bytes=config['config'].get('response_cache_max_mb', 512) * 2**20
+        )
+        if config['config'].get('response_cache_path') else None
+    )
+
+    # Long-lived client used by the streaming mode, it shares the connection pool across pages
+    alpaca_api_client = AlpacaApiClient(
+        api_key_id=api_key_id,
+        api_secret_key=api_secret_key,
+        rate_limiter=rate_limiter,
+        request_stats=request_stats,
+        response_cache=response_cache,
+        pool_size=config['config'].get('http_pool_size', 10)
+    )
+
+    # Event loop and aiohttp session of the batch extracts, started on the first extract
+    shared_alpaca_api_client = SharedAsyncAlpacaApiClient(
+        api_key_id=api_key_id,
+        api_secret_key=api_secret_key,
+        rate_limiter=rate_limiter,
+        request_stats=request_stats,
+        response_cache=response_cache,
+        max_concurrency=config['config'].get('max_concurrency', 50)
+    )
+
+    contexts = []
+    for pipeline_config in pipeline_configs:
+        pipeline_request_stats = RequestStats(parent=request_stats)
+        contexts.append(PipelineContext(
+            config=pipeline_config,
+            postgres_sql_client=postgres_sql_client,
+            metadata_logger=metadata_logger,
+            alpaca_api_client=alpaca_api_client.with_request_stats(pipeline_request_stats),
+            rate_limiter=rate_limiter,
+            request_stats=pipeline_request_stats,
+            api_key_id=api_key_id,
+            api_secret_key=api_secret_key,
+            parquet_lake=parquet_lake,
+            response_cache=response_cache,
+            shared_alpaca_api_client=shared_alpaca_api_client,
+            name=pipeline_config['name']
+        ))
+    return contexts
+
+def migrate_tables(postgres_sql_client: PostgreSqlClient, settings: dict) -> list[str]:
+    """
+    Migrates the tables of a pipeline's `config` section created with string timestamps to timestamptz,
+    partitioned by month, and the symbol checkpoints created without `covered_from`.
+    Used by the pipeline and the backfill, so both migrate the same tables.
+
+    Returns:
+        The names of the tables migrated
+    """
+    timeframe = settings.get('timeframe', '1Day')
+    return migrate_schema(
+        postgres_sql_client,
+        stock_bars_table_names=[
+            settings['source_table_name'],
+            *(table_name_for_timeframe(settings['source_table_name'], derived_timeframe, timeframe)
+              for derived_timeframe in settings.get('derived_timeframes') or [])
+        ],
+        checkpoint_table_name=settings['checkpoint_table_name'],
+        symbol_checkpoint_table_name=settings.get('symbol_checkpoint_table_name', 'symbol_checkpoints')
+    )
+
+def migrate_pipeline_tables(contexts: list[PipelineContext]) -> None:
+    for context in contexts:
+        migrated = migrate_tables(context.postgres_sql_client, context.settings)
+        if migrated:
+            context.log(f"Migrated {', '.join(migrated)}")
+
+# ---------- Nodes ----------
+# Each node is called with the context and the values of the nodes it depends on
+
+def read_stock_symbols(context: PipelineContext):
+    return extract_stock_symbol(context.settings['stock_symbol_relative_path'])
+
+def prepare_target_table(context: PipelineContext):
+    """
+    Returns the table definition, partitioning included, whether the table exists or is created by the
+    initial full load. A reflected table would not carry the partitioning and the overwrite load
+    methods would recreate it as a plain table.
+    """
+    if context.schema_registry.has_table(context.source_table_name):
+        context.log(f"Table '{context.source_table_name}' exists in the database")
+    else:
+        context.log(f"Table '{context.source_table_name}' does not exist")
+        context.log("Performing initial full extract of data to create the table")
+    return define_stock_bars_table(MetaData(), context.source_table_name)
+
+def read_symbol_checkpoints(context: PipelineContext):
+    """
+    Returns the loaded range of every symbol, seeded from the table when it was loaded before symbol checkpoints existed.
+    """
+    if not context.schema_registry.has_table(context.source_table_name):
+        return {}
+    symbol_checkpoints = get_symbol_checkpoints(
+        context.postgres_sql_client.engine, context.symbol_checkpoint_table_name, context.source_table_name, context.timeframe
+    )
+    if not symbol_checkpoints:
+        symbol_checkpoints = get_symbol_watermarks_from_table(context.postgres_sql_client.engine, context.source_table_name)
+    return symbol_checkpoints
+
+def plan_extract(context: PipelineContext, stock_symbols, symbol_checkpoints):
+    # Only request what is missing: new symbols are backfilled, known symbols continue from their latest date
+    extract_ranges = plan_extract_ranges(
+        symbols=stock_symbols["Symbol"].tolist(),
+        symbol_checkpoints=symbol_checkpoints,
+        backfill_start_date=context.settings.get('backfill_start_date', '2025-09-01'),
+        merge_within_days=context.settings.get('merge_within_days', 0)
+    )
+    for extract_range in extract_ranges:
+        context.log(f"Planned extract of {len(extract_range.symbols)} symbols from {extract_range.start_date} to {extract_range.end_date or 'today'}")
+    return extract_ranges
+
+def extract(context: PipelineContext, plan_extract):
+    extracted_stock_bars = extract_alpaca_data_for_ranges(
+        extract_ranges=plan_extract,
+        timeframe=context.timeframe,
+        api_key_id=context.api_key_id,
+        api_secret_key=context.api_secret_key,
+        symbols_per_request=context.settings.get('symbols_per_request', 100),
+        date_window_days=context.settings.get('date_window_days'),
+        max_concurrency=context.settings.get('max_concurrency', 50),
+        rate_limiter=context.rate_limiter,
+        request_stats=context.request_stats,
+        response_cache=context.response_cache,
+        shared_client=context.shared_alpaca_api_client
+    )
+    if not extracted_stock_bars:
+        context.log("No data returned from Alpaca API. Possibly start_date is too recent. Check start date and try again / later.", level="WARNING")
+    return extracted_stock_bars
 
-            # Define table schema
-            metadata = MetaData()
-            table = define_stock_bars_table(metadata, source_table_name)
+def convert(context: PipelineContext, extract):
+    stock_bars = convert_to_arrow_table(extract)
+    context.log(f"Extracted {stock_bars.num_rows} rows of data from Alpaca API")
+    return stock_bars
 
-        # Convert extracted data to DataFrame
-        df_stock_bars = convert_to_dataframe(extracted_stock_bars)
-        logger.info(f"Extracted {df_stock_bars.shape[0]} rows of data from Alpaca API")
-        metadata_logger.insert_log(f"Extracted {df_stock_bars.shape[0]} rows of data from Alpaca API")
+def land_raw_bars(context: PipelineContext, stock_bars):
+    # Land the raw bars so the tables can be rebuilt later without calling the API
+    partitions = context.parquet_lake.write_bars(stock_bars, timeframe=context.timeframe)
+    logger.info(f"Landed {stock_bars.num_rows} raw bars in {partitions} partitions of the lake")
+    return partitions
 
-        # Extract stock symbol data
-        df_stock_symbol = extract_stock_symbol(config['config']['stock_symbol_relative_path'])
+def transform(context: PipelineContext, stock_bars, stock_symbols):
+    # With validation the rows stay in Arrow, unknown symbols included, `validate` converts the valid ones
+    if context.quarantine_table_name:
+        return transform_to_arrow(stock_bars, stock_symbols, keep_unknown_symbols=True)
+    return initial_transform(stock_bars, stock_symbols)
 
-        # Transform data    
-        df_stock = initial_transform(df_stock_bars, df_stock_symbol)
+def validate(context: PipelineContext, data):
+    """
+    Returns the rows passing validation as a DataFrame, the others are moved to the quarantine table.
+    """
+    rows = len(data)
+    result = validate_and_quarantine(
+        data,
+        context.postgres_sql_client,
+        quarantine_table_name=context.quarantine_table_name,
+        source_table_name=context.source_table_name
+    )
+    if not result.quarantined.empty:
+        failures = {rule: count for rule, count in result.rule_counts.items() if count}
+        #Logs data to the "metadata" table
+        context.metadata_logger.insert_log(
+            f"{context.name}: Quarantined {len(result.quarantined)} of {rows} rows in '{context.quarantine_table_name}': {failures}"
+        )
+    return result.valid
 
-        # Load data to Postgres
-        load(
+def load_bars(context: PipelineContext, df_stock, table):
+    """
+    Loads the transformed bars, returns the earliest and latest timestamp loaded per symbol.
+    """
+    watermarks = {}
+    # Nothing new since the checkpoint, keep the checkpoint where it is
+    if not df_stock.empty:
+        write_counts = load(
             df=df_stock,
-            postgresql_client=postgres_sql_client,
+            postgresql_client=context.postgres_sql_client,
             table=table,
-            metadata=metadata,
-            load_method=load_method
+            metadata=table.metadata,
+            load_method=context.load_method,
+            batch_size=context.settings.get('batch_size'),
+            commit_per=context.settings.get('commit_per', 'run')
+        )
+        update_watermarks(watermarks, df_stock)
+        context.log(f"Loaded {len(df_stock)} rows: {format_write_counts(write_counts)}")
+    context.log(f"Complete data loading to table '{context.source_table_name}' using load method of {context.load_method}")
+    return watermarks
+
+def stream_extract_transform_load(context: PipelineContext, plan_extract, stock_symbols, table):
+    # Extract, transform and load page by page so memory stays flat whatever the date range
+    pages = extract_alpaca_data_pages_for_ranges(
+        extract_ranges=plan_extract,
+        timeframe=context.timeframe,
+        alpaca_api_client=context.alpaca_api_client,
+        symbols_per_request=context.settings.get('symbols_per_request', 100)
+    )
+    watermarks = {}
+    write_counts = new_write_counts()
+    rows_loaded, _ = stream_transform_and_load(
+        pages=pages,
+        df_stock_symbol=stock_symbols,
+        postgresql_client=context.postgres_sql_client,
+        table=table,
+        metadata=table.metadata,
+        load_method=context.load_method,
+        chunk_size=context.settings.get('chunk_size', 10000),
+        batch_size=context.settings.get('batch_size'),
+        commit_per=context.settings.get('commit_per', 'run'),
+        parquet_lake=context.parquet_lake,
+        timeframe=context.timeframe,
+        watermarks=watermarks,
+        validate=functools.partial(validate, context) if context.quarantine_table_name else None,
+        write_counts=write_counts
+    )
+    context.log(f"Extracted and loaded {rows_loaded} rows of data from Alpaca API: {format_write_counts(write_counts)}")
+    context.log(f"Complete data loading to table '{context.source_table_name}' using load method of {context.load_method}")
+    return watermarks
+
+def replay_transform_load(context: PipelineContext, stock_symbols, table):
+    # Rebuild the table from the raw-data lake, no API calls are made
+    if context.parquet_lake is None:
+        raise Exception("pipeline_mode replay requires lake_path in the config")
+
+    # Only the partitions of the date range are read, one symbol at a time
+    tables = context.parquet_lake.iter_bars(
+        timeframe=context.timeframe,
+        symbols=stock_symbols["Symbol"].tolist(),
+        start_date=context.settings.get('replay_start_date'),
+        end_date=context.settings.get('replay_end_date')
+    )
+    watermarks = {}
+    write_counts = new_write_counts()
+    rows_loaded, _ = stream_transform_and_load(
+        pages=tables,
+        df_stock_symbol=stock_symbols,
+        postgresql_client=context.postgres_sql_client,
+        table=table,
+        metadata=table.metadata,
+        load_method=context.load_method,
+        chunk_size=context.settings.get('chunk_size', 10000),
+        batch_size=context.settings.get('batch_size'),
+        commit_per=context.settings.get('commit_per', 'run'),
+        watermarks=watermarks,
+        validate=functools.partial(validate, context) if context.quarantine_table_name else None,
+        write_counts=write_counts
+    )
+    context.log(f"Replayed {rows_loaded} rows of data from the lake at {context.parquet_lake.root_path}: {format_write_counts(write_counts)}")
+    context.log(f"Complete data loading to table '{context.source_table_name}' using load method of {context.load_method}")
+    return watermarks
+
+def save_checkpoints(context: PipelineContext, watermarks, plan_extract):
+    # Save latest timestamp as checkpoint
+    if watermarks:
+        latest_timestamp = max(latest for _, latest in watermarks.values())
+        save_checkpoint(context.postgres_sql_client.engine, context.checkpoint_table_name, context.source_table_name, latest_timestamp)
+    # The extracted ranges are covered even where they held no bars, e.g. a holiday, the replay extracts nothing
+    coverage = extract_coverage(plan_extract) if context.pipeline_mode != "replay" else None
+    save_symbol_checkpoints(
+        context.postgres_sql_client.engine, context.symbol_checkpoint_table_name, context.source_table_name, context.timeframe,
+        watermarks, coverage
+    )
+
+def aggregate_timeframes(context: PipelineContext, watermarks):
+    # Derive the coarser timeframes from the extracted bars instead of extracting each of them
+    if not watermarks:
+        return {}
+    rows_aggregated = refresh_derived_timeframes(
+        context.postgres_sql_client,
+        source_table_name=context.source_table_name,
+        base_timeframe=context.timeframe,
+        derived_timeframes=context.derived_timeframes,
+        since=min(earliest for earliest, _ in watermarks.values()),
+        load_method="bulk_upsert" if context.load_method.startswith("bulk_") else "upsert"
+    )
+    context.log(f"Aggregated bars into {rows_aggregated}")
+    return rows_aggregated
+
+def refresh_analysis_table(context: PipelineContext, symbol_checkpoints, watermarks, rows_aggregated=None):
+    """
+    Transforms and loads the analysis table, incrementally from the earliest bar loaded by the run
+    when the table was loaded before, fully otherwise.
+    """
+    # Date from which the analysis table can be refreshed incrementally, None forces a full rebuild
+    since_date = None
+    if symbol_checkpoints and context.analysis_refresh == "incremental":
+        if not watermarks and context.schema_registry.has_table(context.analysis_table_name):
+            context.log("No bars loaded, the analysis table is up to date")
+            return
+        if watermarks:
+            since_date = pd.Timestamp(min(earliest for earliest, _ in watermarks.values())).tz_convert("UTC").date().isoformat()
+
+    if since_date is not None and context.schema_registry.has_table(context.analysis_table_name):
+        # Only recompute the rows from the incremental extract date and their lookback window
+        environment = Environment(loader=FileSystemLoader("etl_project/assets/sql/incremental"))
+        transform_and_load_analysis_table(
+            environment,
+            context.postgres_sql_client.engine,
+            since_date=since_date,
+            source_table_name=context.analysis_source_table_name,
+            analysis_table_name=context.analysis_table_name
         )
-        
-        logger.info(f"Complete data loading to table '{source_table_name}' using load method of {load_method}") 
-        metadata_logger.insert_log(f"Complete data loading to table '{source_table_name}' using load method of {load_method}")
-
-        # Save latest timestamp as checkpoint
-        latest_timestamp = df_stock['timestamp'].max()
-        save_checkpoint(postgres_sql_client.engine, checkpoint_table_name, source_table_name, latest_timestamp)
-    except KeyError as e:
-        logger.error(f"KeyError: {e}.")
-        metadata_logger.insert_log(f"KeyError: {e}.")
-
-    except Exception as e:
-        logger.error(f"An error occurred: {e}")
-        metadata_logger.insert_log(f"An error occurred: {e}")
-
-    # Transform and load to analysis table
-    try:
+        context.log(f"Incremental refresh of analysis table from {since_date} completed")
+    else:
         environment = Environment(loader=FileSystemLoader("etl_project/assets/sql/transform"))
-        transform_and_load_analysis_table(environment, postgres_sql_client.engine)
-        logger.info(f"Data transformation and loading to analysis table completed")
-        metadata_logger.insert_log(f"Data transformation and loading to analysis table completed")
+        transform_and_load_analysis_table(
+            environment,
+            context.postgres_sql_client.engine,
+            source_table_name=context.analysis_source_table_name,
+            analysis_table_name=context.analysis_table_name
+        )
+        context.log(f"Data transformation and loading to analysis table completed")
 
-    except Exception as e:
-        logger.error(f"An error occurred during analysis table transformation and loading: {e}")
-        metadata_logger.insert_log(f"An error occurred during analysis table transformation and loading: {e}")
+def refresh_serving(context: PipelineContext, analysis=None):
+    # The rollups are swapped in atomically, dashboards keep reading the previous ones meanwhile
+    rows_served = refresh_serving_tables(
+        context.postgres_sql_client.engine,
+        source_table_name=context.analysis_source_table_name,
+        analysis_table_name=context.analysis_table_name,
+        rollups=context.serving_tables,
+        lock_timeout_ms=context.settings.get('serving_lock_timeout_ms', 2000)
+    )
+    context.log(f"Refreshed serving tables {rows_served}")
+    return rows_served
 
-if __name__ == "__main__":
-    
-    config = get_yaml_config()
+def build_pipeline_dag(context: PipelineContext) -> Dag:
+    """
+    Returns the task graph of the pipeline mode. The symbols, the target table and the symbol
+    checkpoints are read concurrently, as are the lake landing and the transform, and the checkpoints,
+    derived timeframes and analysis table once the bars are loaded, the serving tables last.
+    """
+    nodes = [
+        Node("stock_symbols", read_stock_symbols, rows=len),
+        Node("target_table", prepare_target_table),
+        Node("symbol_checkpoints", read_symbol_checkpoints, rows=len),
+        Node("plan_extract", plan_extract, dependencies=["stock_symbols", "symbol_checkpoints"], rows=len),
+    ]
 
-    # Fetching environment variables
-    load_dotenv(override=True)
-    ALPACA_API_KEY_ID = os.getenv("APCA-API-KEY-ID")
-    ALPACA_API_SECRET_KEY = os.getenv("APCA-API-SECRET-KEY")
-    DB_USERNAME = os.environ.get("DB_USERNAME")
-    DB_PASSWORD = os.environ.get("DB_PASSWORD")
-    SERVER_NAME = os.environ.get("SERVER_NAME")
-    DATABASE_NAME = os.environ.get("DATABASE_NAME")
+    if context.pipeline_mode == "replay":
+        load_node = "replay_transform_load"
+        nodes.append(Node(load_node, replay_transform_load, dependencies={"stock_symbols": "stock_symbols", "table": "target_table"}))
+    elif context.pipeline_mode == "streaming":
+        load_node = "stream_extract_transform_load"
+        nodes.append(Node(
+            load_node,
+            stream_extract_transform_load,
+            dependencies={"plan_extract": "plan_extract", "stock_symbols": "stock_symbols", "table": "target_table"}
+        ))
+    else:
+        load_node = "load"
+        nodes += [
+            Node("extract", extract, dependencies=["plan_extract"], rows=lambda records: sum(len(bars) for bars in records.values())),
+            Node("convert_to_arrow_table", convert, dependencies=["extract"], rows=lambda stock_bars: stock_bars.num_rows),
+            Node(
+                "initial_transform",
+                transform,
+                dependencies={"stock_bars": "convert_to_arrow_table", "stock_symbols": "stock_symbols"},
+                rows=len
+            ),
+        ]
+        transformed = "initial_transform"
+        if context.quarantine_table_name:
+            nodes.append(Node("validate", validate, dependencies={"data": "initial_transform"}, rows=len))
+            transformed = "validate"
+        nodes.append(Node(load_node, load_bars, dependencies={"df_stock": transformed, "table": "target_table"}))
+        if context.parquet_lake is not None:
+            nodes.append(Node("land_raw_bars", land_raw_bars, dependencies={"stock_bars": "convert_to_arrow_table"}))
+
+    nodes.append(Node("save_checkpoints", save_checkpoints, dependencies={"watermarks": load_node, "plan_extract": "plan_extract"}))
+
+    analysis_dependencies = {"symbol_checkpoints": "symbol_checkpoints", "watermarks": load_node}
+    if context.derived_timeframes:
+        nodes.append(Node(
+            "aggregate_timeframes",
+            aggregate_timeframes,
+            dependencies={"watermarks": load_node},
+            rows=lambda rows_aggregated: sum(rows_aggregated.values())
+        ))
+        if "1Day" in context.derived_timeframes:
+            # The analysis reads the aggregated daily bars
+            analysis_dependencies["rows_aggregated"] = "aggregate_timeframes"
+    nodes.append(Node("transform_and_load_analysis_table", refresh_analysis_table, dependencies=analysis_dependencies))
+    if context.serving_tables:
+        nodes.append(Node(
+            "refresh_serving_tables",
+            refresh_serving,
+            dependencies={"analysis": "transform_and_load_analysis_table"},
+            rows=lambda rows_served: sum(rows_served.values())
+        ))
+    return Dag(nodes)
+
+def log_failed_nodes(context: PipelineContext, run: DagRun) -> None:
+    for name, result in run.results.items():
+        if result.status == "failed":
+            context.log(f"An error occurred in {name}: {result.error}", level="ERROR")
 
-    metadata_logger = DatabaseLogger(
-        username=DB_USERNAME,
-        password=DB_PASSWORD,
-        host=SERVER_NAME,
-        port=5432,
-        dbname=DATABASE_NAME
+def pipeline(context: PipelineContext) -> DagRun:
+    instrumentation = PipelineInstrumentation(
+        context.name,
+        request_stats=context.request_stats,
+        trace_memory=context.settings.get('trace_memory', False)
     )
 
-    logger.info("Fetching data from Alpaca Market API")
-    metadata_logger.insert_log("Fetching data from Alpaca Market API")
+    # Another process migrating the schema invalidates what this process cached about it
+    context.schema_registry.check_version()
+
+    dag = build_pipeline_dag(context)
+    max_workers = context.settings.get('max_workers', 4)
+    run = dag.run(context, max_workers=max_workers, instrumentation=instrumentation)
+    log_failed_nodes(context, run)
+
+    # Re-run the failed nodes and the nodes depending on them, the successful ones are not run again
+    for _ in range(context.settings.get('node_retries', 0)):
+        if run.succeeded:
+            break
+        context.log(f"Re-running failed nodes: {', '.join(run.failed)}")
+        run = dag.run(context, max_workers=max_workers, previous_run=run, instrumentation=instrumentation)
+        log_failed_nodes(context, run)
+
+    if context.response_cache is not None:
+        logger.info(f"Response cache: {context.response_cache.hits} hits, {context.response_cache.misses} misses")
+
+    # Record per-stage timings of the run
+    run_metrics = instrumentation.emit(
+        metadata_logger=context.metadata_logger,
+        json_path=context.settings.get('run_metrics_path')
+    )
+    logger.info(f"Run of {context.name} completed in {run_metrics['wall_seconds']:.2f}s: " + ", ".join(
+        f"{stage['name']} {stage['wall_seconds']:.2f}s" for stage in run_metrics['stages']
+    ))
+    return run
 
-    alpacaApiClient = AlpacaApiClient(
-        api_key_id=ALPACA_API_KEY_ID,
-        api_secret_key=ALPACA_API_SECRET_KEY
-    )   
+def run_pipelines(contexts: list[PipelineContext]) -> dict[str, DagRun]:
+    """
+    Runs every pipeline at the same time, each in its own thread.
 
+    Returns:
+        The run of every pipeline by name
+    """
+    with ThreadPoolExecutor(max_workers=len(contexts), thread_name_prefix="pipeline") as executor:
+        futures = {context.name: executor.submit(pipeline, context) for context in contexts}
+    return {name: future.result() for name, future in futures.items()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract, load and analyse stock bars")
+    parser.add_argument(
+        "--daemon", action="store_true",
+        help="keep running and run the pipeline on the schedule of the config, instead of once"
+    )
+    args = parser.parse_args()
+
+    config = get_yaml_config()
+    contexts = create_pipeline_contexts(config)
+    # The clients are shared, the first context gives access to them
+    shared = contexts[0]
+
+    logger.info("Fetching data from Alpaca Market API")
+    shared.metadata_logger.insert_log("Fetching data from Alpaca Market API")
     logger.info("Create a connection to the database")
-    metadata_logger.insert_log("Create a connection to the database")
+    shared.metadata_logger.insert_log("Create a connection to the database")
 
-    postgres_sql_client = PostgreSqlClient(
-            DB_USERNAME, 
-            DB_PASSWORD, 
-            SERVER_NAME, 
-            DATABASE_NAME
-        )
+    shared.schema_registry.ensure_schema(lambda: migrate_pipeline_tables(contexts))
 
-    # Get config values
-    source_table_name = config['config']['source_table_name']
-    checkpoint_table_name = config['config']['checkpoint_table_name']
-    load_method = config['config']['load_method']
+    if args.daemon:
+        # Engine, HTTP sessions, caches and reflected tables stay warm between runs
+        schedule_config = config['config'].get('schedule', {})
+        runner = ScheduledRunner(
+            functools.partial(run_pipelines, contexts),
+            DailySchedule(
+                times=schedule_config.get('times', ['16:15']),
+                timezone=schedule_config.get('timezone', 'America/New_York'),
+                weekdays=schedule_config.get('weekdays')
+            )
+        )
+        # Let the running run finish when the container is stopped
+        signal.signal(signal.SIGTERM, lambda *_: runner.stop())
+        signal.signal(signal.SIGINT, lambda *_: runner.stop())
+        runner.run_forever(run_immediately=schedule_config.get('run_on_start', False))
+    else:
+        # Run pipelines
+        run_pipelines(contexts)
 
-    # Run pipeline
-    pipeline()
\ No newline at end of file
+    shared.shared_alpaca_api_client.close()
+    # Write the remaining log messages before exiting
+    shared.metadata_logger.close()
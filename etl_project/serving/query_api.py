@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Optional, Union
+from sqlalchemy.engine import Engine
+from etl_project.serving.serving_tables import serving_table_name
+
+_MISSING = object()
+
+
+class LruCache:
+    """
+    Thread safe in-process cache of at most `max_entries` values, evicting the least recently
+    used one. Entries expire `ttl_seconds` after they were stored.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 60, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Any, tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key) -> Any:
+        """
+        Returns the cached value, `_MISSING` when there is none or it expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class ServingQueryClient:
+    """
+    Queries the serving tables built by `refresh_serving_tables` for dashboards.
+
+    Every query is an index lookup or a scan of a small precomputed table and its rows are cached
+    in process for `ttl_seconds`, repeated queries do not reach the database. The serving tables
+    are swapped in atomically, queries never wait on the ETL or find a table missing.
+    Returned rows are shared with the cache and must not be modified.
+    """
+
+    def __init__(self,
+                 engine: Engine,
+                 analysis_table_name: str = "stock_bars_analysis",
+                 max_entries: int = 256,
+                 ttl_seconds: float = 60,
+                 clock: Callable[[], float] = time.monotonic):
+        self.engine = engine
+        self.analysis_table_name = analysis_table_name
+        self.cache = LruCache(max_entries=max_entries, ttl_seconds=ttl_seconds, clock=clock)
+
+    def _query(self, sql: str, params: tuple = ()) -> list[dict]:
+        rows = self.cache.get((sql, params))
+        if rows is _MISSING:
+            rows = [dict(row) for row in self.engine.execute(sql, params).all()]
+            self.cache.put((sql, params), rows)
+        return rows
+
+    def _table(self, rollup: str) -> str:
+        return serving_table_name(self.analysis_table_name, rollup)
+
+    def latest_metrics(self, stock: Optional[str] = None) -> list[dict]:
+        """
+        Returns the latest close, return, moving average and standard deviation of every stock, or of `stock`.
+        """
+        if stock is not None:
+            return self._query(f"SELECT * FROM {self._table('latest_metrics')} WHERE stock = %s", (stock,))
+        return self._query(f"SELECT * FROM {self._table('latest_metrics')} ORDER BY stock")
+
+    def _ohlcv(self, rollup: str, stock: str, start: Optional[Union[str, date]], end: Optional[Union[str, date]]) -> list[dict]:
+        sql = f"SELECT * FROM {self._table(rollup)} WHERE stock = %s"
+        params = (stock,)
+        if start is not None:
+            sql += " AND period_start >= %s"
+            params += (str(start),)
+        if end is not None:
+            sql += " AND period_start <= %s"
+            params += (str(end),)
+        return self._query(sql + " ORDER BY period_start", params)
+
+    def weekly_ohlcv(self, stock: str, start: Optional[Union[str, date]] = None, end: Optional[Union[str, date]] = None) -> list[dict]:
+        """
+        Returns the weekly bars of the stock, of the weeks starting between `start` and `end` (inclusive).
+        """
+        return self._ohlcv("weekly_ohlcv", stock, start, end)
+
+    def monthly_ohlcv(self, stock: str, start: Optional[Union[str, date]] = None, end: Optional[Union[str, date]] = None) -> list[dict]:
+        """
+        Returns the monthly bars of the stock, of the months starting between `start` and `end` (inclusive).
+        """
+        return self._ohlcv("monthly_ohlcv", stock, start, end)
+
+    def volatility_ranking(self, limit: Optional[int] = None) -> list[dict]:
+        """
+        Returns the stocks from the most volatile over the recent trading days, the `limit` first ones when set.
+        """
+        sql = f"SELECT * FROM {self._table('volatility_ranking')} ORDER BY volatility_rank, stock"
+        if limit is not None:
+            return self._query(sql + " LIMIT %s", (int(limit),))
+        return self._query(sql)
+
+    def clear_cache(self) -> None:
+        """
+        Forgets the cached rows, e.g. right after a refresh in the same process.
+        """
+        self.cache.clear()
@@ -0,0 +1,92 @@
+import time
+from typing import Optional
+from jinja2 import Environment, FileSystemLoader
+from loguru import logger
+from sqlalchemy.engine import Engine
+
+SERVING_SQL_PATH = "etl_project/assets/sql/serving"
+
+# Rollup -> columns identifying a row, uniquely indexed for the lookups of `ServingQueryClient`.
+# Every rollup is built from the select of `sql/serving/<rollup>.sql`
+SERVING_TABLES = {
+    "latest_metrics": ["stock"],
+    "weekly_ohlcv": ["stock", "period_start"],
+    "monthly_ohlcv": ["stock", "period_start"],
+    "volatility_ranking": ["stock"],
+}
+
+
+def serving_table_name(analysis_table_name: str, rollup: str) -> str:
+    """
+    Returns the table serving a rollup, e.g. stock_bars_analysis_weekly_ohlcv.
+    """
+    return f"{analysis_table_name}_{rollup}"
+
+
+def validate_serving_tables(rollups: list[str]) -> None:
+    unknown = [rollup for rollup in rollups if rollup not in SERVING_TABLES]
+    if unknown:
+        raise Exception(f"Unknown serving tables {unknown}, supported: {list(SERVING_TABLES)}")
+
+
+def swap_in_table(connection, table_name: str, select_sql: str, key_columns: list[str], lock_timeout_ms: int = 2000) -> int:
+    """
+    Builds the table from the select next to the current one, then swaps it in.
+
+    Readers keep querying the current table while the new one is built and see the new rows
+    as soon as the transaction commits, the table never goes missing. The swap waits at most
+    `lock_timeout_ms` for the readers holding the current table, so readers queuing behind it
+    are never held up longer, and fails the refresh instead.
+
+    Returns:
+        The number of rows of the new table
+    """
+    new_table_name = f"{table_name}_new"
+    connection.execute(f"DROP TABLE IF EXISTS {new_table_name}")
+    rows = connection.execute(f"CREATE TABLE {new_table_name} AS {select_sql}").rowcount
+    connection.execute(f"CREATE UNIQUE INDEX {new_table_name}_key ON {new_table_name} ({', '.join(key_columns)})")
+    connection.execute(f"ANALYZE {new_table_name}")
+
+    connection.execute(f"SET LOCAL lock_timeout = {int(lock_timeout_ms)}")
+    connection.execute(f"DROP TABLE IF EXISTS {table_name}")
+    connection.execute(f"ALTER TABLE {new_table_name} RENAME TO {table_name}")
+    connection.execute(f"ALTER INDEX {new_table_name}_key RENAME TO {table_name}_key")
+    return rows
+
+
+def refresh_serving_tables(
+        engine: Engine,
+        source_table_name: str,
+        analysis_table_name: str,
+        rollups: Optional[list[str]] = None,
+        lock_timeout_ms: int = 2000
+    ) -> dict[str, int]:
+    """
+    Rebuilds the serving tables of the analysis table, each in its own transaction.
+
+    Args:
+        engine: sqlalchemy engine
+        source_table_name: daily bars the OHLCV rollups are aggregated from
+        analysis_table_name: analysis table the metrics rollups read, prefixes the serving tables
+        rollups: names of SERVING_TABLES to rebuild, all when None
+        lock_timeout_ms: longest wait of a swap for the readers of the current table
+
+    Returns:
+        The number of rows per serving table
+    """
+    rollups = list(SERVING_TABLES) if rollups is None else rollups
+    validate_serving_tables(rollups)
+    environment = Environment(loader=FileSystemLoader(SERVING_SQL_PATH))
+
+    rows_served = {}
+    for rollup in rollups:
+        table_name = serving_table_name(analysis_table_name, rollup)
+        select_sql = environment.get_template(f"{rollup}.sql").render(
+            source_table_name=source_table_name,
+            analysis_table_name=analysis_table_name
+        )
+        start = time.perf_counter()
+        with engine.begin() as connection:
+            rows_served[table_name] = swap_in_table(connection, table_name, select_sql, SERVING_TABLES[rollup], lock_timeout_ms)
+        logger.info(f"Serving table '{table_name}' refreshed with {rows_served[table_name]} rows in {time.perf_counter() - start:.3f}s")
+    return rows_served
@@ -0,0 +1,168 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Union
+from loguru import logger
+
+
+@dataclass
+class Node:
+    """
+    A task of the graph. `function` is called with the context and the values of its
+    dependencies as keyword arguments named after them, e.g.
+        Node("initial_transform", transform, dependencies=["convert_to_arrow_table", "stock_symbols"])
+    calls transform(context, convert_to_arrow_table=..., stock_symbols=...).
+    A dict of argument name -> node name passes a value under another name, e.g.
+        Node("save_checkpoints", save_checkpoints, dependencies={"watermarks": "load"})
+    """
+    name: str
+    function: Callable[..., Any]
+    dependencies: Union[list[str], dict[str, str]] = field(default_factory=list)
+    # Computes the rows of the node from its value, recorded with the node timings
+    rows: Optional[Callable[[Any], Optional[int]]] = None
+
+    def __post_init__(self):
+        if not isinstance(self.dependencies, dict):
+            self.dependencies = {dependency: dependency for dependency in self.dependencies}
+
+
+@dataclass
+class NodeResult:
+    name: str
+    status: str = "pending"  # one of: pending, success, failed, skipped (a dependency failed), reused
+    value: Any = None
+    error: Optional[BaseException] = None
+    wall_seconds: float = 0.0
+
+
+@dataclass
+class DagRun:
+    results: dict[str, NodeResult]
+    wall_seconds: float = 0.0
+
+    @property
+    def failed(self) -> list[str]:
+        return [name for name, result in self.results.items() if result.status in ("failed", "skipped")]
+
+    @property
+    def succeeded(self) -> bool:
+        return not self.failed
+
+    def value(self, name: str) -> Any:
+        return self.results[name].value
+
+
+class Dag:
+    """
+    Runs nodes as soon as their dependencies succeeded, independent nodes concurrently on a
+    thread pool. A failed node skips the nodes depending on it, the other branches carry on.
+
+    Passing the run of a failed attempt as `previous_run` re-runs only its failed and skipped
+    nodes, the values of the successful ones are reused.
+
+    Nodes running concurrently record overlapping API calls and memory peaks in `instrumentation`,
+    their wall times are their own.
+    """
+
+    def __init__(self, nodes: list[Node]):
+        self.nodes = {node.name: node for node in nodes}
+        if len(self.nodes) != len(nodes):
+            raise Exception("Node names must be unique")
+        for node in nodes:
+            unknown = [dependency for dependency in node.dependencies.values() if dependency not in self.nodes]
+            if unknown:
+                raise Exception(f"Node '{node.name}' depends on unknown nodes: {unknown}")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> list[str]:
+        order = []
+        state = {}
+
+        def visit(name: str, path: list[str]) -> None:
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise Exception(f"Dependency cycle: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for dependency in self.nodes[name].dependencies.values():
+                visit(dependency, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name, [])
+        return order
+
+    def _run_node(self, node: Node, context: Any, values: dict, instrumentation) -> NodeResult:
+        result = NodeResult(node.name)
+        start = time.perf_counter()
+        stage = instrumentation.stage(node.name) if instrumentation is not None else nullcontext()
+        try:
+            with stage as metrics:
+                result.value = node.function(context, **values)
+                if metrics is not None and node.rows is not None:
+                    metrics.rows = node.rows(result.value)
+            result.status = "success"
+        except Exception as e:
+            result.status = "failed"
+            result.error = e
+            logger.error(f"Node '{node.name}' failed: {e}")
+        result.wall_seconds = time.perf_counter() - start
+        return result
+
+    def run(self,
+            context: Any = None,
+            max_workers: int = 4,
+            previous_run: Optional[DagRun] = None,
+            instrumentation=None
+            ) -> DagRun:
+        """
+        Runs the graph.
+
+        Args:
+            context: passed to every node, e.g. the clients and configuration of the pipeline
+            max_workers: nodes running at the same time
+            previous_run: run whose successful nodes are reused instead of run again
+            instrumentation: `PipelineInstrumentation` recording every node as a stage
+
+        Returns:
+            The result of every node
+        """
+        start = time.perf_counter()
+        results = {name: NodeResult(name) for name in self.order}
+        if previous_run is not None:
+            for name, previous in previous_run.results.items():
+                if name in results and previous.status in ("success", "reused"):
+                    results[name] = NodeResult(name, status="reused", value=previous.value)
+
+        def done(name: str) -> bool:
+            return results[name].status in ("success", "reused")
+
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                for name in self.order:
+                    result = results[name]
+                    if result.status != "pending" or name in running.values():
+                        continue
+                    dependencies = self.nodes[name].dependencies.values()
+                    if any(results[dependency].status in ("failed", "skipped") for dependency in dependencies):
+                        result.status = "skipped"
+                        logger.warning(f"Node '{name}' skipped, a dependency failed")
+                    elif all(done(dependency) for dependency in dependencies):
+                        values = {
+                            argument: results[dependency].value
+                            for argument, dependency in self.nodes[name].dependencies.items()
+                        }
+                        future = executor.submit(self._run_node, self.nodes[name], context, values, instrumentation)
+                        running[future] = name
+
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    results[name] = future.result()
+
+        return DagRun(results=results, wall_seconds=time.perf_counter() - start)
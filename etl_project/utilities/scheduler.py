@@ -0,0 +1,108 @@
+import threading
+from datetime import datetime, time, timedelta
+from typing import Callable, Optional
+from zoneinfo import ZoneInfo
+from loguru import logger
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+
+class DailySchedule:
+    """
+    Cron-like schedule firing at fixed times of day in a timezone, e.g. 16:15 New York time on
+    weekdays, a quarter of an hour after the market closes. The wall clock time is kept across
+    daylight saving time changes.
+    """
+
+    def __init__(self,
+                 times: list[str],
+                 timezone: str = "America/New_York",
+                 weekdays: Optional[list[str]] = None):
+        self.times = sorted(time.fromisoformat(value) for value in times)
+        self.timezone = ZoneInfo(timezone)
+        self.weekdays = {WEEKDAYS.index(day.lower()[:3]) for day in (weekdays or WEEKDAYS[:5])}
+        if not self.times:
+            raise Exception("A schedule needs at least one time of day")
+
+    def next_run(self, after: datetime) -> datetime:
+        """
+        Returns the first run strictly after `after` (timezone aware), in the schedule timezone.
+        """
+        after = after.astimezone(self.timezone)
+        day = after.date()
+        while True:
+            if day.weekday() in self.weekdays:
+                for time_of_day in self.times:
+                    run = datetime.combine(day, time_of_day, tzinfo=self.timezone)
+                    if run > after:
+                        return run
+            day += timedelta(days=1)
+
+
+class ScheduledRunner:
+    """
+    Runs a job on a schedule until stopped, each run in a worker thread so the schedule keeps ticking.
+    A run due while the previous one is still going is skipped rather than queued.
+
+    Usage:
+        runner = ScheduledRunner(pipeline, DailySchedule(["16:15"]))
+        signal.signal(signal.SIGTERM, lambda *_: runner.stop())
+        runner.run_forever()
+    """
+
+    def __init__(self, job: Callable[[], None], schedule, clock: Optional[Callable[[], datetime]] = None):
+        self.job = job
+        self.schedule = schedule
+        self.clock = clock or (lambda: datetime.now().astimezone())
+        self.runs = 0
+        self.skipped = 0
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def _run_job(self) -> None:
+        try:
+            self.job()
+        except Exception as e:
+            # A failed run must not stop the daemon, the next run retries
+            logger.exception(f"Scheduled run failed: {e}")
+
+    def trigger(self) -> bool:
+        """
+        Starts a run unless the previous one is still going.
+
+        Returns:
+            True when a run was started
+        """
+        if self._worker is not None and self._worker.is_alive():
+            self.skipped += 1
+            logger.warning("Previous run is still going, skipping this run")
+            return False
+        self.runs += 1
+        self._worker = threading.Thread(target=self._run_job, name=f"scheduled-run-{self.runs}")
+        self._worker.start()
+        return True
+
+    def run_forever(self, run_immediately: bool = False) -> None:
+        """
+        Triggers the job at every scheduled time until `stop` is called, then waits for the running job.
+        """
+        if run_immediately:
+            self.trigger()
+        while not self._stop.is_set():
+            next_run = self.schedule.next_run(self.clock())
+            logger.info(f"Next run at {next_run.isoformat()}")
+            while not self._stop.is_set():
+                seconds = (next_run - self.clock()).total_seconds()
+                if seconds <= 0:
+                    self.trigger()
+                    break
+                # Wake up at least every minute so a sleeping host or clock change does not delay runs for long
+                self._stop.wait(min(seconds, 60))
+        self.join()
+
+    def join(self) -> None:
+        if self._worker is not None:
+            self._worker.join()
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -1,8 +1,12 @@
+import pandas as pd
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
 from sqlalchemy import MetaData
-from etl_project.assets.assets import extract_from_query
+from etl_project.assets.assets import extract_from_query, migrate_stock_bars_table
 from etl_project.connectors.postgresql import PostgreSqlClient
+from etl_project.connectors.schema_registry import get_schema_registry
 from sqlalchemy import (
-        Table, MetaData, inspect, Column, String)
+        Table, MetaData, inspect, Column, DateTime, String)
 from typing import Optional
 
 def get_checkpoint(engine, checkpoint_table_name: str, table_name: str) -> Optional[str]:
@@ -19,7 +23,7 @@ def get_checkpoint(engine, checkpoint_table_name: str, table_name: str) -> Optio
         engine=engine
     )
     
-    return latest_timestamp[0].get('latest_timestamp') if latest_timestamp else None
+    return _isoformat(latest_timestamp[0].get('latest_timestamp')) if latest_timestamp else None
     
 def save_checkpoint(engine, checkpoint_table_name: str, table_name: str, latest_timestamp: str):
     """
@@ -29,14 +33,13 @@ def save_checkpoint(engine, checkpoint_table_name: str, table_name: str, latest_
     metadata = MetaData(bind=engine)
 
     # Create table if it doesn't exist
-    if not inspect(engine).has_table(checkpoint_table_name):
-        table = Table(
-            checkpoint_table_name,
-            metadata,
-            Column("table_name", String, primary_key=True),  
-            Column("latest_timestamp", String)
-        )
-        metadata.create_all(engine)
+    table = Table(
+        checkpoint_table_name,
+        metadata,
+        Column("table_name", String, primary_key=True),  
+        Column("latest_timestamp", DateTime(timezone=True))
+    )
+    get_schema_registry(engine).ensure(metadata)
 
     # Raw SQL upsert
     sql = f"""
@@ -48,5 +51,230 @@ def save_checkpoint(engine, checkpoint_table_name: str, table_name: str, latest_
 
     engine.execute(sql, (table_name, latest_timestamp))
 
+def migrate_checkpoint_tables(engine, checkpoint_table_name: str, symbol_checkpoint_table_name: str) -> list[str]:
+    """
+    Converts the timestamps of checkpoint tables created with string timestamps to timestamptz
+    and adds the `covered_from` and `covered_to` columns to symbol checkpoint tables created without them.
+
+    Returns:
+        The migrated columns, as <table>.<column>
+    """
+    migrated = []
+    if inspect(engine).has_table(symbol_checkpoint_table_name):
+        column_names = [column["name"] for column in inspect(engine).get_columns(symbol_checkpoint_table_name)]
+        if "covered_from" not in column_names:
+            engine.execute(f"ALTER TABLE {symbol_checkpoint_table_name} ADD COLUMN covered_from timestamptz")
+            migrated.append(f"{symbol_checkpoint_table_name}.covered_from")
+        if "covered_to" not in column_names:
+            # A symbol extracted without bars has a covered range but no loaded range
+            engine.execute(f"""
+                ALTER TABLE {symbol_checkpoint_table_name}
+                    ADD COLUMN covered_to timestamptz,
+                    ALTER COLUMN earliest_timestamp DROP NOT NULL,
+                    ALTER COLUMN latest_timestamp DROP NOT NULL
+            """)
+            migrated.append(f"{symbol_checkpoint_table_name}.covered_to")
+    for table_name, column_names in [
+        (checkpoint_table_name, ["latest_timestamp"]),
+        (symbol_checkpoint_table_name, ["earliest_timestamp", "latest_timestamp"]),
+    ]:
+        if not inspect(engine).has_table(table_name):
+            continue
+        for column in inspect(engine).get_columns(table_name):
+            if column["name"] in column_names and isinstance(column["type"], String):
+                engine.execute(
+                    f"ALTER TABLE {table_name} ALTER COLUMN {column['name']} TYPE timestamptz USING {column['name']}::timestamptz"
+                )
+                migrated.append(f"{table_name}.{column['name']}")
+    return migrated
+
+def migrate_schema(
+        postgresql_client: PostgreSqlClient,
+        stock_bars_table_names: list[str],
+        checkpoint_table_name: str,
+        symbol_checkpoint_table_name: str
+    ) -> list[str]:
+    """
+    Migrates the bars and checkpoint tables created with string timestamps to timestamptz,
+    the bars tables partitioned by month, and adds the later checkpoint columns.
+
+    Returns:
+        The migrated tables and columns
+    """
+    migrated = [
+        table_name for table_name in stock_bars_table_names
+        if migrate_stock_bars_table(postgresql_client, table_name)
+    ]
+    return migrated + migrate_checkpoint_tables(postgresql_client.engine, checkpoint_table_name, symbol_checkpoint_table_name)
+
+@dataclass
+class ExtractRange:
+    """
+    One extract of the plan: the bars of `symbols` from `start_date` to `end_date` (now when None).
+    """
+    symbols: list[str]
+    start_date: str
+    end_date: Optional[str] = None
+
+def extract_coverage(extract_ranges: list[ExtractRange], today: Optional[date] = None) -> dict[str, tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Returns the start of the earliest and the end of the latest extract of every symbol of the plan,
+    at midnight UTC. An extract without end date ends `today` (UTC), the planner extracts that day again.
+    """
+    today = pd.Timestamp(today or datetime.now(timezone.utc).date(), tz="UTC")
+    coverage = {}
+    for extract_range in extract_ranges:
+        start = pd.Timestamp(extract_range.start_date, tz="UTC")
+        end = pd.Timestamp(extract_range.end_date, tz="UTC") if extract_range.end_date else today
+        for symbol in extract_range.symbols:
+            covered_from, covered_to = coverage.get(symbol, (start, end))
+            coverage[symbol] = (min(start, covered_from), max(end, covered_to))
+    return coverage
+
+def define_symbol_checkpoint_table(metadata: MetaData, symbol_checkpoint_table_name: str) -> Table:
+    return Table(
+        symbol_checkpoint_table_name,
+        metadata,
+        Column("table_name", String, primary_key=True),
+        Column("symbol", String, primary_key=True),
+        Column("timeframe", String, primary_key=True),
+        # First and last bar loaded, none when the extracts of the symbol held no bars
+        Column("earliest_timestamp", DateTime(timezone=True)),
+        Column("latest_timestamp", DateTime(timezone=True)),
+        # Start of the earliest extract of the symbol, before its first bar when the extract began
+        # on a market holiday or before the symbol was listed
+        Column("covered_from", DateTime(timezone=True)),
+        # End of the latest extract of the symbol, used while it has no bars loaded
+        Column("covered_to", DateTime(timezone=True))
+    )
+
+def get_symbol_checkpoints(engine, symbol_checkpoint_table_name: str, table_name: str, timeframe: str) -> dict[str, tuple[str, str]]:
+    """
+    Get the earliest timestamp covered and the latest timestamp loaded of every symbol of the table
+    and timeframe. The earliest timestamp covered is the first bar loaded, or the start of the earliest
+    extract when there were no bars between it and the first bar. A symbol without bars loaded
+    has the covered range of its extracts instead.
+
+    Returns:
+        A dict of symbol -> (earliest_timestamp, latest_timestamp), empty when nothing was saved yet
+    """
+    if not get_schema_registry(engine).has_table(symbol_checkpoint_table_name):
+        return {}
+
+    sql = f"""
+    SELECT symbol,
+        LEAST(earliest_timestamp, covered_from) AS earliest_timestamp,
+        COALESCE(latest_timestamp, covered_to) AS latest_timestamp
+    FROM {symbol_checkpoint_table_name}
+    WHERE table_name = %s AND timeframe = %s;
+    """
+    return {
+        row["symbol"]: (_isoformat(row["earliest_timestamp"]), _isoformat(row["latest_timestamp"]))
+        for row in engine.execute(sql, (table_name, timeframe)).all()
+    }
+
+def save_symbol_checkpoints(
+        engine,
+        symbol_checkpoint_table_name: str,
+        table_name: str,
+        timeframe: str,
+        watermarks: dict,
+        coverage: Optional[dict] = None
+    ) -> None:
+    """
+    Save the loaded and the extracted range of every symbol, widening the ranges already saved.
+
+    Args:
+        watermarks: dict of symbol -> (earliest_timestamp, latest_timestamp) loaded by the run
+        coverage: dict of symbol -> (start, end) extracted by the run, see `extract_coverage`, so a range
+            without bars, at the start of an extract or for a whole symbol, is not extracted again
+    """
+    coverage = coverage or {}
+    if not watermarks and not coverage:
+        return
+
+    metadata = MetaData()
+    define_symbol_checkpoint_table(metadata, symbol_checkpoint_table_name)
+    get_schema_registry(engine).ensure(metadata)
+
+    sql = f"""
+    INSERT INTO {symbol_checkpoint_table_name} (table_name, symbol, timeframe, earliest_timestamp, latest_timestamp, covered_from, covered_to)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (table_name, symbol, timeframe)
+    DO UPDATE SET
+        earliest_timestamp = LEAST({symbol_checkpoint_table_name}.earliest_timestamp, EXCLUDED.earliest_timestamp),
+        latest_timestamp = GREATEST({symbol_checkpoint_table_name}.latest_timestamp, EXCLUDED.latest_timestamp),
+        covered_from = LEAST({symbol_checkpoint_table_name}.covered_from, EXCLUDED.covered_from),
+        covered_to = GREATEST({symbol_checkpoint_table_name}.covered_to, EXCLUDED.covered_to);
+    """
+    rows = []
+    for symbol in sorted(set(watermarks) | set(coverage)):
+        earliest, latest = watermarks.get(symbol, (None, None))
+        covered_from, covered_to = coverage.get(symbol, (None, None))
+        rows.append((
+            table_name, symbol, timeframe,
+            _isoformat(earliest), _isoformat(latest), _isoformat(covered_from), _isoformat(covered_to)
+        ))
+    engine.execute(sql, rows)
+
+def get_symbol_watermarks_from_table(engine, table_name: str) -> dict[str, tuple[str, str]]:
+    """
+    Computes the loaded range of every symbol from the table itself, used to seed the
+    symbol checkpoints of a table loaded before they existed.
+    """
+    sql = f"""
+    SELECT stock, MIN(timestamp) AS earliest_timestamp, MAX(timestamp) AS latest_timestamp
+    FROM {table_name}
+    GROUP BY stock;
+    """
+    return {
+        row["stock"]: (_isoformat(row["earliest_timestamp"]), _isoformat(row["latest_timestamp"]))
+        for row in engine.execute(sql).all()
+    }
+
+def plan_extract_ranges(
+        symbols: list[str],
+        symbol_checkpoints: dict[str, tuple[str, str]],
+        backfill_start_date: str,
+        end_date: Optional[str] = None,
+        merge_within_days: int = 0
+    ) -> list[ExtractRange]:
+    """
+    Plans the extracts covering what is missing for every symbol:
+    a symbol without checkpoint is backfilled from `backfill_start_date`, a symbol whose earliest
+    covered timestamp is after `backfill_start_date` gets the missing history and every symbol is extracted
+    from its latest loaded date (included, in case that day was incomplete) to `end_date`.
+
+    Symbols needing the same range share one extract. With `merge_within_days`, extracts ending
+    together whose start dates are at most that many days apart are merged from the earliest start,
+    trading a few bars fetched twice for fewer requests.
+    """
+    ranges = {}
+    for symbol in symbols:
+        checkpoint = symbol_checkpoints.get(symbol)
+        if checkpoint is None:
+            ranges.setdefault((backfill_start_date, end_date), []).append(symbol)
+            continue
+
+        earliest_date, latest_date = checkpoint[0][:10], checkpoint[1][:10]
+        if earliest_date > backfill_start_date:
+            ranges.setdefault((backfill_start_date, earliest_date), []).append(symbol)
+        ranges.setdefault((latest_date, end_date), []).append(symbol)
 
+    plan = []
+    for (start_date, range_end_date), range_symbols in sorted(ranges.items(), key=lambda item: (str(item[0][1]), item[0][0])):
+        previous = plan[-1] if plan else None
+        if (
+            previous is not None
+            and previous.end_date == range_end_date
+            and (date.fromisoformat(start_date) - date.fromisoformat(previous.start_date)).days <= merge_within_days
+        ):
+            previous.symbols.extend(symbol for symbol in range_symbols if symbol not in previous.symbols)
+            continue
+        plan.append(ExtractRange(symbols=list(range_symbols), start_date=start_date, end_date=range_end_date))
+    return plan
 
+def _isoformat(timestamp) -> Optional[str]:
+    if timestamp is None or isinstance(timestamp, str):
+        return timestamp
+    return pd.Timestamp(timestamp).tz_convert("UTC").isoformat()
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import MetaData
+from etl_project.assets.aggregation import aggregate_bars, refresh_derived_timeframes, table_name_for_timeframe
+from etl_project.assets.assets import define_stock_bars_table, load
+
+# ---------- Fixtures ----------
+
+@pytest.fixture
+def minute_bars():
+    # Two sessions of 1Min bars, 09:30 to 16:00 New York time
+    timestamps = pd.DatetimeIndex([])
+    for session in ["2025-09-02", "2025-09-03"]:
+        start = pd.Timestamp(f"{session} 09:30", tz="America/New_York").tz_convert("UTC")
+        timestamps = timestamps.append(pd.date_range(start, periods=390, freq="1min"))
+
+    rng = np.random.default_rng(7)
+    frames = []
+    for stock, company in [("AAPL", "Apple"), ("MSFT", "Microsoft")]:
+        close = 100 + rng.normal(0, 0.1, len(timestamps)).cumsum()
+        frames.append(pd.DataFrame({
+            "stock": stock,
+            "company": company,
+            "timestamp": timestamps,
+            "open": close - 0.05,
+            "high": close + 0.2,
+            "low": close - 0.2,
+            "close": close,
+            "volume": rng.integers(0, 1000, len(timestamps)),
+            "volume_weighted_avg_price": close + 0.01,
+            "number_of_trades": rng.integers(1, 50, len(timestamps)),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+# ---------- Tests ----------
+
+def test_aggregate_bars_ohlcv(minute_bars):
+    df_5min = aggregate_bars(minute_bars, "5Min")
+
+    assert list(df_5min.columns) == list(minute_bars.columns)
+    assert len(df_5min) == 2 * 2 * 78
+
+    first = df_5min.iloc[0]
+    source = minute_bars.iloc[:5]
+    assert first["timestamp"] == source["timestamp"].iloc[0]
+    assert first["open"] == source["open"].iloc[0]
+    assert first["close"] == source["close"].iloc[-1]
+    assert first["high"] == source["high"].max()
+    assert first["low"] == source["low"].min()
+    assert first["volume"] == source["volume"].sum()
+    assert first["number_of_trades"] == source["number_of_trades"].sum()
+    assert first["volume_weighted_avg_price"] == pytest.approx(
+        (source["volume_weighted_avg_price"] * source["volume"]).sum() / source["volume"].sum()
+    )
+
+def test_aggregate_bars_daily_buckets_are_new_york_sessions(minute_bars):
+    df_day = aggregate_bars(minute_bars, "1Day")
+
+    # The session ends at 20:00 UTC, its bars stay in one bucket starting at New York midnight
+    assert df_day["timestamp"].dt.strftime("%Y-%m-%dT%H:%M").tolist() == [
+        "2025-09-02T04:00", "2025-09-03T04:00", "2025-09-02T04:00", "2025-09-03T04:00"
+    ]
+    assert df_day["volume"].sum() == minute_bars["volume"].sum()
+
+def test_aggregate_bars_without_volume_averages_vwap():
+    df = pd.DataFrame({
+        "stock": ["AAPL", "AAPL"],
+        "company": ["Apple", "Apple"],
+        "timestamp": pd.to_datetime(["2025-09-02T13:30:00Z", "2025-09-02T13:31:00Z"], utc=True),
+        "open": [1.0, 2.0], "high": [1.0, 2.0], "low": [1.0, 2.0], "close": [1.0, 2.0],
+        "volume": [0, 0],
+        "volume_weighted_avg_price": [1.0, 2.0],
+        "number_of_trades": [0, 0],
+    })
+
+    assert aggregate_bars(df, "5Min")["volume_weighted_avg_price"].tolist() == [1.5]
+
+def test_refresh_derived_timeframes_completes_partial_buckets(db_client, minute_bars):
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, "stock_bars_minute_test")
+    derived_tables = [table_name_for_timeframe(table.name, timeframe, "1Min") for timeframe in ["15Min", "1Day"]]
+    for table_name in [table.name, *derived_tables]:
+        db_client.drop_table(table_name)
+
+    # The first run loads the morning of the second session only
+    cutoff = pd.Timestamp("2025-09-03 12:07", tz="America/New_York")
+    load(df=minute_bars[minute_bars["timestamp"] < cutoff], postgresql_client=db_client, table=table, metadata=metadata, load_method="bulk_upsert")
+    refresh_derived_timeframes(db_client, table.name, "1Min", ["15Min", "1Day"])
+
+    # The second run loads the afternoon and refreshes from the 12:00 bucket its earliest bar falls in
+    load(df=minute_bars[minute_bars["timestamp"] >= cutoff], postgresql_client=db_client, table=table, metadata=metadata, load_method="bulk_upsert")
+    rows_loaded = refresh_derived_timeframes(db_client, table.name, "1Min", ["15Min", "1Day"], since=cutoff)
+
+    assert rows_loaded == {"stock_bars_minute_test_15min": 2 * 16, "stock_bars_minute_test_1day": 2}
+    df_day = pd.DataFrame(db_client.select_all(define_stock_bars_table(MetaData(), "stock_bars_minute_test_1day")))
+    expected = aggregate_bars(minute_bars, "1Day")
+    assert sorted(df_day["volume"].tolist()) == sorted(expected["volume"].tolist())
+    assert len(db_client.select_all(define_stock_bars_table(MetaData(), "stock_bars_minute_test_15min"))) == 2 * 2 * 26
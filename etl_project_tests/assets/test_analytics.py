@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+from jinja2 import Environment, FileSystemLoader
+from sqlalchemy import MetaData
+from etl_project.assets.analytics import compute_stock_bars_analysis, round_half_away_from_zero
+from etl_project.assets.assets import define_stock_bars_table, load, transform_and_load_analysis_table
+from etl_project.benchmarks.synthetic import generate_stock_bars_frame
+
+# ---------- Tests ----------
+
+def test_round_half_away_from_zero():
+    values = np.array([2.675, -2.675, 0.125, 1.005, np.nan])
+    np.testing.assert_array_equal(round_half_away_from_zero(values, 2), [2.68, -2.68, 0.13, 1.01, np.nan])
+
+def test_metrics_per_stock():
+    df_stock = pd.DataFrame({
+        "stock": ["B", "A", "A", "A", "B"],
+        "company": ["Bee", "Ay", "Ay", "Ay", "Bee"],
+        "timestamp": pd.to_datetime([
+            "2025-01-01T04:00:00Z", "2025-01-02T04:00:00Z", "2025-01-01T04:00:00Z",
+            "2025-01-03T04:00:00Z", "2025-01-02T04:00:00Z",
+        ]),
+        "close": [50.0, 110.0, 100.0, 99.0, 0.0],
+    })
+    analysis = compute_stock_bars_analysis(df_stock, window=2)
+
+    assert analysis["stock"].tolist() == ["A", "A", "A", "B", "B"]
+    np.testing.assert_array_equal(analysis["prev_close"], [np.nan, 100.0, 110.0, np.nan, 50.0])
+    np.testing.assert_array_equal(analysis["daily_return_pct"], [np.nan, 10.0, -10.0, np.nan, -100.0])
+    np.testing.assert_array_equal(analysis["moving_avg_2_day"], [100.0, 105.0, 104.5, 50.0, 25.0])
+    np.testing.assert_array_equal(analysis["stddev_2_day"], [np.nan, np.nan, 0.14, np.nan, np.nan])
+
+def test_metrics_match_analysis_sql(db_client):
+    df_stock = generate_stock_bars_frame(symbol_count=20, bars_per_symbol=60, seed=7)
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, "stock_bars_analytics_test")
+    load(df_stock, db_client, table, metadata, load_method="bulk_overwrite")
+
+    environment = Environment(loader=FileSystemLoader("etl_project/assets/sql/transform"))
+    transform_and_load_analysis_table(
+        environment, db_client.engine,
+        source_table_name=table.name, analysis_table_name="stock_bars_analytics_sql_test",
+    )
+    expected = pd.read_sql("select * from stock_bars_analytics_sql_test order by stock, date", db_client.engine)
+
+    analysis = compute_stock_bars_analysis(df_stock)
+
+    assert analysis["stock"].tolist() == expected["stock"].tolist()
+    assert (analysis["date"].dt.date == expected["date"]).all()
+    for column in ["close", "prev_close", "daily_return_pct", "moving_avg_5_day", "stddev_5_day"]:
+        np.testing.assert_allclose(analysis[column], expected[column].astype(float), rtol=0, atol=1e-9, err_msg=column)
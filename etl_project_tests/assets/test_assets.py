@@ -0,0 +1,231 @@
+import pandas as pd
+import pytest
+from jinja2 import Environment, FileSystemLoader
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, create_engine, event
+from etl_project.assets.assets import (
+    convert_to_arrow_table,
+    convert_to_dataframe,
+    define_stock_bars_table,
+    extract_alpaca_data_pages_for_ranges,
+    extract_stock_symbol,
+    initial_transform,
+    load,
+    load_in_chunks,
+    migrate_stock_bars_table,
+    stream_transform_and_load,
+    transform_and_load_analysis_table,
+    update_watermarks,
+)
+from etl_project.connectors.alpaca_api import AlpacaApiClient
+from etl_project.utilities.utilities import ExtractRange
+from etl_project.benchmarks.stub_alpaca_server import StubAlpacaServer, generate_bars
+
+STOCK_SYMBOL_CSV_PATH = "etl_project/data/top_tech_stock_symbol.csv"
+
+# ---------- Fixtures ----------
+
+@pytest.fixture
+def df_stock_symbol():
+    return extract_stock_symbol(STOCK_SYMBOL_CSV_PATH)
+
+@pytest.fixture
+def stub_bars(df_stock_symbol):
+    return generate_bars(df_stock_symbol["Symbol"].tolist(), start_date="2025-01-01", days=90)
+
+# ---------- Tests ----------
+
+def test_stream_transform_and_load_matches_batch(db_client, df_stock_symbol, stub_bars):
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, "stock_bars_stream_test")
+    db_client.drop_table(table.name)
+
+    with StubAlpacaServer(stub_bars) as server:
+        client = AlpacaApiClient("key", "secret", base_url=server.url, page_limit=100)
+        pages = extract_alpaca_data_pages_for_ranges(
+            [ExtractRange(symbols=df_stock_symbol["Symbol"].tolist(), start_date="2025-01-01")],
+            "1Day",
+            client,
+            symbols_per_request=3,
+        )
+        rows_loaded, latest_timestamp = stream_transform_and_load(
+            pages=pages,
+            df_stock_symbol=df_stock_symbol,
+            postgresql_client=db_client,
+            table=table,
+            metadata=metadata,
+            load_method="overwrite",
+            chunk_size=64,
+        )
+
+    df_batch = initial_transform(convert_to_dataframe(stub_bars), df_stock_symbol)
+    assert rows_loaded == len(df_batch) == len(db_client.select_all(table))
+    assert latest_timestamp == df_batch["timestamp"].max()
+
+def test_convert_to_dataframe_does_not_modify_the_payload(stub_bars):
+    df = convert_to_dataframe(stub_bars)
+
+    assert list(df.columns) == ["c", "h", "l", "n", "o", "t", "v", "vw", "symbol"]
+    assert len(df) == sum(len(records) for records in stub_bars.values())
+    assert all("symbol" not in record for records in stub_bars.values() for record in records)
+    assert df["symbol"].tolist()[0] == next(iter(stub_bars))
+
+def test_initial_transform_of_arrow_table_matches_dataframe(df_stock_symbol, stub_bars):
+    # A stock missing from the symbol csv is dropped by both
+    bars = dict(stub_bars, UNKNOWN=stub_bars["AAPL"])
+
+    df_from_arrow = initial_transform(convert_to_arrow_table(bars), df_stock_symbol)
+    df_from_dataframe = initial_transform(convert_to_dataframe(bars), df_stock_symbol)
+
+    assert df_from_arrow.equals(df_from_dataframe)
+    assert "UNKNOWN" not in set(df_from_arrow["stock"])
+    assert len(df_from_arrow) == sum(len(records) for records in stub_bars.values())
+    assert list(df_from_arrow.columns) == [
+        "stock", "company", "timestamp", "open", "high", "low", "close", "volume", "volume_weighted_avg_price", "number_of_trades"
+    ]
+    assert str(df_from_arrow["timestamp"].dt.tz) == "UTC"
+    assert df_from_arrow.loc[df_from_arrow["stock"] == "AAPL", "company"].unique().tolist() == ["Apple"]
+
+def test_stream_extract_ranges_tracks_watermarks(db_client, df_stock_symbol, stub_bars):
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, "stock_bars_ranges_test")
+    extract_ranges = [
+        ExtractRange(symbols=["AAPL", "MSFT"], start_date="2025-03-01"),
+        ExtractRange(symbols=["NVDA"], start_date="2025-01-01", end_date="2025-01-10"),
+    ]
+
+    watermarks = {}
+    with StubAlpacaServer(stub_bars) as server:
+        client = AlpacaApiClient("key", "secret", base_url=server.url, page_limit=20)
+        stream_transform_and_load(
+            pages=extract_alpaca_data_pages_for_ranges(extract_ranges, "1Day", client, symbols_per_request=1),
+            df_stock_symbol=df_stock_symbol,
+            postgresql_client=db_client,
+            table=table,
+            metadata=metadata,
+            load_method="overwrite",
+            watermarks=watermarks,
+        )
+
+    assert set(watermarks) == {"AAPL", "MSFT", "NVDA"}
+    assert str(watermarks["AAPL"][0].date()) == "2025-03-01"
+    assert str(watermarks["AAPL"][1].date()) == "2025-03-31"
+    assert [str(timestamp.date()) for timestamp in watermarks["NVDA"]] == ["2025-01-01", "2025-01-09"]
+    assert len(db_client.select_all(table)) == 2 * 31 + 9
+
+def test_update_watermarks_widens_ranges():
+    df_stock = pd.DataFrame({
+        "stock": ["AAPL", "AAPL", "MSFT"],
+        "timestamp": pd.to_datetime(["2025-09-02", "2025-09-05", "2025-09-03"], utc=True),
+    })
+    watermarks = {"AAPL": (pd.Timestamp("2025-09-03", tz="UTC"), pd.Timestamp("2025-09-04", tz="UTC"))}
+
+    update_watermarks(watermarks, df_stock)
+
+    assert watermarks == {
+        "AAPL": (pd.Timestamp("2025-09-02", tz="UTC"), pd.Timestamp("2025-09-05", tz="UTC")),
+        "MSFT": (pd.Timestamp("2025-09-03", tz="UTC"), pd.Timestamp("2025-09-03", tz="UTC")),
+    }
+
+def test_load_in_chunks_overwrites_once(db_client, df_stock_symbol, stub_bars):
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, "stock_bars_chunk_test")
+    df_stock = initial_transform(convert_to_dataframe(stub_bars), df_stock_symbol)
+
+    for _ in range(2):
+        load_in_chunks(df_stock, db_client, table, metadata, load_method="overwrite", chunk_size=100)
+
+    assert len(db_client.select_all(table)) == len(df_stock)
+
+def test_bulk_load_stores_same_rows_as_insert(db_client, df_stock_symbol, stub_bars):
+    df_stock = initial_transform(convert_to_dataframe(stub_bars), df_stock_symbol)
+
+    results = {}
+    for load_method in ["overwrite", "bulk_overwrite"]:
+        metadata = MetaData()
+        table = define_stock_bars_table(metadata, f"stock_bars_{load_method}_test")
+        load(df_stock, db_client, table, metadata, load_method=load_method)
+        results[load_method] = sorted(db_client.select_all(table), key=lambda row: (row["stock"], row["timestamp"]))
+
+    assert results["overwrite"] == results["bulk_overwrite"]
+
+@pytest.mark.parametrize("session_timezone", ["UTC", "America/New_York"])
+def test_incremental_analysis_refresh_matches_full_refresh(db_client, df_stock_symbol, session_timezone):
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, "stock_bars_analysis_source_test")
+    bars = generate_bars(df_stock_symbol["Symbol"].tolist(), start_date="2025-01-01", days=40)
+    # make returns irregular so the rolling windows are not constant
+    for records in bars.values():
+        for i, record in enumerate(records):
+            record["c"] += (i % 7) * 6.5 - (i % 3) * 10.5
+
+    old_bars = {symbol: records[:30] for symbol, records in bars.items()}
+    load(initial_transform(convert_to_dataframe(old_bars), df_stock_symbol), db_client, table, metadata, "overwrite")
+
+    template_params = {"source_table_name": table.name, "analysis_table_name": "stock_bars_analysis_incremental_test"}
+    db_client.drop_table(template_params["analysis_table_name"])
+    full_environment = Environment(loader=FileSystemLoader("etl_project/assets/sql/transform"))
+    incremental_environment = Environment(loader=FileSystemLoader("etl_project/assets/sql/incremental"))
+    transform_and_load_analysis_table(full_environment, db_client.engine, **template_params)
+
+    # new and revised bars arrive from the 29th day on
+    new_bars = {symbol: records[28:] for symbol, records in bars.items()}
+    load(initial_transform(convert_to_dataframe(new_bars), df_stock_symbol), db_client, table, metadata, "upsert")
+    # The bars are at 04:00 UTC, before midnight in New York: the refresh must start at midnight UTC
+    engine = create_engine(db_client.engine.url)
+
+    def set_session_timezone(dbapi_connection, _):
+        dbapi_connection.cursor().execute(f"SET TimeZone = '{session_timezone}'")
+        # committed, or the pool's rollback on checkin reverts it
+        dbapi_connection.commit()
+
+    event.listen(engine, "connect", set_session_timezone)
+    transform_and_load_analysis_table(incremental_environment, engine, since_date="2025-01-29", **template_params)
+    engine.dispose()
+
+    expected_params = {"source_table_name": table.name, "analysis_table_name": "stock_bars_analysis_full_test"}
+    transform_and_load_analysis_table(full_environment, db_client.engine, **expected_params)
+
+    query = "select * from {} order by stock, date"
+    incremental = [dict(row) for row in db_client.engine.execute(query.format(template_params["analysis_table_name"]))]
+    full = [dict(row) for row in db_client.engine.execute(query.format(expected_params["analysis_table_name"]))]
+    assert len(incremental) == len(df_stock_symbol) * 40
+    assert incremental == full
+
+def test_migrate_string_timestamps_to_partitioned_table(db_client, df_stock_symbol, stub_bars):
+    db_client.drop_table("stock_bars_migration_test")
+    metadata = MetaData()
+    legacy_table = Table(
+        "stock_bars_migration_test",
+        metadata,
+        Column("stock", String, primary_key=True),
+        Column("company", String),
+        Column("timestamp", String, primary_key=True),
+        Column("open", Float),
+        Column("high", Float),
+        Column("low", Float),
+        Column("close", Float),
+        Column("volume", Integer),
+        Column("volume_weighted_avg_price", Float),
+        Column("number_of_trades", Integer),
+    )
+    df_stock = initial_transform(convert_to_dataframe(stub_bars), df_stock_symbol)
+    load(df_stock, db_client, legacy_table, metadata, load_method="bulk_insert")
+
+    assert migrate_stock_bars_table(db_client, legacy_table.name)
+    assert not migrate_stock_bars_table(db_client, legacy_table.name)
+
+    table = define_stock_bars_table(MetaData(), legacy_table.name)
+    rows = db_client.select_all(table)
+    assert len(rows) == len(df_stock)
+    assert min(row["timestamp"] for row in rows) == df_stock["timestamp"].min()
+    with db_client.engine.connect() as connection:
+        assert db_client.get_partition_column(connection, table.name) == "timestamp"
+
+    # A range scan only reads the partitions of its months
+    plan = "\n".join(
+        row[0] for row in db_client.engine.execute(
+            f"EXPLAIN SELECT * FROM {table.name} WHERE timestamp >= '2025-03-01' AND stock = 'AAPL'"
+        )
+    )
+    assert f"{table.name}_p2025_03" in plan
+    assert f"{table.name}_p2025_01" not in plan
@@ -0,0 +1,95 @@
+import time
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+from etl_project.assets.assets import convert_to_arrow_table, initial_transform, transform_to_arrow
+from etl_project.assets.validation import VALIDATION_RULES, validate_and_quarantine, validate_bars
+from etl_project.benchmarks.synthetic import generate_alpaca_bars, generate_stock_symbol_frame
+
+# ---------- Fixtures ----------
+
+@pytest.fixture
+def df_stock():
+    timestamps = pd.date_range("2025-09-01 14:30", periods=8, freq="1min", tz="UTC")
+    return pd.DataFrame({
+        "stock": ["AAPL"] * 7 + ["ZZZZ"],
+        "company": ["Apple"] * 7 + [None],
+        "timestamp": list(timestamps[:6]) + [timestamps[0], timestamps[7]],
+        "open": [10.0, 10.0, 10.0, 10.0, np.nan, 10.0, 10.5, 10.0],
+        "high": [11.0, 9.0, 11.0, 11.0, 11.0, 11.0, 11.0, 11.0],
+        "low": [9.0, 10.0, 9.0, 9.0, 9.0, 9.0, 9.0, 9.0],
+        "close": [10.5, 10.0, 12.0, 10.0, 10.0, 10.0, 10.0, 10.0],
+        "volume": [100, 100, 100, -1, 100, 100, 100, 100],
+        "volume_weighted_avg_price": [10.2] * 8,
+        "number_of_trades": [5] * 8,
+    })
+
+# ---------- Tests ----------
+
+@pytest.mark.parametrize("as_arrow", [False, True])
+def test_validate_bars_reports_every_rule(df_stock, as_arrow):
+    data = pa.Table.from_pandas(df_stock, preserve_index=False) if as_arrow else df_stock
+    result = validate_bars(data)
+
+    assert list(result.rule_counts) == VALIDATION_RULES
+    assert result.rule_counts == {
+        "missing_value": 1,
+        "unknown_symbol": 1,
+        "high_below_low": 1,
+        # row 1 (high below low) and row 2 (close above high)
+        "price_outside_range": 2,
+        "non_positive_price": 0,
+        "negative_volume": 1,
+        "duplicate_key": 1,
+    }
+    assert result.valid["open"].tolist() == [10.0, 10.5]
+    assert result.quarantined["failed_rules"].tolist() == [
+        "duplicate_key",
+        "high_below_low,price_outside_range",
+        "price_outside_range",
+        "negative_volume",
+        "missing_value",
+        "unknown_symbol",
+    ]
+
+def test_unknown_symbols_reach_validation():
+    bars = generate_alpaca_bars(symbol_count=3, bars_per_symbol=2, timeframe="1Day")
+    df_stock_symbol = generate_stock_symbol_frame(list(bars)[:2])
+
+    stock_bars = convert_to_arrow_table(bars)
+    assert len(initial_transform(stock_bars, df_stock_symbol)) == 4
+
+    result = validate_bars(transform_to_arrow(stock_bars, df_stock_symbol, keep_unknown_symbols=True))
+    assert len(result.valid) == 4
+    assert result.valid["company"].notna().all()
+    assert result.rule_counts["unknown_symbol"] == 2
+
+def test_validate_and_quarantine_writes_failing_rows(db_client, df_stock):
+    db_client.drop_table("quarantine_bars_test")
+
+    result = validate_and_quarantine(df_stock, db_client, "quarantine_bars_test", "stock_bars")
+
+    rows = db_client.engine.execute(
+        "select stock, open, volume, failed_rules, source_table_name from quarantine_bars_test order by id"
+    ).all()
+    assert len(rows) == len(result.quarantined) == 6
+    assert rows[3] == ("AAPL", 10.0, -1, "negative_volume", "stock_bars")
+    assert rows[4][1] is None
+
+def test_validation_adds_little_to_the_transform():
+    bars = generate_alpaca_bars(symbol_count=200, bars_per_symbol=2000, timeframe="1Min")
+    df_stock_symbol = generate_stock_symbol_frame(list(bars))
+
+    start = time.perf_counter()
+    df_stock = initial_transform(convert_to_arrow_table(bars), df_stock_symbol)
+    transform_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = validate_bars(transform_to_arrow(convert_to_arrow_table(bars), df_stock_symbol, keep_unknown_symbols=True))
+    validated_seconds = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(result.valid, df_stock)
+    assert validated_seconds - transform_seconds < transform_seconds * 0.25, (
+        f"transform {transform_seconds:.3f}s, transform and validate {validated_seconds:.3f}s"
+    )
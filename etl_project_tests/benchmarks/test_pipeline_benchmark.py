@@ -0,0 +1,61 @@
+import json
+from etl_project.assets.assets import convert_to_dataframe, initial_transform
+from etl_project.benchmarks.pipeline_benchmark import BENCHMARKS, DEFAULT_BASELINE_PATH, LOAD_METHODS, compare_to_baseline, run_benchmarks
+from etl_project.benchmarks.synthetic import generate_alpaca_bars, generate_stock_symbol_frame
+
+# ---------- Tests ----------
+
+def test_generate_alpaca_bars_matches_the_api_shape():
+    bars = generate_alpaca_bars(symbol_count=3, bars_per_symbol=4, timeframe="1Min")
+
+    assert len(bars) == 3
+    assert all(len(records) == 4 for records in bars.values())
+    first, second = bars["SYM00000"][:2]
+    assert set(first) == {"c", "h", "l", "n", "o", "t", "v", "vw"}
+    assert (first["t"], second["t"]) == ("2000-01-03T14:30:00Z", "2000-01-03T14:31:00Z")
+
+    df_stock = initial_transform(convert_to_dataframe(bars), generate_stock_symbol_frame(list(bars)))
+    assert len(df_stock) == 12
+    assert df_stock["company"].notna().all()
+
+def test_run_benchmarks_without_database():
+    results = run_benchmarks(symbol_count=5, bars_per_symbol=20, repeat=2)
+
+    names = [benchmark["name"] for benchmark in results["benchmarks"]]
+    assert names == ["extract", "convert_to_dataframe", "convert_to_arrow_table", "initial_transform", "transform_and_validate"]
+    for benchmark in results["benchmarks"]:
+        assert benchmark["rows"] == 100
+        assert benchmark["p50_seconds"] <= benchmark["max_seconds"]
+        assert benchmark["rows_per_second"] > 0
+        assert benchmark["peak_rss_bytes"] > 0
+
+def test_compare_to_baseline_flags_regressions():
+    baseline = {"benchmarks": [
+        {"name": "load_upsert", "rows_per_second": 1000.0},
+        {"name": "load_insert", "rows_per_second": 1000.0},
+    ]}
+    results = {"benchmarks": [
+        {"name": "load_upsert", "rows_per_second": 700.0},
+        {"name": "load_insert", "rows_per_second": 900.0},
+        {"name": "analysis_sql_full", "rows_per_second": 10.0},
+    ]}
+
+    comparison = {row["name"]: row for row in compare_to_baseline(results, baseline, tolerance=0.2)}
+
+    assert set(comparison) == {"load_upsert", "load_insert"}
+    assert comparison["load_upsert"]["regression"]
+    assert not comparison["load_insert"]["regression"]
+    assert round(comparison["load_insert"]["change"], 3) == -0.1
+
+def test_baseline_covers_every_benchmark():
+    baseline = json.loads(DEFAULT_BASELINE_PATH.read_text())
+    expected = []
+    for benchmark in BENCHMARKS:
+        if benchmark == "load":
+            expected += [f"load_{load_method}" for load_method in LOAD_METHODS]
+        elif benchmark == "analysis_sql":
+            expected += ["analysis_sql_full", "analysis_sql_incremental"]
+        else:
+            expected.append(benchmark)
+
+    assert [benchmark["name"] for benchmark in baseline["benchmarks"]] == expected
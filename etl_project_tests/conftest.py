@@ -0,0 +1,18 @@
+import os
+import pytest
+from dotenv import load_dotenv
+from etl_project.connectors.postgresql import PostgreSqlClient
+
+load_dotenv()
+
+# ---------- Fixtures ----------
+
+@pytest.fixture(scope="module")
+def db_client():
+    return PostgreSqlClient(
+        username=os.getenv("DB_USERNAME"),
+        password=os.getenv("DB_PASSWORD"),
+        server_name=os.getenv("SERVER_NAME", "localhost"),
+        database_name=os.getenv("DATABASE_NAME"),
+        port=int(os.getenv("PORT", "5432")),
+    )
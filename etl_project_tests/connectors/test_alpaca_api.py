@@ -1,7 +1,11 @@
 import os
+import time
+from datetime import datetime, timezone
 import pytest
 from dotenv import load_dotenv
-from etl_project.connectors.alpaca_api import AlpacaApiClient 
+from etl_project.connectors.alpaca_api import AlpacaApiClient, merge_bars, parse_retry_after, split_date_range
+from etl_project.connectors.rate_limiter import TokenBucketRateLimiter
+from etl_project.benchmarks.stub_alpaca_server import StubAlpacaServer, generate_bars
 
 load_dotenv()
 
@@ -26,3 +30,94 @@ def test_alpaca_api():
     assert symbols in result
     assert isinstance(result[symbols], list)
     assert len(result[symbols]) > 0 
+
+# ---------- Stub server tests ----------
+
+@pytest.fixture
+def stub_bars():
+    symbols = [f"SYM{i}" for i in range(25)]
+    return generate_bars(symbols, start_date="2025-01-01", days=120)
+
+def test_pagination_follows_next_page_token(stub_bars):
+    with StubAlpacaServer(stub_bars) as server:
+        client = AlpacaApiClient("key", "secret", base_url=server.url, page_limit=250)
+        result = client.get_alpaca_api_data(list(stub_bars), "1Day", "2025-01-01")
+
+    expected_rows = sum(len(records) for records in stub_bars.values())
+    assert sum(len(records) for records in result.values()) == expected_rows
+    assert server.request_count == -(-expected_rows // 250)
+    assert result == stub_bars
+
+def test_concurrent_extract_matches_single_call(stub_bars):
+    with StubAlpacaServer(stub_bars) as server:
+        client = AlpacaApiClient("key", "secret", base_url=server.url, page_limit=100)
+
+        single = client.get_alpaca_api_data(list(stub_bars), "1Day", "2025-01-01", "2025-04-30")
+        single_requests = server.request_count
+
+        concurrent = client.get_alpaca_api_data_concurrent(
+            list(stub_bars), "1Day", "2025-01-01", "2025-04-30",
+            symbols_per_request=7,
+            date_window_days=10,
+            max_workers=8,
+        )
+
+    assert concurrent == single
+    # The concurrent extract splits the range into more, smaller requests
+    assert server.request_count - single_requests > single_requests
+
+def test_split_date_range_shares_boundaries():
+    windows = split_date_range("2025-01-01", "2025-01-25", date_window_days=10)
+    assert windows == [
+        ("2025-01-01T00:00:00Z", "2025-01-11T00:00:00Z"),
+        ("2025-01-11T00:00:00Z", "2025-01-21T00:00:00Z"),
+        ("2025-01-21T00:00:00Z", "2025-01-25T00:00:00Z"),
+    ]
+    assert split_date_range("2025-01-01", None) == [("2025-01-01", None)]
+
+def test_merge_bars_removes_duplicates():
+    bar = {"t": "2025-01-02T04:00:00Z", "c": 1.0}
+    other = {"t": "2025-01-01T04:00:00Z", "c": 2.0}
+    assert merge_bars([{"AAPL": [bar]}, {"AAPL": [bar, other]}]) == {"AAPL": [other, bar]}
+
+def test_retries_throttled_and_failed_requests(stub_bars):
+    with StubAlpacaServer(stub_bars, failures=[429, 503, 502]) as server:
+        client = AlpacaApiClient("key", "secret", base_url=server.url, backoff_base_seconds=0.01)
+        result = client.get_alpaca_api_data(list(stub_bars), "1Day", "2025-01-01")
+
+    assert result == stub_bars
+    assert server.request_count == 3 + 3  # three pages plus three retried failures
+
+def test_parse_retry_after_accepts_seconds_and_http_dates():
+    now = datetime(2025, 10, 21, 7, 28, 0, tzinfo=timezone.utc)
+    assert parse_retry_after("1.5", now=now) == 1.5
+    assert parse_retry_after("Tue, 21 Oct 2025 07:28:30 GMT", now=now) == 30
+    assert parse_retry_after("Tue, 21 Oct 2025 07:27:00 GMT", now=now) == 0
+    assert parse_retry_after("soon", now=now) is None
+    assert parse_retry_after(None, now=now) is None
+
+def test_retries_throttled_requests_with_an_http_date(stub_bars):
+    with StubAlpacaServer(stub_bars, failures=[429], retry_after="Wed, 21 Oct 2015 07:28:00 GMT") as server:
+        client = AlpacaApiClient("key", "secret", base_url=server.url, backoff_base_seconds=0.01)
+        result = client.get_alpaca_api_data(list(stub_bars), "1Day", "2025-01-01")
+
+    assert result == stub_bars
+    assert server.request_count == 3 + 1
+
+def test_raises_when_retries_are_exhausted(stub_bars):
+    with StubAlpacaServer(stub_bars, failures=[503, 503]) as server:
+        client = AlpacaApiClient("key", "secret", base_url=server.url, max_retries=1, backoff_base_seconds=0.01)
+        with pytest.raises(Exception, match="Status Code: 503"):
+            client.get_alpaca_api_data(list(stub_bars), "1Day", "2025-01-01")
+
+def test_rate_limiter_follows_headers():
+    rate_limiter = TokenBucketRateLimiter(requests_per_minute=600)
+    rate_limiter.update_from_headers({"X-RateLimit-Limit": "60", "X-RateLimit-Remaining": "0"})
+    assert rate_limiter.requests_per_minute == 60
+    assert rate_limiter.wait_time() == pytest.approx(1.0, abs=0.05)
+
+    rate_limiter = TokenBucketRateLimiter(requests_per_minute=6000)
+    start = time.perf_counter()
+    for _ in range(6100):
+        rate_limiter.acquire()
+    assert time.perf_counter() - start >= 0.9
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from etl_project.connectors.alpaca_api import AlpacaApiClient, RequestStats
+from etl_project.connectors.alpaca_api_async import AsyncAlpacaApiClient, SharedAsyncAlpacaApiClient
+from etl_project.connectors.rate_limiter import TokenBucketRateLimiter
+from etl_project.benchmarks.stub_alpaca_server import StubAlpacaServer, generate_bars
+
+# ---------- Fixtures ----------
+
+@pytest.fixture
+def stub_bars():
+    symbols = [f"SYM{i}" for i in range(300)]
+    return generate_bars(symbols, start_date="2025-01-01", days=60)
+
+# ---------- Tests ----------
+
+def test_async_extract_matches_sync_extract(stub_bars):
+    async def extract(url):
+        async with AsyncAlpacaApiClient("key", "secret", base_url=url, page_limit=500, max_concurrency=20) as client:
+            return await client.get_alpaca_api_data_concurrent(
+                list(stub_bars), "1Day", "2025-01-01", "2025-03-31",
+                symbols_per_request=25,
+                date_window_days=7,
+            )
+
+    with StubAlpacaServer(stub_bars) as server:
+        sync_result = AlpacaApiClient("key", "secret", base_url=server.url).get_alpaca_api_data(
+            list(stub_bars), "1Day", "2025-01-01", "2025-03-31"
+        )
+
+        async_result = asyncio.run(extract(server.url))
+
+    assert async_result == sync_result
+
+def test_async_client_retries_throttled_requests(stub_bars):
+    async def extract(url):
+        async with AsyncAlpacaApiClient("key", "secret", base_url=url, backoff_base_seconds=0.01) as client:
+            return await client.get_alpaca_api_data(["SYM0", "SYM1"], "1Day", "2025-01-01")
+
+    with StubAlpacaServer(stub_bars, failures=[429, 500]) as server:
+        result = asyncio.run(extract(server.url))
+
+    assert result == {"SYM0": stub_bars["SYM0"], "SYM1": stub_bars["SYM1"]}
+    assert server.request_count == 3
+
+def test_async_client_retries_throttled_requests_with_an_http_date(stub_bars):
+    async def extract(url):
+        async with AsyncAlpacaApiClient("key", "secret", base_url=url, backoff_base_seconds=0.01) as client:
+            return await client.get_alpaca_api_data(["SYM0"], "1Day", "2025-01-01")
+
+    with StubAlpacaServer(stub_bars, failures=[429], retry_after="Wed, 21 Oct 2015 07:28:00 GMT") as server:
+        result = asyncio.run(extract(server.url))
+
+    assert result == {"SYM0": stub_bars["SYM0"]}
+    assert server.request_count == 2
+
+def test_shared_client_serves_several_threads(stub_bars):
+    symbol_groups = [list(stub_bars)[i:i + 100] for i in range(0, 300, 100)]
+
+    with StubAlpacaServer(stub_bars) as server:
+        rate_limiter = TokenBucketRateLimiter(10000)
+        with SharedAsyncAlpacaApiClient("key", "secret", base_url=server.url, rate_limiter=rate_limiter, max_concurrency=5) as shared_client:
+            def extract(symbols):
+                return shared_client.run(shared_client.client.get_alpaca_api_data_concurrent(
+                    symbols, "1Day", "2025-01-01", "2025-03-31", symbols_per_request=25
+                ))
+
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                results = list(executor.map(extract, symbol_groups))
+
+    for symbols, result in zip(symbol_groups, results):
+        assert result == {symbol: stub_bars[symbol] for symbol in symbols}
+    # Every thread drew from the one rate limiter of the shared client
+    assert rate_limiter.tokens <= 10000 - server.request_count + 1
+
+def test_shared_client_started_from_several_threads_opens_one_session():
+    shared_client = SharedAsyncAlpacaApiClient("key", "secret")
+    try:
+        # Every pipeline thread starts the client on its first extract
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            clients = list(executor.map(lambda _: shared_client.client_for(RequestStats()), range(8)))
+
+        assert len({id(client.session) for client in clients}) == 1
+        assert [thread.name for thread in threading.enumerate()].count("alpaca-api-loop") == 1
+    finally:
+        shared_client.close()
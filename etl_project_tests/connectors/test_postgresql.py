@@ -1,24 +1,11 @@
 import pytest
-import os
-from dotenv import load_dotenv
+import pandas as pd
 from sqlalchemy import MetaData, Table, Column, String, Float, Integer
-from etl_project.connectors.postgresql import PostgreSqlClient
-
-# Load environment variables from .env file
-load_dotenv()
+from etl_project.assets.assets import define_stock_bars_table
+from etl_project.benchmarks.synthetic import generate_stock_bars_frame
 
 # ---------- Fixtures ----------
 
-@pytest.fixture(scope="module")
-def db_client():
-    return PostgreSqlClient(
-        username=os.getenv("DB_USERNAME"),
-        password=os.getenv("DB_PASSWORD"),
-        server_name=os.getenv("SERVER_NAME", "localhost"),
-        database_name=os.getenv("DATABASE_NAME"),
-        port=int(os.getenv("PORT", "5432")),
-    )
-
 @pytest.fixture
 def test_table_and_metadata():
     metadata = MetaData()
@@ -166,3 +153,136 @@ def test_upsert(db_client, test_table_and_metadata):
 
     assert tsla["close"] == 260.0
     assert msft["company"] == "Microsoft Corp"
+
+def test_bulk_insert(db_client, test_table_and_metadata, sample_data):
+    table, metadata = test_table_and_metadata
+    db_client.drop_table(table.name)
+    db_client.bulk_insert(pd.DataFrame(sample_data), table, metadata)
+
+    results = db_client.select_all(table)
+    assert len(results) == 2
+    assert {row["stock"] for row in results} == {"TSLA", "AAPL"}
+
+def test_bulk_upsert(db_client, test_table_and_metadata, sample_data):
+    table, metadata = test_table_and_metadata
+    db_client.drop_table(table.name)
+    db_client.bulk_upsert(pd.DataFrame(sample_data), table, metadata)
+
+    updated_data = pd.DataFrame(sample_data)
+    updated_data.loc[updated_data["stock"] == "TSLA", "close"] = 260.0
+    db_client.bulk_upsert(updated_data, table, metadata)
+
+    results = db_client.select_all(table)
+    assert len(results) == 2
+    assert next(row for row in results if row["stock"] == "TSLA")["close"] == 260.0
+
+def row_versions(db_client, table) -> dict:
+    # ctid is the physical location of the row version, it changes whenever the row is rewritten
+    return dict(db_client.engine.execute(f"SELECT stock, ctid::text FROM {table.name}").all())
+
+@pytest.mark.parametrize("bulk", [False, True])
+def test_upsert_skips_unchanged_rows(db_client, test_table_and_metadata, sample_data, bulk):
+    table, metadata = test_table_and_metadata
+    db_client.drop_table(table.name)
+
+    def upsert(data: list[dict]) -> dict:
+        if bulk:
+            return db_client.bulk_upsert(pd.DataFrame(data), table, metadata)
+        batch_stats = db_client.upsert(data, table, metadata)
+        return {key: sum(batch[key] for batch in batch_stats) for key in ("inserted", "updated", "unchanged")}
+
+    assert upsert(sample_data) == {"inserted": 2, "updated": 0, "unchanged": 0}
+    versions = row_versions(db_client, table)
+
+    assert upsert(sample_data) == {"inserted": 0, "updated": 0, "unchanged": 2}
+    assert row_versions(db_client, table) == versions
+
+    changed_data = [dict(sample_data[0], close=260.0), sample_data[1], dict(sample_data[1], stock="MSFT")]
+    assert upsert(changed_data) == {"inserted": 1, "updated": 1, "unchanged": 1}
+
+    new_versions = row_versions(db_client, table)
+    assert new_versions["AAPL"] == versions["AAPL"]
+    assert new_versions["TSLA"] != versions["TSLA"]
+    assert next(row for row in db_client.select_all(table) if row["stock"] == "TSLA")["close"] == 260.0
+
+def test_upsert_binds_each_value_once(db_client, test_table_and_metadata, sample_data):
+    table, _ = test_table_and_metadata
+
+    statement = db_client._upsert_statement(table, sample_data).compile(dialect=db_client.engine.dialect)
+
+    # Postgres accepts at most 65535 bind parameters per statement
+    assert len(statement.params) == len(sample_data) * len(table.columns)
+
+def test_upsert_counts_per_batch(db_client, test_table_and_metadata, sample_data):
+    table, metadata = test_table_and_metadata
+    db_client.drop_table(table.name)
+    db_client.upsert(sample_data[:1], table, metadata)
+
+    batch_stats = db_client.upsert(sample_data, table, metadata, batch_size=1, commit_per="batch")
+
+    assert [(batch["rows"], batch["inserted"], batch["unchanged"]) for batch in batch_stats] == [(0, 0, 1), (1, 1, 0)]
+
+def test_bulk_overwrite(db_client, test_table_and_metadata, sample_data):
+    table, metadata = test_table_and_metadata
+    db_client.drop_table(table.name)
+    db_client.bulk_overwrite(pd.DataFrame(sample_data), table, metadata)
+    db_client.bulk_overwrite(pd.DataFrame(sample_data[:1]), table, metadata)
+
+    results = db_client.select_all(table)
+    assert len(results) == 1
+    assert results[0]["stock"] == "TSLA"
+
+    # the primary key survives the table swap
+    db_client.upsert(sample_data, table, metadata)
+    assert len(db_client.select_all(table)) == 2
+
+def test_insert_in_batches(db_client, test_table_and_metadata, sample_data):
+    table, metadata = test_table_and_metadata
+    db_client.drop_table(table.name)
+    batch_stats = db_client.insert(sample_data, table, metadata, batch_size=1, commit_per="batch")
+
+    assert [batch["rows"] for batch in batch_stats] == [1, 1]
+    assert len(db_client.select_all(table)) == 2
+
+@pytest.mark.parametrize("commit_per, expected_rows", [("batch", 1), ("run", 0)])
+def test_failing_batch_rolls_back(db_client, test_table_and_metadata, sample_data, commit_per, expected_rows):
+    table, metadata = test_table_and_metadata
+    db_client.drop_table(table.name)
+    duplicate_keys = [sample_data[0], sample_data[0]]
+
+    with pytest.raises(Exception):
+        db_client.insert(duplicate_keys, table, metadata, batch_size=1, commit_per=commit_per)
+
+    assert len(db_client.select_all(table)) == expected_rows
+
+def is_partitioned(db_client, table_name: str) -> bool:
+    return db_client.engine.execute(
+        "SELECT count(*) FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", (table_name,)
+    ).scalar() == 1
+
+@pytest.mark.parametrize("load_method", ["overwrite", "bulk_overwrite"])
+def test_overwrite_keeps_partitioning(db_client, load_method):
+    table_name = "stock_bars_overwrite_test"
+    db_client.drop_table(table_name)
+    df_stock = generate_stock_bars_frame(symbol_count=2, bars_per_symbol=40)
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, table_name)
+    db_client.bulk_insert(df_stock, table, metadata)
+
+    def overwrite(table: Table, metadata: MetaData) -> None:
+        if load_method == "overwrite":
+            db_client.overwrite(df_stock.to_dict(orient="records"), table, metadata)
+        else:
+            db_client.bulk_overwrite(df_stock, table, metadata)
+
+    overwrite(table, metadata)
+    assert is_partitioned(db_client, table_name)
+    assert db_client.engine.execute(f"SELECT count(*) FROM {table_name}").scalar() == len(df_stock)
+
+    # A reflected table lost the partitioning, it is refused rather than recreated as a plain table
+    reflected_metadata = MetaData()
+    reflected_metadata.reflect(bind=db_client.engine, only=[table_name])
+    with pytest.raises(Exception, match="partitioned"):
+        overwrite(reflected_metadata.tables[table_name], reflected_metadata)
+    assert is_partitioned(db_client, table_name)
+    db_client.drop_table(table_name)
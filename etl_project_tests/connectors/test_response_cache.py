@@ -0,0 +1,89 @@
+from datetime import datetime
+from etl_project.connectors.alpaca_api import AlpacaApiClient
+from etl_project.connectors.alpaca_api_async import AsyncAlpacaApiClient
+from etl_project.connectors.rate_limiter import TokenBucketRateLimiter
+from etl_project.connectors.response_cache import MARKET_TIMEZONE, ResponseCache
+from etl_project.benchmarks.stub_alpaca_server import StubAlpacaServer, generate_bars
+import asyncio
+
+URL = "https://data.alpaca.markets/v2/stocks/bars"
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+def market_time(*args) -> float:
+    return datetime(*args, tzinfo=MARKET_TIMEZONE).timestamp()
+
+# ---------- Tests ----------
+
+def test_closed_range_is_kept_for_good(tmp_path):
+    clock = FakeClock(market_time(2025, 10, 1, 10))
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttl_seconds=60, clock=clock)
+    params = {"symbols": "AAPL", "start": "2025-09-01", "end": "2025-09-30", "limit": 1000}
+
+    cache.put(URL, params, b'{"bars": {}}')
+    clock.now += 365 * 24 * 3600
+
+    # Parameters hash the same whether values are sent as int or str
+    assert cache.get(URL, dict(params, limit="1000")) == b'{"bars": {}}'
+
+def test_range_reaching_into_today_expires_after_ttl(tmp_path):
+    clock = FakeClock(market_time(2025, 10, 1, 10))
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), ttl_seconds=60, clock=clock)
+    open_ended = {"symbols": "AAPL", "start": "2025-09-01"}
+    ending_today = {"symbols": "AAPL", "start": "2025-09-01", "end": "2025-10-01T14:00:00Z"}
+
+    for params in [open_ended, ending_today]:
+        cache.put(URL, params, b"body")
+    clock.now += 30
+    assert cache.get(URL, open_ended) == cache.get(URL, ending_today) == b"body"
+
+    clock.now += 31
+    assert cache.get(URL, open_ended) is None
+    assert cache.get(URL, ending_today) is None
+    assert cache.size_bytes() == 0
+
+def test_least_recently_used_responses_are_evicted(tmp_path):
+    clock = FakeClock(market_time(2025, 10, 1, 10))
+    body = bytes(range(256)) * 4  # compresses to 286 bytes
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_size_bytes=600, clock=clock)
+
+    for month in ["01", "02"]:
+        clock.now += 1
+        cache.put(URL, {"start": f"2025-{month}-01", "end": f"2025-{month}-28"}, body)
+    clock.now += 1
+    cache.get(URL, {"start": "2025-01-01", "end": "2025-01-28"})
+    clock.now += 1
+    cache.put(URL, {"start": "2025-03-01", "end": "2025-03-28"}, body)
+
+    assert cache.get(URL, {"start": "2025-02-01", "end": "2025-02-28"}) is None
+    assert cache.get(URL, {"start": "2025-01-01", "end": "2025-01-28"}) == body
+    assert cache.get(URL, {"start": "2025-03-01", "end": "2025-03-28"}) == body
+    assert cache.size_bytes() <= 600
+
+def test_clients_serve_repeated_requests_from_cache(tmp_path):
+    bars = generate_bars(["AAPL", "MSFT"], start_date="2025-09-01", days=30)
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+
+    with StubAlpacaServer(bars) as server:
+        client = AlpacaApiClient("key", "secret", base_url=server.url, page_limit=25, response_cache=cache)
+        first = client.get_alpaca_api_data(["AAPL", "MSFT"], "1Day", "2025-09-01", "2025-09-30")
+        requests_after_first_run = server.request_count
+        second = client.get_alpaca_api_data(["AAPL", "MSFT"], "1Day", "2025-09-01", "2025-09-30")
+
+        async def extract():
+            async with AsyncAlpacaApiClient(
+                "key", "secret", base_url=server.url, page_limit=25,
+                rate_limiter=TokenBucketRateLimiter(), response_cache=cache
+            ) as async_client:
+                return await async_client.get_alpaca_api_data(["AAPL", "MSFT"], "1Day", "2025-09-01", "2025-09-30")
+        third = asyncio.run(extract())
+
+    assert first == second == third
+    assert requests_after_first_run == 3
+    assert server.request_count == 3
+    assert cache.hits == 6
@@ -0,0 +1,87 @@
+import uuid
+import pandas as pd
+import pytest
+from sqlalchemy import MetaData, event
+from etl_project.assets.assets import define_stock_bars_table, load
+from etl_project.connectors.schema_registry import SchemaRegistry, get_schema_registry
+
+# ---------- Fixtures ----------
+
+@pytest.fixture
+def df_stock():
+    return pd.DataFrame({
+        "stock": ["AAPL", "AAPL", "MSFT"],
+        "company": ["Apple", "Apple", "Microsoft"],
+        "timestamp": pd.to_datetime(["2025-09-30T04:00:00Z", "2025-10-01T04:00:00Z", "2025-10-01T04:00:00Z"], utc=True),
+        "open": [1.0, 2.0, 3.0],
+        "high": [1.0, 2.0, 3.0],
+        "low": [1.0, 2.0, 3.0],
+        "close": [1.0, 2.0, 3.0],
+        "volume": [10, 20, 30],
+        "volume_weighted_avg_price": [1.0, 2.0, 3.0],
+        "number_of_trades": [1, 2, 3],
+    })
+
+@pytest.fixture
+def statements(db_client):
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(db_client.engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(db_client.engine, "before_cursor_execute", record)
+
+# ---------- Tests ----------
+
+def test_registry_is_shared_per_engine(db_client):
+    assert get_schema_registry(db_client.engine) is db_client.schema_registry
+
+@pytest.mark.parametrize("load_method", ["upsert", "bulk_upsert"])
+def test_warm_load_issues_no_schema_queries(db_client, df_stock, statements, load_method):
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, "stock_bars_registry_test")
+    db_client.drop_table(table.name)
+    load(df_stock, db_client, table, metadata, load_method=load_method)
+
+    statements.clear()
+    load(df_stock, db_client, table, metadata, load_method=load_method)
+
+    assert statements
+    # Only the data statements, the first load looked the table and its partitions up in pg_catalog
+    assert not [
+        statement for statement in statements
+        if "pg_catalog" in statement or "pg_get_partkeydef" in statement or "CREATE TABLE" in statement.upper()
+    ]
+    assert len(db_client.select_all(table)) == len(df_stock)
+
+def test_drop_table_invalidates_the_cache(db_client, df_stock):
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, "stock_bars_registry_test")
+    load(df_stock, db_client, table, metadata, load_method="upsert")
+
+    db_client.drop_table(table.name)
+    load(df_stock, db_client, table, metadata, load_method="upsert")
+
+    assert len(db_client.select_all(table)) == len(df_stock)
+
+def test_version_change_invalidates_the_cache(db_client):
+    name = f"schema_registry_test_{uuid.uuid4().hex}"
+    registry = SchemaRegistry(db_client.engine, name=name)
+    migrations = []
+
+    assert registry.ensure_schema(lambda: migrations.append(1), version=1)
+    assert not registry.ensure_schema(lambda: migrations.append(2), version=1)
+    assert migrations == [1]
+
+    assert registry.reflect("schema_versions") is registry.reflect("schema_versions")
+    assert not registry.check_version()
+
+    # Another process migrates to the next version
+    SchemaRegistry(db_client.engine, name=name).ensure_schema(lambda: None, version=2)
+    cached = registry.reflect("schema_versions")
+    assert registry.check_version()
+    assert registry.version == 2
+    assert registry.reflect("schema_versions") is not cached
+    db_client.engine.execute(f"DELETE FROM {registry.version_table_name} WHERE name = %s", (name,))
@@ -0,0 +1,85 @@
+import json
+import tracemalloc
+import pytest
+from etl_project.connectors.alpaca_api import RequestStats
+from etl_project.metadata.instrumentation import PipelineInstrumentation
+
+# ---------- Fixtures ----------
+
+@pytest.fixture
+def stop_tracing():
+    # Tracing is left running by the instrumentation, stop it so it does not slow the other tests down
+    was_tracing = tracemalloc.is_tracing()
+    yield
+    if not was_tracing:
+        tracemalloc.stop()
+
+# ---------- Tests ----------
+
+def test_stage_records_rows_and_request_deltas(stop_tracing):
+    request_stats = RequestStats()
+    request_stats.record(100)
+    instrumentation = PipelineInstrumentation("test", request_stats=request_stats, trace_memory=True)
+
+    with instrumentation.stage("extract") as stage:
+        request_stats.record(250)
+        request_stats.record(50)
+        stage.rows = 10
+
+    metrics = instrumentation.run.stages[0]
+    assert metrics.name == "extract"
+    assert metrics.rows == 10
+    assert metrics.api_calls == 2
+    assert metrics.bytes_fetched == 300
+    assert metrics.wall_seconds > 0
+    assert metrics.process_peak_traced_bytes > 0
+    assert metrics.peak_rss_bytes > 0
+    assert metrics.status == "success"
+
+def test_memory_tracing_is_not_stopped_by_a_stage(stop_tracing):
+    instrumentation = PipelineInstrumentation("test", trace_memory=True)
+    with instrumentation.stage("transform"):
+        assert tracemalloc.is_tracing()
+    with instrumentation.stage("load"):
+        pass
+
+    # Another pipeline of the process may still be in a stage
+    assert tracemalloc.is_tracing()
+    first, second = instrumentation.run.stages
+    assert second.process_peak_traced_bytes >= first.process_peak_traced_bytes
+
+def test_failed_stage_is_recorded():
+    instrumentation = PipelineInstrumentation("test")
+
+    with pytest.raises(ValueError):
+        with instrumentation.stage("load"):
+            raise ValueError("boom")
+
+    assert instrumentation.run.stages[0].status == "failed"
+
+def test_instrument_decorator_uses_function_name():
+    instrumentation = PipelineInstrumentation("test")
+
+    @instrumentation.instrument(rows=len)
+    def initial_transform(rows):
+        return rows[:3]
+
+    assert initial_transform(list(range(5))) == [0, 1, 2]
+    assert instrumentation.run.stages[0].name == "initial_transform"
+    assert instrumentation.run.stages[0].rows == 3
+
+def test_emit_appends_json_line(tmp_path):
+    instrumentation = PipelineInstrumentation("test")
+    with instrumentation.stage("transform") as stage:
+        stage.rows = 5
+
+    json_path = tmp_path / "logs" / "run_metrics.jsonl"
+    instrumentation.emit(json_path=str(json_path))
+    instrumentation.emit(json_path=str(json_path))
+
+    lines = json_path.read_text().splitlines()
+    assert len(lines) == 2
+    record = json.loads(lines[0])
+    assert record["pipeline_name"] == "test"
+    assert record["stages"][0]["rows"] == 5
+    assert record["stages"][0]["rows_per_second"] > 0
@@ -0,0 +1,33 @@
+import uuid
+import pytest
+from etl_project.metadata.log_metadata import DatabaseLogger
+
+# ---------- Fixtures ----------
+
+def count_messages(db_client, prefix: str) -> int:
+    return db_client.engine.execute(
+        "select count(*) from metadata where log_message like %s", (f"{prefix}%",)
+    ).scalar()
+
+# ---------- Tests ----------
+
+def test_flush_writes_queued_messages(db_client):
+    prefix = f"test-{uuid.uuid4()}"
+    metadata_logger = DatabaseLogger(engine=db_client.engine, batch_size=3, flush_interval_seconds=0.05)
+
+    for i in range(10):
+        metadata_logger.insert_log(f"{prefix} message {i}")
+    metadata_logger.flush()
+
+    assert count_messages(db_client, prefix) == 10
+    metadata_logger.close()
+
+def test_close_writes_remaining_messages(db_client):
+    prefix = f"test-{uuid.uuid4()}"
+    metadata_logger = DatabaseLogger(engine=db_client.engine, batch_size=1000, flush_interval_seconds=60)
+
+    for i in range(5):
+        metadata_logger.insert_log(f"{prefix} message {i}")
+    metadata_logger.close()
+
+    assert count_messages(db_client, prefix) == 5
@@ -0,0 +1,96 @@
+import pytest
+from sqlalchemy import MetaData
+from etl_project.assets.assets import define_stock_bars_table, extract_stock_symbol
+from etl_project.connectors.alpaca_api import AlpacaApiClient
+from etl_project.pipelines.backfill import month_windows, plan_backfill_units, run_backfill, select_pipeline_configs
+from etl_project.utilities.utilities import get_symbol_checkpoints
+from etl_project.benchmarks.stub_alpaca_server import StubAlpacaServer, generate_bars
+
+STOCK_SYMBOL_CSV_PATH = "etl_project/data/top_tech_stock_symbol.csv"
+
+# ---------- Fixtures ----------
+
+@pytest.fixture
+def df_stock_symbol():
+    return extract_stock_symbol(STOCK_SYMBOL_CSV_PATH)
+
+# ---------- Tests ----------
+
+def test_month_windows_do_not_overlap():
+    assert month_windows("2025-01-15", "2025-03-10") == [
+        ("2025-01-15T00:00:00Z", "2025-01-31T23:59:59Z"),
+        ("2025-02-01T00:00:00Z", "2025-02-28T23:59:59Z"),
+        ("2025-03-01T00:00:00Z", "2025-03-10T23:59:59Z"),
+    ]
+    assert month_windows("2024-11-01", "2025-04-30", months_per_unit=3) == [
+        ("2024-11-01T00:00:00Z", "2025-01-31T23:59:59Z"),
+        ("2025-02-01T00:00:00Z", "2025-04-30T23:59:59Z"),
+    ]
+
+def test_plan_backfill_units_is_stable():
+    units = plan_backfill_units(["AAPL", "MSFT", "NVDA"], "2025-01-01", "2025-02-15", "1Day", symbols_per_unit=2)
+
+    assert [(unit.symbols, unit.start_time[:10]) for unit in units] == [
+        (["AAPL", "MSFT"], "2025-01-01"),
+        (["AAPL", "MSFT"], "2025-02-01"),
+        (["NVDA"], "2025-01-01"),
+        (["NVDA"], "2025-02-01"),
+    ]
+    assert len({unit.unit_id for unit in units}) == 4
+    assert units == plan_backfill_units(["AAPL", "MSFT", "NVDA"], "2025-01-01", "2025-02-15", "1Day", symbols_per_unit=2)
+
+def test_backfill_resumes_failed_units(db_client, df_stock_symbol):
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, "stock_bars_backfill_test")
+    db_client.drop_table(table.name)
+    db_client.drop_table("backfill_units_test")
+    db_client.drop_table("symbol_checkpoints_backfill_test")
+
+    symbols = df_stock_symbol["Symbol"].tolist()
+    # LATERCO has no bars, its units load nothing for it
+    units = plan_backfill_units(symbols + ["LATERCO"], "2025-01-01", "2025-03-31", "1Day", symbols_per_unit=4)
+    backfill_params = dict(
+        units=units,
+        postgresql_client=db_client,
+        table=table,
+        metadata=metadata,
+        df_stock_symbol=df_stock_symbol,
+        max_workers=4,
+        backfill_unit_table_name="backfill_units_test",
+        symbol_checkpoint_table_name="symbol_checkpoints_backfill_test",
+    )
+
+    with StubAlpacaServer(generate_bars(symbols, start_date="2025-01-01", days=90), failures=[400]) as server:
+        client = AlpacaApiClient("key", "secret", base_url=server.url, page_limit=50)
+        first_run = run_backfill(alpaca_api_client=client, **backfill_params)
+        requests_before_resume = server.request_count
+        second_run = run_backfill(alpaca_api_client=client, **backfill_params)
+
+    assert first_run["failed"] == 1
+    assert first_run["done"] == len(units) - 1
+    # Only the failed unit runs again
+    assert second_run == {"units": len(units), "skipped": len(units) - 1, "done": 1, "failed": 0, "rows_loaded": second_run["rows_loaded"]}
+    # At most 4 symbols x 31 days, 3 pages of 50 bars
+    assert server.request_count - requests_before_resume <= 3
+    assert len(db_client.select_all(table)) == len(symbols) * 90
+    assert first_run["rows_loaded"] + second_run["rows_loaded"] == len(symbols) * 90
+
+    checkpoints = get_symbol_checkpoints(db_client.engine, "symbol_checkpoints_backfill_test", table.name, "1Day")
+    assert set(checkpoints) == set(symbols) | {"LATERCO"}
+    assert all(latest.startswith("2025-03-31") for _, latest in checkpoints.values())
+    assert checkpoints["LATERCO"][0].startswith("2025-01-01")
+
+def test_select_pipeline_configs_backfills_every_pipeline_by_default():
+    config = {
+        "config": {"source_table_name": "stock_bars", "analysis_table_name": "stock_bars_analysis"},
+        "pipelines": [
+            {"name": "tech"},
+            {"name": "etfs", "config": {"source_table_name": "etf_bars", "analysis_table_name": "etf_bars_analysis"}},
+        ],
+    }
+
+    assert [pipeline_config["name"] for pipeline_config in select_pipeline_configs(config)] == ["tech", "etfs"]
+    (etfs,) = select_pipeline_configs(config, ["etfs"])
+    assert etfs["config"]["source_table_name"] == "etf_bars"
+    with pytest.raises(Exception, match="Unknown pipelines"):
+        select_pipeline_configs(config, ["bonds"])
@@ -0,0 +1,177 @@
+import pytest
+from etl_project.connectors.alpaca_api import AlpacaApiClient, RequestStats
+from etl_project.connectors.alpaca_api_async import SharedAsyncAlpacaApiClient
+from etl_project.assets.assets import extract_stock_symbol
+from etl_project.connectors.rate_limiter import TokenBucketRateLimiter
+from etl_project.metadata.log_metadata import DatabaseLogger
+import pandas as pd
+from etl_project.pipelines import stock_bars
+from etl_project.pipelines.stock_bars import PipelineContext, build_pipeline_dag, get_pipeline_configs, pipeline, refresh_analysis_table, run_pipelines
+from etl_project.utilities.utilities import get_symbol_checkpoints
+from etl_project.benchmarks.stub_alpaca_server import StubAlpacaServer, generate_bars
+
+STOCK_SYMBOL_CSV_PATH = "etl_project/data/top_tech_stock_symbol.csv"
+
+# ---------- Fixtures ----------
+
+@pytest.fixture
+def config():
+    return {
+        "config": {
+            "stock_symbol_relative_path": STOCK_SYMBOL_CSV_PATH,
+            "load_method": "upsert",
+            "pipeline_mode": "streaming",
+            "source_table_name": "stock_bars_dag_test",
+            "checkpoint_table_name": "check_points_dag_test",
+            "symbol_checkpoint_table_name": "symbol_checkpoints_dag_test",
+            "analysis_table_name": "stock_bars_analysis_dag_test",
+            "backfill_start_date": "2025-09-01",
+            "node_retries": 1,
+        }
+    }
+
+# ---------- Tests ----------
+
+def test_batch_dag_dependencies(config):
+    config["config"]["pipeline_mode"] = "batch"
+    config["config"]["derived_timeframes"] = ["1Day"]
+    config["config"]["timeframe"] = "1Hour"
+    config["config"]["quarantine_table_name"] = "quarantine_bars_dag_test"
+    config["config"]["serving_tables"] = ["latest_metrics"]
+    context = PipelineContext(
+        config=config,
+        postgres_sql_client=None,
+        metadata_logger=None,
+        alpaca_api_client=None,
+        rate_limiter=None,
+        request_stats=RequestStats(),
+    )
+    dag = build_pipeline_dag(context)
+
+    assert dag.nodes["plan_extract"].dependencies == {"stock_symbols": "stock_symbols", "symbol_checkpoints": "symbol_checkpoints"}
+    assert dag.nodes["validate"].dependencies == {"data": "initial_transform"}
+    assert dag.nodes["load"].dependencies == {"df_stock": "validate", "table": "target_table"}
+    assert dag.nodes["transform_and_load_analysis_table"].dependencies["rows_aggregated"] == "aggregate_timeframes"
+    assert dag.nodes["refresh_serving_tables"].dependencies == {"analysis": "transform_and_load_analysis_table"}
+    assert "land_raw_bars" not in dag.nodes
+
+def test_pipeline_reruns_failed_nodes(db_client, config):
+    config["config"]["quarantine_table_name"] = "quarantine_bars_dag_test"
+    config["config"]["serving_tables"] = ["latest_metrics"]
+    for table_name in ["stock_bars_dag_test", "check_points_dag_test", "symbol_checkpoints_dag_test", "stock_bars_analysis_dag_test"]:
+        db_client.drop_table(table_name)
+
+    symbols = ["AAPL", "MSFT", "NVDA"]
+    request_stats = RequestStats()
+    metadata_logger = DatabaseLogger(engine=db_client.engine)
+    with StubAlpacaServer(generate_bars(symbols, start_date="2025-09-01", days=20), failures=[400]) as server:
+        context = PipelineContext(
+            config=config,
+            postgres_sql_client=db_client,
+            metadata_logger=metadata_logger,
+            alpaca_api_client=AlpacaApiClient("key", "secret", base_url=server.url, request_stats=request_stats),
+            rate_limiter=TokenBucketRateLimiter(200),
+            request_stats=request_stats,
+        )
+        run = pipeline(context)
+    metadata_logger.close()
+
+    # The first request fails, only the load and the nodes after it run again
+    assert run.succeeded
+    assert run.results["stock_symbols"].status == "reused"
+    assert run.results["stream_extract_transform_load"].status == "success"
+    assert run.results["transform_and_load_analysis_table"].status == "success"
+    assert run.value("refresh_serving_tables") == {"stock_bars_analysis_dag_test_latest_metrics": len(symbols)}
+    assert db_client.engine.execute("select count(*) from stock_bars_dag_test").scalar() == len(symbols) * 20
+    checkpoints = get_symbol_checkpoints(db_client.engine, "symbol_checkpoints_dag_test", "stock_bars_dag_test", "1Day")
+    # The other symbols of the csv were extracted without bars, their covered range is saved too
+    assert set(checkpoints) == set(extract_stock_symbol(STOCK_SYMBOL_CSV_PATH)["Symbol"])
+    assert [checkpoints[symbol][1][:10] for symbol in symbols] == ["2025-09-20"] * len(symbols)
+
+def test_incremental_analysis_refresh_starts_at_the_earliest_loaded_bar(db_client, config, monkeypatch):
+    config["config"]["analysis_refresh"] = "incremental"
+    db_client.engine.execute("create table if not exists stock_bars_analysis_dag_test (stock varchar, date date)")
+    refreshes = []
+    monkeypatch.setattr(stock_bars, "transform_and_load_analysis_table", lambda environment, engine, **params: refreshes.append(params))
+    metadata_logger = DatabaseLogger(engine=db_client.engine)
+    context = PipelineContext(
+        config=config,
+        postgres_sql_client=db_client,
+        metadata_logger=metadata_logger,
+        alpaca_api_client=None,
+        rate_limiter=None,
+        request_stats=RequestStats(),
+    )
+    # Checkpoints going back to the backfill start do not widen the refresh
+    symbol_checkpoints = {"AAPL": ("2025-09-01T00:00:00+00:00", "2025-10-09T04:00:00+00:00")}
+    watermarks = {
+        "AAPL": (pd.Timestamp("2025-10-09T04:00:00Z"), pd.Timestamp("2025-10-10T04:00:00Z")),
+        "MSFT": (pd.Timestamp("2025-10-10T04:00:00Z"), pd.Timestamp("2025-10-10T04:00:00Z")),
+    }
+
+    refresh_analysis_table(context, symbol_checkpoints, watermarks)
+    refresh_analysis_table(context, symbol_checkpoints, {})
+    metadata_logger.close()
+
+    assert [refresh["since_date"] for refresh in refreshes] == ["2025-10-09"]
+
+def test_pipeline_configs_override_the_defaults(config):
+    config["pipelines"] = [
+        {"name": "tech"},
+        {"name": "etfs", "config": {"source_table_name": "etf_bars", "analysis_table_name": "etf_bars_analysis"}},
+    ]
+    tech, etfs = get_pipeline_configs(config)
+
+    assert tech == {"name": "tech", "config": config["config"]}
+    assert etfs["config"]["source_table_name"] == "etf_bars"
+    assert etfs["config"]["load_method"] == "upsert"
+
+    config["pipelines"][1]["config"].pop("analysis_table_name")
+    config["config"]["analysis_table_name"] = "stock_bars_analysis"
+    with pytest.raises(Exception, match="analysis_table_name"):
+        get_pipeline_configs(config)
+
+def test_pipelines_run_side_by_side_on_shared_clients(db_client, config):
+    config["config"]["pipeline_mode"] = "batch"
+    config["config"]["quarantine_table_name"] = "quarantine_bars_dag_test"
+    config["pipelines"] = [
+        {"name": "tech"},
+        {"name": "etfs", "config": {
+            "source_table_name": "etf_bars_dag_test",
+            "analysis_table_name": "etf_bars_analysis_dag_test",
+        }},
+    ]
+    for table_name in ["stock_bars_dag_test", "etf_bars_dag_test", "check_points_dag_test", "symbol_checkpoints_dag_test",
+                       "stock_bars_analysis_dag_test", "etf_bars_analysis_dag_test", "quarantine_bars_dag_test"]:
+        db_client.drop_table(table_name)
+
+    symbols = extract_stock_symbol(STOCK_SYMBOL_CSV_PATH)["Symbol"].tolist()
+    request_stats = RequestStats()
+    rate_limiter = TokenBucketRateLimiter(200)
+    metadata_logger = DatabaseLogger(engine=db_client.engine)
+    with StubAlpacaServer(generate_bars(symbols, start_date="2025-09-01", days=20)) as server:
+        with SharedAsyncAlpacaApiClient("key", "secret", base_url=server.url, rate_limiter=rate_limiter, request_stats=request_stats) as shared_client:
+            contexts = [
+                PipelineContext(
+                    config=pipeline_config,
+                    postgres_sql_client=db_client,
+                    metadata_logger=metadata_logger,
+                    alpaca_api_client=None,
+                    rate_limiter=rate_limiter,
+                    request_stats=RequestStats(parent=request_stats),
+                    shared_alpaca_api_client=shared_client,
+                    name=pipeline_config["name"],
+                )
+                for pipeline_config in get_pipeline_configs(config)
+            ]
+            runs = run_pipelines(contexts)
+    metadata_logger.close()
+
+    assert set(runs) == {"tech", "etfs"}
+    assert all(run.succeeded for run in runs.values())
+    assert runs["tech"].results["validate"].status == "success"
+    assert request_stats.request_count == server.request_count == 2
+    # Each pipeline counts its own request, the shared stats count both
+    assert [context.request_stats.request_count for context in contexts] == [1, 1]
+    for table_name in ["stock_bars_dag_test", "etf_bars_dag_test"]:
+        assert db_client.engine.execute(f"select count(*) from {table_name}").scalar() == len(symbols) * 20
@@ -0,0 +1,82 @@
+import pytest
+from etl_project.serving.query_api import _MISSING, LruCache, ServingQueryClient
+from etl_project.serving.serving_tables import serving_table_name
+
+ANALYSIS_TABLE_NAME = "stock_bars_query_api_test_analysis"
+
+# ---------- Fixtures ----------
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def serving_tables(db_client):
+    latest_metrics = serving_table_name(ANALYSIS_TABLE_NAME, "latest_metrics")
+    weekly_ohlcv = serving_table_name(ANALYSIS_TABLE_NAME, "weekly_ohlcv")
+    db_client.engine.execute(f"""
+        drop table if exists {latest_metrics};
+        create table {latest_metrics} as
+        select * from (values ('AAPL', 101.0), ('MSFT', 202.0)) rows (stock, close);
+        drop table if exists {weekly_ohlcv};
+        create table {weekly_ohlcv} as
+        select * from (values
+            ('AAPL', '2025-09-01'::date, 100.0),
+            ('AAPL', '2025-09-08'::date, 101.0),
+            ('AAPL', '2025-09-15'::date, 102.0),
+            ('MSFT', '2025-09-08'::date, 200.0)
+        ) rows (stock, period_start, close);
+    """)
+    return latest_metrics
+
+# ---------- Tests ----------
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LruCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is _MISSING
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert (cache.hits, cache.misses) == (3, 1)
+
+def test_lru_cache_expires_entries():
+    clock = FakeClock()
+    cache = LruCache(ttl_seconds=60, clock=clock)
+    cache.put("a", 1)
+
+    clock.now = 59
+    assert cache.get("a") == 1
+    clock.now = 60
+    assert cache.get("a") is _MISSING
+    assert len(cache) == 0
+
+def test_queries(db_client, serving_tables):
+    client = ServingQueryClient(db_client.engine, analysis_table_name=ANALYSIS_TABLE_NAME)
+
+    assert [row["stock"] for row in client.latest_metrics()] == ["AAPL", "MSFT"]
+    assert client.latest_metrics("MSFT") == [{"stock": "MSFT", "close": 202.0}]
+    assert [row["close"] for row in client.weekly_ohlcv("AAPL", start="2025-09-08")] == [101.0, 102.0]
+    assert [row["close"] for row in client.weekly_ohlcv("AAPL", end="2025-09-08")] == [100.0, 101.0]
+
+def test_queries_are_cached(db_client, serving_tables):
+    clock = FakeClock()
+    client = ServingQueryClient(db_client.engine, analysis_table_name=ANALYSIS_TABLE_NAME, ttl_seconds=60, clock=clock)
+    assert client.latest_metrics("AAPL")[0]["close"] == 101.0
+
+    db_client.engine.execute(f"update {serving_tables} set close = 105.0 where stock = 'AAPL'")
+
+    # Served from the cache until the entry expires or the cache is cleared
+    assert client.latest_metrics("AAPL")[0]["close"] == 101.0
+    assert (client.cache.hits, client.cache.misses) == (1, 1)
+    clock.now = 60
+    assert client.latest_metrics("AAPL")[0]["close"] == 105.0
+
+    db_client.engine.execute(f"update {serving_tables} set close = 106.0 where stock = 'AAPL'")
+    client.clear_cache()
+    assert client.latest_metrics("AAPL")[0]["close"] == 106.0
@@ -0,0 +1,93 @@
+import pandas as pd
+import pytest
+from jinja2 import Environment, FileSystemLoader
+from sqlalchemy import MetaData
+from etl_project.assets.assets import define_stock_bars_table, load, transform_and_load_analysis_table
+from etl_project.benchmarks.synthetic import generate_stock_bars_frame
+from etl_project.serving.serving_tables import SERVING_TABLES, refresh_serving_tables, serving_table_name, validate_serving_tables
+
+SOURCE_TABLE_NAME = "stock_bars_serving_test"
+ANALYSIS_TABLE_NAME = "stock_bars_serving_test_analysis"
+
+# ---------- Fixtures ----------
+
+@pytest.fixture(scope="module")
+def df_stock(db_client):
+    df_stock = generate_stock_bars_frame(symbol_count=3, bars_per_symbol=60, seed=3)
+    metadata = MetaData()
+    table = define_stock_bars_table(metadata, SOURCE_TABLE_NAME)
+    load(df_stock, db_client, table, metadata, load_method="bulk_overwrite")
+    transform_and_load_analysis_table(
+        Environment(loader=FileSystemLoader("etl_project/assets/sql/transform")), db_client.engine,
+        source_table_name=SOURCE_TABLE_NAME, analysis_table_name=ANALYSIS_TABLE_NAME,
+    )
+    return df_stock
+
+def read_table(db_client, table_name: str) -> pd.DataFrame:
+    return pd.read_sql(f"select * from {table_name}", db_client.engine)
+
+# ---------- Tests ----------
+
+def test_refresh_serving_tables(db_client, df_stock):
+    rows_served = refresh_serving_tables(db_client.engine, SOURCE_TABLE_NAME, ANALYSIS_TABLE_NAME)
+
+    assert list(rows_served) == [serving_table_name(ANALYSIS_TABLE_NAME, rollup) for rollup in SERVING_TABLES]
+    assert rows_served[serving_table_name(ANALYSIS_TABLE_NAME, "latest_metrics")] == 3
+
+    # Weekly bars of one stock against pandas, weeks start on Monday like date_trunc('week')
+    bars = df_stock[df_stock["stock"] == "SYM00000"].set_index("timestamp")
+    expected = bars.resample("W-MON", label="left", closed="left").agg(
+        {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+    ).dropna()
+    weekly = read_table(db_client, serving_table_name(ANALYSIS_TABLE_NAME, "weekly_ohlcv"))
+    weekly = weekly[weekly["stock"] == "SYM00000"].sort_values("period_start")
+
+    assert weekly["period_start"].tolist() == [timestamp.date() for timestamp in expected.index]
+    for column in ["open", "high", "low", "close", "volume"]:
+        assert weekly[column].tolist() == pytest.approx(expected[column].tolist()), column
+
+def test_volatility_ranking(db_client, df_stock):
+    refresh_serving_tables(db_client.engine, SOURCE_TABLE_NAME, ANALYSIS_TABLE_NAME, rollups=["volatility_ranking"])
+
+    analysis = read_table(db_client, ANALYSIS_TABLE_NAME).sort_values("date")
+    expected = analysis.groupby("stock")["daily_return_pct"].apply(lambda returns: returns.astype(float).tail(20).std())
+    ranking = read_table(db_client, serving_table_name(ANALYSIS_TABLE_NAME, "volatility_ranking")).sort_values("volatility_rank")
+
+    assert ranking["stock"].tolist() == expected.sort_values(ascending=False).index.tolist()
+    assert ranking["volatility_rank"].tolist() == [1, 2, 3]
+    assert ranking["volatility_pct"].astype(float).tolist() == pytest.approx(expected.sort_values(ascending=False).round(3).tolist())
+
+def test_swap_does_not_wait_on_readers(db_client, df_stock):
+    refresh_serving_tables(db_client.engine, SOURCE_TABLE_NAME, ANALYSIS_TABLE_NAME, rollups=["latest_metrics"])
+    table_name = serving_table_name(ANALYSIS_TABLE_NAME, "latest_metrics")
+
+    # A reader in the middle of a transaction holds the table, the swap gives up after its lock timeout
+    with db_client.engine.connect() as reader:
+        transaction = reader.begin()
+        assert len(reader.execute(f"select * from {table_name}").all()) == 3
+        with pytest.raises(Exception, match="lock timeout"):
+            refresh_serving_tables(
+                db_client.engine, SOURCE_TABLE_NAME, ANALYSIS_TABLE_NAME, rollups=["latest_metrics"], lock_timeout_ms=100
+            )
+        transaction.rollback()
+
+    # The current table was left as it was
+    assert len(read_table(db_client, table_name)) == 3
+    assert refresh_serving_tables(db_client.engine, SOURCE_TABLE_NAME, ANALYSIS_TABLE_NAME, rollups=["latest_metrics"]) == {table_name: 3}
+
+def test_full_analysis_refresh_keeps_the_table(db_client, df_stock):
+    def table_oid() -> int:
+        return db_client.engine.execute(f"select '{ANALYSIS_TABLE_NAME}'::regclass::oid").scalar()
+
+    oid = table_oid()
+    transform_and_load_analysis_table(
+        Environment(loader=FileSystemLoader("etl_project/assets/sql/transform")), db_client.engine,
+        source_table_name=SOURCE_TABLE_NAME, analysis_table_name=ANALYSIS_TABLE_NAME,
+    )
+
+    assert table_oid() == oid
+    assert len(read_table(db_client, ANALYSIS_TABLE_NAME)) == len(df_stock)
+
+def test_unknown_serving_table():
+    with pytest.raises(Exception, match="Unknown serving tables"):
+        validate_serving_tables(["latest_metrics", "hourly_ohlcv"])
@@ -0,0 +1,115 @@
+import threading
+import time
+import pytest
+from etl_project.metadata.instrumentation import PipelineInstrumentation
+from etl_project.utilities.dag import Dag, Node
+
+# ---------- Tests ----------
+
+def test_independent_nodes_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def wait_for_sibling(context):
+        # Both nodes have to be running at the same time to pass the barrier
+        barrier.wait()
+        return 1
+
+    dag = Dag([
+        Node("left", wait_for_sibling),
+        Node("right", wait_for_sibling),
+        Node("total", lambda context, left, right: left + right, dependencies=["left", "right"]),
+    ])
+    run = dag.run(max_workers=2)
+
+    assert run.succeeded
+    assert run.value("total") == 2
+
+def test_dependency_values_are_passed_by_name():
+    dag = Dag([
+        Node("symbols", lambda context: context["symbols"]),
+        Node("count", lambda context, names: len(names), dependencies={"names": "symbols"}),
+    ])
+
+    assert dag.run({"symbols": ["AAPL", "MSFT"]}).value("count") == 2
+
+def test_failed_node_skips_its_dependents_only():
+    calls = []
+
+    def record(name, fail=False):
+        def node(context, **_):
+            calls.append(name)
+            if fail:
+                raise ValueError(f"{name} failed")
+            return name
+        return node
+
+    dag = Dag([
+        Node("extract", record("extract")),
+        Node("transform", record("transform", fail=True), dependencies=["extract"]),
+        Node("load", record("load"), dependencies=["transform"]),
+        Node("symbols", record("symbols")),
+    ])
+    run = dag.run()
+
+    assert run.results["transform"].status == "failed"
+    assert isinstance(run.results["transform"].error, ValueError)
+    assert run.results["load"].status == "skipped"
+    assert run.results["symbols"].status == "success"
+    assert run.failed == ["transform", "load"]
+    assert "load" not in calls
+
+def test_rerun_only_runs_failed_nodes():
+    calls = []
+    attempts = {"transform": 0}
+
+    def extract(context):
+        calls.append("extract")
+        return [1, 2, 3]
+
+    def transform(context, extract):
+        calls.append("transform")
+        attempts["transform"] += 1
+        if attempts["transform"] == 1:
+            raise ConnectionError("database went away")
+        return [value * 2 for value in extract]
+
+    def load(context, transform):
+        calls.append("load")
+        return sum(transform)
+
+    dag = Dag([
+        Node("extract", extract),
+        Node("transform", transform, dependencies=["extract"]),
+        Node("load", load, dependencies=["transform"]),
+    ])
+    first_run = dag.run()
+    second_run = dag.run(previous_run=first_run)
+
+    assert first_run.failed == ["transform", "load"]
+    assert second_run.succeeded
+    assert second_run.results["extract"].status == "reused"
+    assert second_run.value("load") == 12
+    assert calls == ["extract", "transform", "transform", "load"]
+
+def test_node_timings_are_recorded_as_stages():
+    instrumentation = PipelineInstrumentation("dag_test")
+    dag = Dag([
+        Node("sleep", lambda context: time.sleep(0.05) or [0] * 10, rows=len),
+        Node("fail", lambda context: 1 / 0),
+    ])
+    run = dag.run(instrumentation=instrumentation)
+
+    assert run.results["sleep"].wall_seconds >= 0.05
+    stages = {stage.name: stage for stage in instrumentation.run.stages}
+    assert stages["sleep"].rows == 10
+    assert stages["sleep"].wall_seconds >= 0.05
+    assert stages["fail"].status == "failed"
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(Exception, match="unknown nodes"):
+        Dag([Node("load", lambda context, transform: None, dependencies=["transform"])])
+    with pytest.raises(Exception, match="cycle"):
+        Dag([
+            Node("a", lambda context, b: None, dependencies=["b"]),
+            Node("b", lambda context, a: None, dependencies=["a"]),
+        ])
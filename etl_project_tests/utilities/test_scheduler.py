@@ -0,0 +1,64 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from etl_project.utilities.scheduler import DailySchedule, ScheduledRunner
+
+NEW_YORK = ZoneInfo("America/New_York")
+
+# ---------- Tests ----------
+
+def test_next_run_after_market_close_on_weekdays():
+    schedule = DailySchedule(["16:15"], timezone="America/New_York")
+
+    # Friday after the run, the next one is on Monday
+    friday_evening = datetime(2025, 10, 10, 17, 0, tzinfo=NEW_YORK)
+    assert schedule.next_run(friday_evening) == datetime(2025, 10, 13, 16, 15, tzinfo=NEW_YORK)
+
+    # Given in UTC, before the run of the same day
+    assert schedule.next_run(datetime(2025, 10, 14, 12, 0, tzinfo=timezone.utc)) == datetime(2025, 10, 14, 16, 15, tzinfo=NEW_YORK)
+
+def test_next_run_keeps_wall_clock_time_across_daylight_saving_time():
+    schedule = DailySchedule(["16:15"], weekdays=["mon", "tue", "wed", "thu", "fri", "sat", "sun"])
+
+    before_change = schedule.next_run(datetime(2025, 10, 31, 17, 0, tzinfo=NEW_YORK))
+    after_change = schedule.next_run(before_change)
+
+    assert before_change.hour == after_change.hour == 16
+    assert after_change.astimezone(timezone.utc) - before_change.astimezone(timezone.utc) == timedelta(hours=25)
+
+def test_runner_skips_overlapping_runs():
+    release = threading.Event()
+    started = []
+
+    def job():
+        started.append(time.perf_counter())
+        release.wait(5)
+
+    runner = ScheduledRunner(job, DailySchedule(["16:15"]))
+    assert runner.trigger()
+    assert not runner.trigger()
+    release.set()
+    runner.join()
+    assert runner.trigger()
+    runner.join()
+
+    assert (runner.runs, runner.skipped, len(started)) == (2, 1, 2)
+
+def test_runner_survives_failed_runs_and_stops():
+    class EveryTenthOfASecond:
+        def next_run(self, after):
+            return after + timedelta(seconds=0.1)
+
+    def job():
+        raise Exception("failed run")
+
+    runner = ScheduledRunner(job, EveryTenthOfASecond())
+    thread = threading.Thread(target=runner.run_forever)
+    thread.start()
+    time.sleep(0.45)
+    runner.stop()
+    thread.join(2)
+
+    assert not thread.is_alive()
+    assert runner.runs >= 3
@@ -0,0 +1,107 @@
+import pandas as pd
+from datetime import date
+import pytest
+from etl_project.utilities.utilities import (
+    ExtractRange,
+    extract_coverage,
+    get_symbol_checkpoints,
+    plan_extract_ranges,
+    save_symbol_checkpoints,
+)
+
+# ---------- Tests ----------
+
+def test_plan_groups_symbols_by_missing_range():
+    checkpoints = {
+        "AAPL": ("2025-09-01T04:00:00+00:00", "2025-10-10T04:00:00+00:00"),
+        "MSFT": ("2025-09-01T04:00:00+00:00", "2025-10-10T04:00:00+00:00"),
+        # Late symbol, only it is extracted from its own latest date
+        "NVDA": ("2025-09-01T04:00:00+00:00", "2025-10-03T04:00:00+00:00"),
+        # Loaded after the backfill start, its older history is missing
+        "AMZN": ("2025-09-15T04:00:00+00:00", "2025-10-10T04:00:00+00:00"),
+    }
+
+    plan = plan_extract_ranges(
+        symbols=["AAPL", "MSFT", "NVDA", "AMZN", "TSLA"],
+        symbol_checkpoints=checkpoints,
+        backfill_start_date="2025-09-01",
+    )
+
+    assert plan == [
+        ExtractRange(symbols=["AMZN"], start_date="2025-09-01", end_date="2025-09-15"),
+        ExtractRange(symbols=["TSLA"], start_date="2025-09-01", end_date=None),
+        ExtractRange(symbols=["NVDA"], start_date="2025-10-03", end_date=None),
+        ExtractRange(symbols=["AAPL", "MSFT", "AMZN"], start_date="2025-10-10", end_date=None),
+    ]
+
+def test_plan_merges_close_start_dates():
+    checkpoints = {
+        "AAPL": ("2025-09-01T04:00:00+00:00", "2025-10-10T04:00:00+00:00"),
+        "NVDA": ("2025-09-01T04:00:00+00:00", "2025-10-08T04:00:00+00:00"),
+    }
+
+    plan = plan_extract_ranges(["AAPL", "NVDA"], checkpoints, backfill_start_date="2025-09-01", merge_within_days=3)
+
+    assert plan == [ExtractRange(symbols=["NVDA", "AAPL"], start_date="2025-10-08", end_date=None)]
+
+def test_save_symbol_checkpoints_widens_saved_range(db_client):
+    engine = db_client.engine
+    db_client.drop_table("symbol_checkpoints_test")
+
+    save_symbol_checkpoints(engine, "symbol_checkpoints_test", "stock_bars", "1Day", {
+        "AAPL": (pd.Timestamp("2025-09-10T04:00:00Z"), pd.Timestamp("2025-09-20T04:00:00Z")),
+    })
+    save_symbol_checkpoints(engine, "symbol_checkpoints_test", "stock_bars", "1Day", {
+        "AAPL": (pd.Timestamp("2025-09-01T04:00:00Z"), pd.Timestamp("2025-09-15T04:00:00Z")),
+        "MSFT": (pd.Timestamp("2025-09-05T04:00:00Z"), pd.Timestamp("2025-09-06T04:00:00Z")),
+    })
+
+    assert get_symbol_checkpoints(engine, "symbol_checkpoints_test", "stock_bars", "1Day") == {
+        "AAPL": ("2025-09-01T04:00:00+00:00", "2025-09-20T04:00:00+00:00"),
+        "MSFT": ("2025-09-05T04:00:00+00:00", "2025-09-06T04:00:00+00:00"),
+    }
+    assert get_symbol_checkpoints(engine, "symbol_checkpoints_test", "stock_bars", "1Hour") == {}
+    db_client.drop_table("symbol_checkpoints_test")
+
+def test_backfilled_ranges_without_bars_are_not_extracted_again(db_client):
+    engine = db_client.engine
+    db_client.drop_table("symbol_checkpoints_test")
+    symbols = ["AAPL", "MSFT", "NEWCO"]
+
+    # 2025-09-01 is Labor Day, the first bars are on 2025-09-02. NEWCO was listed on 2025-09-15
+    plan = plan_extract_ranges(symbols, {}, backfill_start_date="2025-09-01")
+    save_symbol_checkpoints(engine, "symbol_checkpoints_test", "stock_bars", "1Day", {
+        "AAPL": (pd.Timestamp("2025-09-02T04:00:00Z"), pd.Timestamp("2025-10-10T04:00:00Z")),
+        "MSFT": (pd.Timestamp("2025-09-02T04:00:00Z"), pd.Timestamp("2025-10-10T04:00:00Z")),
+        "NEWCO": (pd.Timestamp("2025-09-15T04:00:00Z"), pd.Timestamp("2025-10-10T04:00:00Z")),
+    }, extract_coverage(plan, today=date(2025, 10, 10)))
+
+    checkpoints = get_symbol_checkpoints(engine, "symbol_checkpoints_test", "stock_bars", "1Day")
+    plan = plan_extract_ranges(symbols, checkpoints, backfill_start_date="2025-09-01")
+
+    assert plan == [ExtractRange(symbols=symbols, start_date="2025-10-10", end_date=None)]
+    db_client.drop_table("symbol_checkpoints_test")
+
+def test_extracted_symbols_without_bars_are_not_extracted_again(db_client):
+    engine = db_client.engine
+    db_client.drop_table("symbol_checkpoints_test")
+    symbols = ["AAPL", "LATERCO"]
+
+    # LATERCO is not listed yet, its extract returns no bars
+    plan = plan_extract_ranges(symbols, {}, backfill_start_date="2025-09-01")
+    save_symbol_checkpoints(engine, "symbol_checkpoints_test", "stock_bars", "1Day", {
+        "AAPL": (pd.Timestamp("2025-09-02T04:00:00Z"), pd.Timestamp("2025-10-10T04:00:00Z")),
+    }, extract_coverage(plan, today=date(2025, 10, 10)))
+
+    checkpoints = get_symbol_checkpoints(engine, "symbol_checkpoints_test", "stock_bars", "1Day")
+    assert checkpoints["LATERCO"] == ("2025-09-01T00:00:00+00:00", "2025-10-10T00:00:00+00:00")
+    plan = plan_extract_ranges(symbols, checkpoints, backfill_start_date="2025-09-01")
+    assert plan == [ExtractRange(symbols=symbols, start_date="2025-10-10", end_date=None)]
+
+    # Once listed, its bars replace the covered range
+    save_symbol_checkpoints(engine, "symbol_checkpoints_test", "stock_bars", "1Day", {
+        "LATERCO": (pd.Timestamp("2025-10-13T04:00:00Z"), pd.Timestamp("2025-10-14T04:00:00Z")),
+    }, extract_coverage(plan, today=date(2025, 10, 14)))
+    checkpoints = get_symbol_checkpoints(engine, "symbol_checkpoints_test", "stock_bars", "1Day")
+    assert checkpoints["LATERCO"] == ("2025-09-01T00:00:00+00:00", "2025-10-14T04:00:00+00:00")
+    db_client.drop_table("symbol_checkpoints_test")